@@ -0,0 +1,191 @@
+"""
+Load test các endpoint chính của API nhân sự trên một server đang chạy.
+
+Mỗi kịch bản gửi nhiều request song song, đo độ trễ từng request và in ra
+p50/p95/p99 và số request/giây theo endpoint. Kết quả có thể lưu ra JSON
+(--output) và so với lần chạy trước (--baseline) để thấy ngay endpoint nào
+chậm đi. Chuẩn bị dữ liệu bằng lệnh seed_hr_data rồi chạy:
+
+    python manage.py seed_hr_data --so_nhan_vien 10000 --so_nam 2 --seed 1
+    python manage.py runserver
+    python benchmarks/api_load_test.py --username admin --password ... --id_tu 1 --id_den 10000
+
+Check-in/check-out dùng các nhân viên trong khoảng --id_tu..--id_den, mỗi người
+một lần mỗi ngày; chạy lại trong cùng ngày thì dùng khoảng ID khác.
+Script chỉ dùng thư viện chuẩn nên chạy được ở bất kỳ máy nào gọi tới server.
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+
+class Client:
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.token = None
+
+    def request(self, method, path, data=None):
+        """Gửi một request, trả về (status, số byte nhận); đọc hết body như client thật"""
+        body = json.dumps(data).encode() if data is not None else None
+        request = urllib.request.Request(self.base_url + path, data=body, method=method)
+        request.add_header('Content-Type', 'application/json')
+        if self.token:
+            request.add_header('Authorization', f'Bearer {self.token}')
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, len(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, len(e.read())
+
+    def login(self, username, password):
+        request = urllib.request.Request(
+            self.base_url + '/api/auth/login/',
+            data=json.dumps({'username': username, 'password': password}).encode(),
+            headers={'Content-Type': 'application/json'},
+            method='POST',
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                self.token = json.loads(response.read())['access']
+        except urllib.error.HTTPError as e:
+            sys.exit(f'Đăng nhập thất bại ({e.code}): {e.read().decode(errors="replace")}')
+
+
+def build_scenarios(args):
+    """Các kịch bản: tên -> danh sách (method, path, data) sẽ được gửi song song"""
+    ids = list(range(args.id_tu, args.id_den + 1))
+    random.Random(args.seed).shuffle(ids)
+    punch_ids = ids[:args.requests]
+    thang = args.thang or date.today().strftime('%Y-%m')
+    ngay_dau_thang = f'{thang}-01'
+
+    def repeat(*requests):
+        return [requests[i % len(requests)] for i in range(args.requests)]
+
+    return {
+        'check_in': [('POST', '/api/attendance/check_in/', {'id_nhan_vien': i}) for i in punch_ids],
+        'check_out': [('POST', '/api/attendance/check_out/', {'id_nhan_vien': i}) for i in punch_ids],
+        'summary': repeat(
+            ('GET', f'/api/attendance/summary/?thang={thang}', None),
+            ('GET', f'/api/attendance/summary/?thang={thang}&group_by=phong_ban', None),
+            ('GET', f'/api/attendance/summary/?thang={thang}&group_by=tuan', None),
+        ),
+        'payroll_list': repeat(('GET', '/api/payroll/?page_size=100', None)),
+        'payroll_preview': repeat(*(
+            ('GET', f'/api/payroll/preview/?thang={ngay_dau_thang}&id_nhan_vien={i}', None) for i in ids[:50]
+        )),
+        'payroll_calculate': repeat(('POST', '/api/payroll/calculate_payroll/', {'thang': ngay_dau_thang})),
+        'export': [('GET', f'/api/payroll/export_excel/?thang={thang}', None)] * max(1, args.requests // 20),
+    }
+
+
+def run_scenario(client, requests, concurrency):
+    def send(item):
+        method, path, data = item
+        started = time.perf_counter()
+        try:
+            status, size = client.request(method, path, data)
+        except OSError as e:
+            status, size = type(e).__name__, 0
+        return time.perf_counter() - started, status, size
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(send, requests))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, _, _ in samples)
+    percentiles = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+    statuses = {}
+    for _, status, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        'requests': len(samples),
+        'errors': sum(count for status, count in statuses.items() if not status.startswith(('2', '3'))),
+        'statuses': statuses,
+        'rps': len(samples) / elapsed,
+        'p50_ms': percentiles[49] * 1000,
+        'p95_ms': percentiles[94] * 1000,
+        'p99_ms': percentiles[98] * 1000,
+        'max_ms': latencies[-1] * 1000,
+        'bytes': sum(size for _, _, size in samples),
+    }
+
+
+def compare(results, baseline, max_regression):
+    """In chênh lệch p95 so với lần chạy trước, trả về danh sách endpoint chậm đi quá ngưỡng"""
+    regressions = []
+    print(f'\nSo với baseline (ngưỡng p95 +{max_regression:.0%}):')
+    for name, result in results.items():
+        old = baseline.get(name)
+        if not old or not old['p95_ms']:
+            continue
+        change = result['p95_ms'] / old['p95_ms'] - 1
+        flag = ''
+        if change > max_regression:
+            regressions.append(name)
+            flag = '  <-- CHẬM ĐI'
+        print(f'  {name:<18} p95 {old["p95_ms"]:8.1f} -> {result["p95_ms"]:8.1f} ms ({change:+.0%}){flag}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base_url', default='http://127.0.0.1:8000', help='Địa chỉ server')
+    parser.add_argument('--username', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--id_tu', type=int, required=True, help='ID nhân viên nhỏ nhất dùng để chấm công')
+    parser.add_argument('--id_den', type=int, required=True, help='ID nhân viên lớn nhất dùng để chấm công')
+    parser.add_argument('--thang', help='Tháng báo cáo (YYYY-MM), mặc định tháng hiện tại')
+    parser.add_argument('--requests', type=int, default=200, help='Số request mỗi kịch bản')
+    parser.add_argument('--concurrency', type=int, default=10, help='Số request gửi đồng thời')
+    parser.add_argument('--scenarios', nargs='+', help='Chỉ chạy các kịch bản này (mặc định: tất cả)')
+    parser.add_argument('--timeout', type=float, default=120, help='Timeout mỗi request (giây)')
+    parser.add_argument('--seed', type=int, default=1, help='Seed chọn nhân viên')
+    parser.add_argument('--output', help='Lưu kết quả ra file JSON')
+    parser.add_argument('--baseline', help='File JSON của lần chạy trước để so sánh')
+    parser.add_argument('--max_regression', type=float, default=0.2, help='Mức tăng p95 tối đa so với baseline (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    scenarios = build_scenarios(args)
+    unknown = set(args.scenarios or []) - set(scenarios)
+    if unknown:
+        sys.exit(f'Kịch bản không tồn tại: {", ".join(sorted(unknown))}. Chỉ nhận: {", ".join(scenarios)}')
+
+    client = Client(args.base_url, args.timeout)
+    client.login(args.username, args.password)
+
+    results = {}
+    print(f'{"kịch bản":<18} {"request":>8} {"lỗi":>5} {"req/s":>9} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"max ms":>9}')
+    for name, requests in scenarios.items():
+        if args.scenarios and name not in args.scenarios:
+            continue
+        result = results[name] = run_scenario(client, requests, args.concurrency)
+        print(
+            f'{name:<18} {result["requests"]:>8} {result["errors"]:>5} {result["rps"]:>9.1f} {result["p50_ms"]:>9.1f}'
+            f' {result["p95_ms"]:>9.1f} {result["p99_ms"]:>9.1f} {result["max_ms"]:>9.1f}'
+        )
+        if result['errors']:
+            print(f'    mã trả về: {result["statuses"]}')
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        if regressions:
+            sys.exit(f'Các endpoint chậm đi: {", ".join(regressions)}')
+
+
+if __name__ == '__main__':
+    main()
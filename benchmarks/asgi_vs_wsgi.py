@@ -0,0 +1,201 @@
+"""
+So sánh thông lượng của API nhân sự chạy WSGI (view DRF) và ASGI (view async
+trong main.async_views) khi có nhiều kết nối đồng thời (mặc định 1000).
+
+Script tự chạy hai server uvicorn trên cùng database: một server
+``--interface wsgi`` phục vụ final_project.wsgi (như Gunicorn sync worker, mỗi
+request giữ một thread) và một server ASGI phục vụ final_project.asgi. Mỗi
+kịch bản được gửi tới endpoint DRF trên server WSGI và tới endpoint
+/api/async/ tương ứng trên server ASGI, rồi in số request/giây, p50/p95/p99
+và số lỗi. Muốn đo server khác (VD: Gunicorn nhiều worker) thì truyền
+--wsgi_url/--asgi_url để dùng server đang chạy.
+
+    python manage.py seed_hr_data --so_nhan_vien 10000 --seed 1
+    python benchmarks/asgi_vs_wsgi.py --username admin --password ... --id_tu 1 --id_den 10000
+
+Kịch bản check_in/check_out chỉ chạy khi có --id_tu/--id_den; nửa đầu khoảng
+ID dùng cho WSGI, nửa sau cho ASGI (mỗi nhân viên chấm công một lần mỗi ngày).
+1000 kết nối cần giới hạn file mở đủ lớn (``ulimit -n 4096``).
+Cần httpx và uvicorn (có trong requirements.txt).
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Tên -> (method, đường dẫn DRF trên WSGI, đường dẫn async trên ASGI)
+SCENARIOS = {
+    'regions': ('GET', '/api/regions/', '/api/async/regions/'),
+    'departments': ('GET', '/api/departments/', '/api/async/departments/'),
+    'summary': ('GET', '/api/attendance/summary/?thang={thang}', '/api/async/attendance/summary/?thang={thang}'),
+    'by_department': (
+        'GET', '/api/payroll/by_department/?id_phong_ban={id_phong_ban}&thang={thang}',
+        '/api/async/payroll/by_department/?id_phong_ban={id_phong_ban}&thang={thang}',
+    ),
+    'check_in': ('POST', '/api/attendance/check_in/', '/api/async/attendance/check_in/'),
+    'check_out': ('POST', '/api/attendance/check_out/', '/api/async/attendance/check_out/'),
+}
+PUNCH_SCENARIOS = ('check_in', 'check_out')
+
+
+def start_server(app, interface, port, workers):
+    command = [
+        sys.executable, '-m', 'uvicorn', app, '--interface', interface, '--port', str(port),
+        '--workers', str(workers), '--log-level', 'warning', '--no-access-log', '--backlog', '4096',
+    ]
+    pythonpath = os.pathsep.join(filter(None, [str(ROOT), os.environ.get('PYTHONPATH')]))
+    return subprocess.Popen(command, cwd=ROOT, env={**os.environ, 'PYTHONPATH': pythonpath})
+
+
+async def wait_ready(client, base_url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            await client.get(base_url + '/api/')
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.2)
+    sys.exit(f'Server {base_url} không khởi động được sau {timeout} giây')
+
+
+async def login(client, base_url, username, password):
+    response = await client.post(base_url + '/api/auth/login/', json={'username': username, 'password': password})
+    if response.status_code != 200:
+        sys.exit(f'Đăng nhập {base_url} thất bại ({response.status_code}): {response.text}')
+    return response.json()['access']
+
+
+async def run_scenario(client, base_url, token, requests, concurrency):
+    """Gửi ``requests`` (method, path, data) qua ``concurrency`` kết nối mở cùng lúc"""
+    queue = asyncio.Queue()
+    for item in requests:
+        queue.put_nowait(item)
+    headers = {'Authorization': f'Bearer {token}'}
+    samples = []
+
+    async def worker():
+        while not queue.empty():
+            method, path, data = queue.get_nowait()
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, base_url + path, json=data, headers=headers)
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            samples.append((time.perf_counter() - started, status))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, len(requests)))))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, _ in samples)
+    percentiles = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+    statuses = {}
+    for _, status in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        'requests': len(samples),
+        'errors': sum(count for status, count in statuses.items() if not status.startswith(('2', '3'))),
+        'statuses': statuses,
+        'rps': len(samples) / elapsed,
+        'p50_ms': percentiles[49] * 1000,
+        'p95_ms': percentiles[94] * 1000,
+        'p99_ms': percentiles[98] * 1000,
+    }
+
+
+def build_requests(args, name, path, punch_ids):
+    method = SCENARIOS[name][0]
+    if name in PUNCH_SCENARIOS:
+        return [(method, path, {'id_nhan_vien': i}) for i in punch_ids]
+    path = path.format(thang=args.thang, id_phong_ban=args.id_phong_ban)
+    return [(method, path, None)] * args.requests
+
+
+async def benchmark(args, names):
+    ids = list(range(args.id_tu, args.id_den + 1)) if args.id_tu and args.id_den else []
+    half = len(ids) // 2
+    targets = {
+        'wsgi': (args.wsgi_url, 1, ids[:half][:args.requests]),
+        'asgi': (args.asgi_url, 2, ids[half:][:args.requests]),
+    }
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    results = {}
+    async with httpx.AsyncClient(limits=limits, timeout=args.timeout) as client:
+        for server, (base_url, path_index, punch_ids) in targets.items():
+            await wait_ready(client, base_url)
+            token = await login(client, base_url, args.username, args.password)
+            for name in names:
+                requests = build_requests(args, name, SCENARIOS[name][path_index], punch_ids)
+                results.setdefault(name, {})[server] = await run_scenario(client, base_url, token, requests, args.concurrency)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--username', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--wsgi_url', help='Dùng server WSGI đang chạy thay vì tự chạy uvicorn')
+    parser.add_argument('--asgi_url', help='Dùng server ASGI đang chạy thay vì tự chạy uvicorn')
+    parser.add_argument('--port', type=int, default=8100, help='Cổng của server tự chạy (WSGI), ASGI dùng cổng kế tiếp')
+    parser.add_argument('--workers', type=int, default=1, help='Số worker uvicorn mỗi server')
+    parser.add_argument('--concurrency', type=int, default=1000, help='Số kết nối đồng thời')
+    parser.add_argument('--requests', type=int, default=5000, help='Số request mỗi kịch bản')
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), help='Chỉ chạy các kịch bản này')
+    parser.add_argument('--thang', default=date.today().strftime('%Y-%m'), help='Tháng báo cáo (YYYY-MM)')
+    parser.add_argument('--id_phong_ban', type=int, default=1, help='Phòng ban của kịch bản by_department')
+    parser.add_argument('--id_tu', type=int, help='ID nhân viên nhỏ nhất dùng để chấm công')
+    parser.add_argument('--id_den', type=int, help='ID nhân viên lớn nhất dùng để chấm công')
+    parser.add_argument('--timeout', type=float, default=120, help='Timeout mỗi request (giây)')
+    parser.add_argument('--output', help='Lưu kết quả ra file JSON')
+    args = parser.parse_args()
+
+    names = args.scenarios or list(SCENARIOS)
+    if not (args.id_tu and args.id_den):
+        names = [name for name in names if name not in PUNCH_SCENARIOS]
+
+    servers = []
+    if not args.wsgi_url:
+        args.wsgi_url = f'http://127.0.0.1:{args.port}'
+        servers.append(start_server('final_project.wsgi:application', 'wsgi', args.port, args.workers))
+    if not args.asgi_url:
+        args.asgi_url = f'http://127.0.0.1:{args.port + 1}'
+        servers.append(start_server('final_project.asgi:application', 'asgi3', args.port + 1, args.workers))
+    try:
+        results = asyncio.run(benchmark(args, names))
+    finally:
+        for server in servers:
+            server.terminate()
+            server.wait()
+
+    print(f'{args.concurrency} kết nối đồng thời, {args.workers} worker mỗi server')
+    print(f'{"kịch bản":<14} {"server":<6} {"request":>8} {"lỗi":>6} {"req/s":>9} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9}')
+    for name, by_server in results.items():
+        for server, result in by_server.items():
+            print(
+                f'{name:<14} {server:<6} {result["requests"]:>8} {result["errors"]:>6} {result["rps"]:>9.1f}'
+                f' {result["p50_ms"]:>9.1f} {result["p95_ms"]:>9.1f} {result["p99_ms"]:>9.1f}'
+            )
+            if result['errors']:
+                print(f'    mã trả về: {result["statuses"]}')
+        wsgi, asgi = by_server['wsgi'], by_server['asgi']
+        if wsgi['rps']:
+            print(f'{"":<14} ASGI/WSGI thông lượng x{asgi["rps"] / wsgi["rps"]:.2f}')
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+So sánh EXPLAIN ANALYZE của các truy vấn chấm công/bảng lương trước và sau
+khi có các index ở migration 0005_hot_query_indexes.
+
+Script sinh dữ liệu giả (mặc định 10 triệu dòng attendance) trong MỘT
+transaction trên Postgres, chạy EXPLAIN khi có index, xóa index (vẫn trong
+transaction) rồi chạy lại, cuối cùng ROLLBACK nên database không bị thay đổi.
+Nên chạy trên database dev vì DROP INDEX khóa bảng tới khi rollback.
+
+    python benchmarks/explain_hot_queries.py --rows 10000000 --employees 20000
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'final_project.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection, transaction  # noqa: E402
+from django.db.models import Count, Sum  # noqa: E402
+from main.models import Attendance, PayrollRecord  # noqa: E402
+
+
+class Rollback(Exception):
+    pass
+
+
+def seed(cursor, rows, employees, start):
+    days = max(rows // employees, 1)
+    cursor.execute("INSERT INTO cong_viec (ten_cong_viec) VALUES ('Benchmark') RETURNING id_cong_viec")
+    id_cong_viec = cursor.fetchone()[0]
+    cursor.execute(
+        "INSERT INTO phong_ban (ten_phong_ban) SELECT 'Benchmark ' || g FROM generate_series(1, 50) g"
+    )
+    cursor.execute(
+        """
+        INSERT INTO nhan_vien (ho, ten, ngay_thue, id_cong_viec, luong, id_phong_ban)
+        SELECT 'Benchmark', g::text, %s, %s, 22000000,
+               (SELECT array_agg(id_phong_ban) FROM phong_ban WHERE ten_phong_ban LIKE 'Benchmark %%')[1 + g %% 50]
+        FROM generate_series(1, %s) g
+        """,
+        [start, id_cong_viec, employees]
+    )
+    cursor.execute(
+        """
+        INSERT INTO attendance (id_nhan_vien, ngay_lam, check_in, check_out, gio_lam, ngay_cong)
+        SELECT nv.id_nhan_vien, d::date, d + interval '8 hours', d + interval '16 hours', 8.00, 1.00
+        FROM nhan_vien nv
+        CROSS JOIN generate_series(%s::date, %s::date, interval '1 day') d
+        WHERE nv.ho = 'Benchmark'
+        """,
+        [start, start + timedelta(days=days - 1)]
+    )
+    cursor.execute(
+        """
+        INSERT INTO payrollrecord (id_nhan_vien, thang, tong_ngay_lam, luong_thuc_nhan, ngay_tinh)
+        SELECT a.id_nhan_vien, date_trunc('month', a.ngay_lam)::date, SUM(a.ngay_cong), 0, now()
+        FROM attendance a JOIN nhan_vien nv ON nv.id_nhan_vien = a.id_nhan_vien
+        WHERE nv.ho = 'Benchmark'
+        GROUP BY 1, 2
+        """
+    )
+    cursor.execute("ANALYZE attendance")
+    cursor.execute("ANALYZE payrollrecord")
+    cursor.execute("ANALYZE nhan_vien")
+
+
+def hot_queries(month, id_phong_ban):
+    next_month = (month + timedelta(days=32)).replace(day=1)
+    return {
+        'Tổng hợp tháng (kiểu cũ __year/__month)': Attendance.objects.filter(
+            ngay_lam__year=month.year, ngay_lam__month=month.month
+        ).order_by().values('id_nhan_vien').annotate(Sum('ngay_cong'), Sum('gio_lam'), Count('id')),
+        'Tổng hợp tháng (khoảng nửa mở)': Attendance.objects.filter(
+            ngay_lam__gte=month, ngay_lam__lt=next_month
+        ).order_by().values('id_nhan_vien').annotate(Sum('ngay_cong'), Sum('gio_lam'), Count('id')),
+        'Bảng lương cả tháng': PayrollRecord.objects.filter(
+            thang__gte=month, thang__lt=next_month
+        ).values('id_nhan_vien', 'tong_ngay_lam', 'luong_thuc_nhan'),
+        'Bảng lương theo phòng ban': PayrollRecord.objects.filter(
+            id_nhan_vien__id_phong_ban_id=id_phong_ban, thang__gte=month, thang__lt=next_month
+        ).select_related('id_nhan_vien'),
+    }
+
+
+def explain(cursor, queries):
+    for title, queryset in queries.items():
+        sql, params = queryset.query.sql_with_params()
+        cursor.execute('EXPLAIN (ANALYZE, BUFFERS) ' + sql, params)
+        print(f'--- {title}')
+        for (line,) in cursor.fetchall():
+            print(line)
+        print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10_000_000, help='Số dòng attendance cần sinh')
+    parser.add_argument('--employees', type=int, default=20_000, help='Số nhân viên cần sinh')
+    args = parser.parse_args()
+
+    if connection.vendor != 'postgresql':
+        sys.exit('Benchmark này chỉ chạy trên Postgres')
+
+    start = date(2020, 1, 1)
+    month = date(2020, 2, 1)
+    index_names = [index.name for index in Attendance._meta.indexes + PayrollRecord._meta.indexes]
+
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            started = time.monotonic()
+            seed(cursor, args.rows, args.employees, start)
+            print(f'Đã sinh dữ liệu trong {time.monotonic() - started:.1f}s\n')
+
+            cursor.execute("SELECT min(id_phong_ban) FROM phong_ban WHERE ten_phong_ban LIKE 'Benchmark %%'")
+            queries = hot_queries(month, cursor.fetchone()[0])
+
+            print('========== SAU: có index ==========\n')
+            explain(cursor, queries)
+
+            for name in index_names:
+                cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+            print('========== TRƯỚC: không có index ==========\n')
+            explain(cursor, queries)
+            raise Rollback
+    except Rollback:
+        print('Đã rollback toàn bộ dữ liệu benchmark')
+
+
+if __name__ == '__main__':
+    main()
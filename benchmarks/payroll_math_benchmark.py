@@ -0,0 +1,111 @@
+"""
+Đo tốc độ và độ chính xác của phần tính toán lương (main.payroll_engine)
+so với cách cũ (qua float) và phép tính Decimal chính xác làm chuẩn.
+
+Script sinh dữ liệu chấm công giả trong bộ nhớ (không cần database), với mỗi
+kích thước lô in thời gian chạy của từng cách và số dòng lệch so với chuẩn:
+
+    python benchmarks/payroll_math_benchmark.py --sizes 1000 100000 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_HALF_EVEN, ROUND_HALF_UP, localcontext
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'final_project.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from main.payroll_engine import calculate_net_salaries, calculate_work_hours  # noqa: E402
+
+_CENT = Decimal('0.01')
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def legacy_work_hours(check_ins, check_outs):
+    """Cách cũ của Attendance.save(): đi qua float"""
+    results = []
+    for check_in, check_out in zip(check_ins, check_outs):
+        gio_lam = Decimal(str((check_out - check_in).total_seconds() / 3600))
+        results.append((round(gio_lam, 2), round(gio_lam / 8, 2)))
+    return results
+
+
+def legacy_net_salaries(rows):
+    """Cách cũ của PayrollRecord.save(): chia lương trước, độ chính xác 28 chữ số"""
+    return [round(ngay * (luong / 22), 2) if ngay > 0 else Decimal('0') for ngay, luong in rows]
+
+
+def exact_work_hours(check_ins, check_outs):
+    """Chuẩn so sánh: Decimal đủ chữ số để không có sai số trung gian"""
+    results = []
+    with localcontext(prec=60):
+        for check_in, check_out in zip(check_ins, check_outs):
+            gio_lam = Decimal((check_out - check_in) // _MICROSECOND) / 3600000000
+            results.append((
+                gio_lam.quantize(_CENT, rounding=ROUND_HALF_UP),
+                (gio_lam / 8).quantize(_CENT, rounding=ROUND_HALF_EVEN),
+            ))
+    return results
+
+
+def exact_net_salaries(rows):
+    with localcontext(prec=60):
+        return [
+            (ngay * luong / 22).quantize(_CENT, rounding=ROUND_HALF_EVEN) if ngay > 0 else Decimal('0')
+            for ngay, luong in rows
+        ]
+
+
+IMPLEMENTATIONS = {
+    'legacy': (legacy_work_hours, legacy_net_salaries),
+    'decimal': (exact_work_hours, exact_net_salaries),
+    'engine': (calculate_work_hours, calculate_net_salaries),
+}
+
+
+def make_data(size, seed):
+    rng = random.Random(seed)
+    start = datetime(2024, 3, 1, 8)
+    check_ins = [start + timedelta(seconds=rng.randrange(3600)) for _ in range(size)]
+    check_outs = [check_in + timedelta(microseconds=rng.randrange(4, 12 * 3600) * 10 ** 6 + rng.choice((0, rng.randrange(10 ** 6))))
+                  for check_in in check_ins]
+    rows = [(Decimal(rng.randrange(1, 2300)).scaleb(-2), Decimal(rng.randrange(5, 100) * 10 ** 6)) for _ in range(size)]
+    return check_ins, check_outs, rows
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000, 1000000], help='Số dòng chấm công mỗi lô')
+    parser.add_argument('--seed', type=int, default=2024, help='Seed sinh dữ liệu giả')
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        check_ins, check_outs, rows = make_data(size, args.seed)
+        expected_hours, expected_salaries = exact_work_hours(check_ins, check_outs), exact_net_salaries(rows)
+        for name, (work_hours, net_salaries) in IMPLEMENTATIONS.items():
+            hours_time, hours = timed(work_hours, check_ins, check_outs)
+            salary_time, salaries = timed(net_salaries, rows)
+            lech_gio = sum(1 for a, b in zip(hours, expected_hours) if a != b)
+            lech_luong = sum(1 for a, b in zip(salaries, expected_salaries) if a != b)
+            print(
+                f'{size:>9,} dòng {name:>7}: giờ làm {hours_time:7.3f}s ({size / hours_time:>12,.0f} dòng/giây, lệch {lech_gio}),'
+                f' lương {salary_time:7.3f}s ({size / salary_time:>12,.0f} dòng/giây, lệch {lech_luong})'
+            )
+
+
+if __name__ == '__main__':
+    main()
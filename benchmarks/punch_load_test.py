@@ -0,0 +1,100 @@
+"""
+Đo số lượt chấm công/giây của đường check-in/check-out nhanh (main.punches)
+so với cách cũ (get + get_or_create + save).
+
+Script tạo nhân viên giả (họ 'LoadTest'), cho nhiều thread cùng check-in rồi
+check-out mỗi nhân viên một lần, in ra số lượt/giây và xóa dữ liệu đã tạo.
+Mỗi thread dùng một kết nối DB riêng, giống các worker của web server.
+Chạy trên Postgres cục bộ:
+
+    python benchmarks/punch_load_test.py --employees 5000 --threads 16
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'final_project.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection, connections  # noqa: E402
+from django.utils import timezone  # noqa: E402
+from main import punches  # noqa: E402
+from main.models import CongViec, NhanVien, Attendance  # noqa: E402
+
+
+def orm_check_in(id_nhan_vien, now):
+    nhan_vien = NhanVien.objects.get(id_nhan_vien=id_nhan_vien)
+    attendance, created = Attendance.objects.get_or_create(
+        id_nhan_vien=nhan_vien, ngay_lam=date.today(), defaults={'check_in': now}
+    )
+    return attendance
+
+
+def orm_check_out(id_nhan_vien, now):
+    nhan_vien = NhanVien.objects.get(id_nhan_vien=id_nhan_vien)
+    attendance = Attendance.objects.get(id_nhan_vien=nhan_vien, ngay_lam=date.today())
+    attendance.check_out = now
+    attendance.save()
+    return attendance
+
+
+PATHS = {
+    'orm': (orm_check_in, orm_check_out),
+    'fast': (punches.check_in, punches.check_out),
+}
+
+
+def run(func, ids, threads):
+    def worker(chunk):
+        for id_nhan_vien in chunk:
+            func(id_nhan_vien, timezone.now())
+        connections.close_all()
+
+    chunks = [ids[i::threads] for i in range(threads)]
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(worker, chunks))
+    return time.monotonic() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--employees', type=int, default=5000, help='Số nhân viên giả (mỗi người check-in và check-out một lần)')
+    parser.add_argument('--threads', type=int, default=16, help='Số thread gửi lượt chấm công đồng thời')
+    parser.add_argument('--path', choices=['fast', 'orm', 'both'], default='both', help='Đường chấm công cần đo')
+    args = parser.parse_args()
+
+    if connection.vendor != 'postgresql':
+        sys.exit('Load test này chỉ chạy trên Postgres')
+
+    cong_viec = CongViec.objects.create(ten_cong_viec='LoadTest')
+    try:
+        for name in (['fast', 'orm'] if args.path == 'both' else [args.path]):
+            # Mỗi đường đo trên một nhóm nhân viên mới để không vướng chấm công hôm nay
+            NhanVien.objects.bulk_create(
+                NhanVien(ho='LoadTest', ten=str(i), ngay_thue=date.today(), id_cong_viec=cong_viec, luong=Decimal('22000000'))
+                for i in range(args.employees)
+            )
+            ids = list(NhanVien.objects.filter(ho='LoadTest', attendance__isnull=True).values_list('id_nhan_vien', flat=True))
+            check_in, check_out = PATHS[name]
+
+            for label, func in (('check-in', check_in), ('check-out', check_out)):
+                elapsed = run(func, ids, args.threads)
+                print(f'{name:>4} {label:<9}: {len(ids)} lượt trong {elapsed:.2f}s ({len(ids) / elapsed:,.0f} lượt/giây)')
+    finally:
+        NhanVien.objects.filter(ho='LoadTest').delete()
+        cong_viec.delete()
+        print('Đã xóa dữ liệu load test')
+
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -44,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'main.profiling.RequestProfilingMiddleware',  # Đầu tiên để đo trọn thời gian request
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -77,17 +79,75 @@ WSGI_APPLICATION = 'final_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
+# Kết nối giữ lại giữa các request (DB_CONN_MAX_AGE giây, kiểm tra còn sống trước
+# khi dùng lại) chỉ dành cho server WSGI: chạy gunicorn/uWSGI với DJANGO_SERVER=wsgi
+# thì mặc định 60, còn lại (runserver, ASGI, lệnh quản lý) mặc định 0 (đóng sau mỗi
+# request); đặt DB_CONN_MAX_AGE thì luôn dùng giá trị đó. Dưới ASGI mỗi request chạy
+# ORM trong thread riêng, kết nối giữ lại không được request sau dùng lại mà tích tụ
+# theo số thread cho tới khi hết max_connections của Postgres; khi đó dùng PgBouncer
+# (DB_PGBOUNCER=1) hoặc pool của Django >= 5.1 (DB_POOL_SIZE).
+DJANGO_SERVER = os.environ.get('DJANGO_SERVER', '')
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 60 if DJANGO_SERVER == 'wsgi' else 0))
+DB_PGBOUNCER = os.environ.get('DB_PGBOUNCER') == '1'  # Kết nối qua PgBouncer chế độ transaction
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 0))  # > 0: pool psycopg 3 trong tiến trình (Django >= 5.1)
+# Giới hạn thời gian mỗi câu lệnh (ms, 0 = không giới hạn). Lệnh chạy lâu như
+# seed_hr_data chạy với DB_STATEMENT_TIMEOUT_MS=0.
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))
+DB_REPLICA_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_REPLICA_STATEMENT_TIMEOUT_MS', 120000))
+
+
+def postgres_database(host, port, statement_timeout_ms):
+    database = {
         'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'global_hr_db',              # Tên database        
-        'HOST': 'localhost', 
-        'USER': 'postgres',
-        'PASSWORD': 'matkhau123@',
-        'PORT': '5432',                 
+        'NAME': os.environ.get('DB_NAME', 'global_hr_db'),
+        'HOST': host,
+        'USER': os.environ.get('DB_USER', 'postgres'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', 'matkhau123@'),
+        'PORT': port,
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
     }
+    if DB_PGBOUNCER:
+        # Chế độ transaction không giữ được cursor phía server (iterator()) và
+        # không nhận tham số khởi động; đặt statement_timeout cho role trên server
+        database['DISABLE_SERVER_SIDE_CURSORS'] = True
+    elif statement_timeout_ms:
+        database['OPTIONS']['options'] = f'-c statement_timeout={statement_timeout_ms}'
+    if DB_POOL_SIZE:
+        import django
+        from django.core.exceptions import ImproperlyConfigured
+        if django.VERSION < (5, 1):
+            raise ImproperlyConfigured('DB_POOL_SIZE cần Django >= 5.1 và psycopg 3; bản hiện tại dùng DB_CONN_MAX_AGE hoặc PgBouncer')
+        database['CONN_MAX_AGE'] = 0  # Pool tự giữ kết nối
+        database['OPTIONS']['pool'] = {'min_size': 1, 'max_size': DB_POOL_SIZE}
+    return database
+
+
+DATABASES = {
+    'default': postgres_database(
+        os.environ.get('DB_HOST', 'localhost'), os.environ.get('DB_PORT', '5432'), DB_STATEMENT_TIMEOUT_MS
+    ),
 }
 
+# Replica chỉ đọc (streaming replication) cho các request GET liệt kê (ReplicaReadMixin)
+if os.environ.get('DB_REPLICA_HOST'):
+    DATABASES['replica'] = postgres_database(
+        os.environ['DB_REPLICA_HOST'], os.environ.get('DB_REPLICA_PORT', '5432'), DB_REPLICA_STATEMENT_TIMEOUT_MS
+    )
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+# Database riêng cho báo cáo nặng (tổng hợp, theo phòng ban, xuất file); không đặt thì dùng replica
+if os.environ.get('DB_REPORTING_HOST'):
+    DATABASES['reporting'] = postgres_database(
+        os.environ['DB_REPORTING_HOST'], os.environ.get('DB_REPORTING_PORT', '5432'), DB_REPLICA_STATEMENT_TIMEOUT_MS
+    )
+    DATABASES['reporting']['TEST'] = {'MIRROR': 'default'}
+DATABASE_REPLICAS = ['replica'] if 'replica' in DATABASES else []
+REPORTING_DATABASE = 'reporting' if 'reporting' in DATABASES else next(iter(DATABASE_REPLICAS), None)
+REPORTING_MAX_LAG_SECONDS = float(os.environ.get('REPORTING_MAX_LAG_SECONDS', 30))  # Trễ hơn thì báo cáo đọc primary
+REPORTING_LAG_CHECK_INTERVAL = 5  # Giây dùng lại kết quả đo độ trễ
+DATABASE_ROUTERS = ['main.db_routers.PrimaryReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -172,6 +232,68 @@ SIMPLE_JWT = {
 CORS_ALLOW_ALL_ORIGINS = True  # Only for development
 CORS_ALLOW_CREDENTIALS = True
 
+# Cache: CACHE_URL=locmem:// (mặc định), file:///duong/dan hoặc redis://host:6379/0
+# (mọi server nói giao thức Redis, cần cài thêm redis: pip install redis)
+CACHE_URL = os.environ.get('CACHE_URL', 'locmem://')
+if CACHE_URL.startswith(('redis://', 'rediss://', 'unix://')):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_URL}}
+elif CACHE_URL.startswith('file://'):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': CACHE_URL[len('file://'):]}}
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+API_CACHE_ALIAS = 'default'       # Cache dùng cho response danh mục (ResponseCacheMixin)
+API_CACHE_TIMEOUT = 60 * 60       # Giây; dữ liệu thay đổi thì hết hạn ngay nhờ đổi phiên bản
+
+ORG_CHART_MAX_DEPTH = 50          # Số cấp quản lý tối đa khi duyệt sơ đồ tổ chức (chặn vòng lặp id_quan_ly)
+
 # Email settings
-EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+# Test với SMTP server debug cục bộ: EMAIL_BACKEND=django.core.mail.backends.smtp.EmailBackend EMAIL_PORT=1025
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 25))
 DEFAULT_FROM_EMAIL = 'hr@company.com'  # Email người gửi mặc định
+
+# Phần việc tính lương/gửi email 'running' không được gia hạn lâu hơn thì coi như worker đã chết,
+# worker khác nhận lại (worker đang chạy gia hạn sau mỗi lô email)
+PAYROLL_CHUNK_LEASE_SECONDS = 30 * 60
+
+# Gửi email bảng lương
+PAYROLL_EMAIL_BATCH_SIZE = 50       # Số email mỗi lô
+PAYROLL_EMAIL_WORKERS = 4           # Số thread gửi song song, mỗi thread một kết nối SMTP
+PAYROLL_EMAIL_RATE_LIMIT = 10       # Số email tối đa mỗi giây (0 = không giới hạn)
+PAYROLL_EMAIL_MAX_RETRIES = 3       # Số lần thử gửi mỗi email
+PAYROLL_EMAIL_RETRY_BACKOFF = 1.0   # Giây chờ trước lần gửi lại đầu tiên, tăng gấp đôi mỗi lần
+# Demo: gửi mọi bảng lương về địa chỉ này thay cho email nhân viên, chỉ có tác dụng khi DEBUG
+PAYROLL_EMAIL_DEMO_RECIPIENT = os.environ.get('PAYROLL_EMAIL_DEMO_RECIPIENT', '')
+PAYSLIP_CACHE_TIMEOUT = 60 * 60 * 24 * 35  # Giữ HTML bảng lương đã render qua hết tháng
+
+# Nhập lượt chấm công hàng loạt từ máy chấm công
+BULK_PUNCH_MAX_EVENTS = 10000  # Số lượt tối đa mỗi request /api/attendance/bulk_punch/
+
+# Đo hiệu năng từng request (main.profiling): log 'main.profiling', header Server-Timing (chỉ khi
+# DEBUG hoặc cho staff). Mặc định tắt: bật thì request chậm ghi lại file JSON của tiến trình mỗi lần
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '0') == '1'
+PROFILING_SLOW_REQUEST_MS = int(os.environ.get('PROFILING_SLOW_REQUEST_MS', 500))  # Request chậm hơn thì giữ lại
+PROFILING_SLOW_BUFFER_SIZE = 200  # Số request chậm gần nhất giữ lại mỗi tiến trình
+PROFILING_DIR = os.environ.get('PROFILING_DIR')  # Thư mục ghi request chậm, mặc định <tmp>/hr-profiling
+
+# Số liệu Prometheus ở /metrics (main.metrics)
+METRICS_DIR = os.environ.get('METRICS_DIR')  # Thư mục chung của các worker Gunicorn; không đặt = chỉ số liệu của tiến trình
+METRICS_FLUSH_INTERVAL = 1.0  # Giây giữa hai lần ghi số liệu của tiến trình ra METRICS_DIR
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # Đặt thì /metrics yêu cầu Authorization: Bearer <token>
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'main.profiling': {
+            'handlers': ['console'],
+            'level': os.environ.get('PROFILING_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
@@ -1,7 +1,8 @@
 from django.contrib import admin
 from .models import (
     KhuVuc, QuocGia, DiaDiem, CongViec, PhongBan, 
-    NhanVien, NguoiPhuThuoc, Attendance, PayrollRecord
+    NhanVien, NguoiPhuThuoc, Attendance, AttendanceMonthly, PayrollRecord, PayrollJob, PayrollJobChunk,
+    PayrollEmail, PayrollDirty
 )
 
 
@@ -131,6 +132,25 @@ class AttendanceAdmin(admin.ModelAdmin):
         return super().get_queryset(request).select_related('id_nhan_vien')
 
 
+@admin.register(AttendanceMonthly)
+class AttendanceMonthlyAdmin(admin.ModelAdmin):
+    list_display = ('ten_nhan_vien', 'thang_formatted', 'tong_ngay_cong', 'tong_gio_lam', 'so_ngay')
+    list_filter = ('thang', 'id_nhan_vien__id_phong_ban')
+    search_fields = ('id_nhan_vien__ho', 'id_nhan_vien__ten')
+    readonly_fields = ('id_nhan_vien', 'thang', 'tong_ngay_cong', 'tong_gio_lam', 'so_ngay')
+    
+    def ten_nhan_vien(self, obj):
+        return f"{obj.id_nhan_vien.ho} {obj.id_nhan_vien.ten}" if obj.id_nhan_vien else '-'
+    ten_nhan_vien.short_description = 'Tên nhân viên'
+    
+    def thang_formatted(self, obj):
+        return obj.thang.strftime('%m/%Y') if obj.thang else '-'
+    thang_formatted.short_description = 'Tháng'
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('id_nhan_vien')
+
+
 @admin.register(PayrollRecord)
 class PayrollRecordAdmin(admin.ModelAdmin):
     list_display = ('ten_nhan_vien', 'thang_formatted', 'tong_ngay_lam_formatted', 'luong_thuc_nhan_vnd', 'ngay_tinh_formatted')
@@ -163,3 +183,53 @@ class PayrollRecordAdmin(admin.ModelAdmin):
     
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('id_nhan_vien')
+
+
+
+class PayrollJobChunkInline(admin.TabularInline):
+    model = PayrollJobChunk
+    extra = 0
+    readonly_fields = ('id_phong_ban', 'trang_thai', 'so_nhan_vien', 'loi', 'bat_dau', 'ket_thuc')
+
+
+@admin.register(PayrollJob)
+class PayrollJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'loai', 'thang_formatted', 'trang_thai', 'tien_do', 'ngay_tao', 'ket_thuc')
+    list_filter = ('loai', 'trang_thai', 'thang')
+    readonly_fields = ('tong_so_nhan_vien', 'so_nhan_vien_xong', 'loi', 'ngay_tao', 'bat_dau', 'ket_thuc')
+    inlines = [PayrollJobChunkInline]
+    
+    def thang_formatted(self, obj):
+        return obj.thang.strftime('%m/%Y') if obj.thang else '-'
+    thang_formatted.short_description = 'Tháng'
+    
+    def tien_do(self, obj):
+        return f"{obj.so_nhan_vien_xong}/{obj.tong_so_nhan_vien}"
+    tien_do.short_description = 'Tiến độ'
+
+
+@admin.register(PayrollEmail)
+class PayrollEmailAdmin(admin.ModelAdmin):
+    list_display = ('ten_nhan_vien', 'thang_formatted', 'email_nhan', 'trang_thai', 'so_lan_thu', 'ngay_gui')
+    list_filter = ('trang_thai', 'id_payroll__thang')
+    search_fields = ('email_nhan', 'id_payroll__id_nhan_vien__ho', 'id_payroll__id_nhan_vien__ten')
+    readonly_fields = ('id_payroll', 'id_job', 'email_nhan', 'trang_thai', 'so_lan_thu', 'loi', 'ngay_tao', 'ngay_gui')
+    
+    def ten_nhan_vien(self, obj):
+        nv = obj.id_payroll.id_nhan_vien
+        return f"{nv.ho} {nv.ten}" if nv else '-'
+    ten_nhan_vien.short_description = 'Tên nhân viên'
+    
+    def thang_formatted(self, obj):
+        return obj.id_payroll.thang.strftime('%m/%Y')
+    thang_formatted.short_description = 'Tháng'
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('id_payroll__id_nhan_vien')
+
+
+@admin.register(PayrollDirty)
+class PayrollDirtyAdmin(admin.ModelAdmin):
+    list_display = ('id_nhan_vien', 'thang', 'ngay_danh_dau')
+    list_filter = ('thang',)
+    readonly_fields = ('id_nhan_vien', 'thang', 'ngay_danh_dau')
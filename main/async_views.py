@@ -0,0 +1,220 @@
+"""
+View async (Django thuần) cho các endpoint chủ yếu chờ I/O: chấm công, báo
+cáo tổng hợp, bảng lương theo phòng ban và các danh mục.
+
+DRF chưa có view async, nên các view này tự xác thực JWT và trả JSON cùng
+định dạng với endpoint DRF tương ứng (xem main.urls, tiền tố /api/async/).
+Chạy dưới ASGI (VD: ``uvicorn final_project.asgi:application``) thì một
+worker phục vụ được nhiều request đang chờ database cùng lúc; dưới WSGI
+chúng vẫn chạy đúng nhưng không có lợi gì.
+"""
+import hashlib
+import json
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework.exceptions import NotAuthenticated
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from .caching import get_api_cache, get_model_versions
+from .db_routers import read_from, reporting_database
+from .models import KhuVuc, QuocGia, DiaDiem, CongViec, PhongBan
+from .pagination import AsyncPageNumberPagination, AsyncSummaryPagination
+from .profiling import profile_section
+from .serializers import (
+    KhuVucSerializer, QuocGiaSerializer, DiaDiemSerializer,
+    CongViecSerializer, PhongBanSerializer, PayrollRecordSerializer
+)
+from . import metrics
+from . import punches
+from . import summaries
+
+
+def json_response(data, status=200, headers=None):
+    """JSON giống JSONRenderer của DRF (Decimal, ngày giờ, tiếng Việt không escape)"""
+    return JsonResponse(
+        data, status=status, headers=headers, safe=False, encoder=JSONEncoder,
+        json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')}
+    )
+
+
+def _unauthorized(detail):
+    return json_response({'detail': str(detail)}, status=401, headers={'WWW-Authenticate': 'Bearer realm="api"'})
+
+
+async def authenticate(request):
+    """Người dùng của access token trong header Authorization, hoặc response 401"""
+    auth = JWTAuthentication()
+    header = auth.get_header(request)
+    raw_token = auth.get_raw_token(header) if header else None
+    if raw_token is None:
+        return None, _unauthorized(NotAuthenticated.default_detail)
+    try:
+        token = auth.get_validated_token(raw_token)
+        user_id = token[jwt_settings.USER_ID_CLAIM]
+    except (InvalidToken, TokenError, KeyError):
+        return None, _unauthorized(InvalidToken.default_detail)
+
+    try:
+        user = await get_user_model().objects.aget(**{jwt_settings.USER_ID_FIELD: user_id})
+    except get_user_model().DoesNotExist:
+        return None, _unauthorized('User not found')
+    if not user.is_active:
+        return None, _unauthorized('User is inactive')
+    return user, None
+
+
+def jwt_required(view):
+    """Chỉ cho người dùng đã đăng nhập bằng JWT (như IsAuthenticated của DRF)"""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user, error = await authenticate(request)
+        if error:
+            return error
+        request.user = user
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def _punch_employee(request):
+    """Đọc id_nhan_vien từ body JSON hoặc form, trả về (id, response lỗi)"""
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return None, json_response({'error': 'Body JSON không hợp lệ'}, status=400)
+        if not isinstance(data, dict):
+            data = {}
+    else:
+        data = request.POST
+    id_nhan_vien = data.get('id_nhan_vien')
+    if not id_nhan_vien:
+        return None, json_response({'error': 'ID nhân viên là bắt buộc'}, status=400)
+    try:
+        return int(id_nhan_vien), None
+    except (TypeError, ValueError):
+        return None, json_response({'error': 'ID nhân viên không hợp lệ'}, status=400)
+
+
+async def _punch(request, loai, func, success_status):
+    id_nhan_vien, error = _punch_employee(request)
+    if error:
+        return error
+
+    # SQL thô trong transaction nên chạy trong thread, event loop vẫn rảnh cho request khác
+    try:
+        with metrics.PUNCH_DURATION.time(loai=loai):
+            data = await sync_to_async(func)(id_nhan_vien, timezone.now())
+    except punches.PunchError as e:
+        metrics.PUNCHES.inc(loai=loai, ket_qua='loi')
+        return json_response({'error': str(e)}, status=e.status_code)
+
+    metrics.PUNCHES.inc(loai=loai, ket_qua='ok')
+    return json_response(data, status=success_status)
+
+
+@csrf_exempt
+@require_POST
+@jwt_required
+async def check_in(request):
+    """Nhân viên check-in"""
+    return await _punch(request, 'check_in', punches.check_in, 201)
+
+
+@csrf_exempt
+@require_POST
+@jwt_required
+async def check_out(request):
+    """Nhân viên check-out"""
+    return await _punch(request, 'check_out', punches.check_out, 200)
+
+
+@require_GET
+@jwt_required
+async def attendance_summary(request):
+    """Xem tổng hợp chấm công theo tháng"""
+    try:
+        queryset, renames = summaries.attendance_summary(request.GET)
+    except summaries.SummaryError as e:
+        return json_response({'error': str(e)}, status=400)
+
+    paginator = AsyncSummaryPagination()
+    with read_from(await sync_to_async(reporting_database)()):
+        page = await paginator.paginate_queryset(queryset, request)
+    if page is None:
+        return json_response({'detail': paginator.invalid_page_message}, status=404)
+    with profile_section('serializer'):
+        summary_data = [summaries.format_summary_row(row, renames) for row in page]
+    return json_response(paginator.get_paginated_data(summary_data))
+
+
+@require_GET
+@jwt_required
+async def payroll_by_department(request):
+    """Xem lương theo phòng ban"""
+    try:
+        queryset = summaries.payroll_by_department(request.GET)
+    except summaries.SummaryError as e:
+        return json_response({'error': str(e)}, status=400)
+
+    with read_from(await sync_to_async(reporting_database)()):
+        records = [record async for record in queryset]
+    with profile_section('serializer'):
+        data = PayrollRecordSerializer(records, many=True).data
+    return json_response(data)
+
+
+def reference_list(model, serializer_class, select_related=(), cache_models=()):
+    """
+    View async liệt kê một bảng danh mục, cùng kết quả và cách cache với
+    ResponseCacheMixin: ETag theo phiên bản của ``cache_models``, trùng
+    If-None-Match thì trả 304 mà không đọc cache hay database.
+    """
+    cache_models = cache_models or (model,)
+    ordering = model._meta.ordering or ['pk']
+
+    @require_GET
+    @jwt_required
+    async def view(request):
+        versions = await sync_to_async(get_model_versions)(cache_models)
+        raw = '|'.join([request.build_absolute_uri(), 'json', *versions])
+        key = f"api:{hashlib.sha1(raw.encode()).hexdigest()}"
+        etag = f'"{key[4:]}"'
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+        if_none_match = request.headers.get('If-None-Match', '')
+        if etag in [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]:
+            return HttpResponse(status=304, headers=headers)
+
+        cache = get_api_cache()
+        data = await cache.aget(key)
+        metrics.record_cache('api', data is not None, data is None)
+        if data is not None:
+            return json_response(data, headers=headers)
+
+        queryset = model.objects.select_related(*select_related).order_by(*ordering)
+        paginator = AsyncPageNumberPagination()
+        page = await paginator.paginate_queryset(queryset, request)
+        if page is None:
+            return json_response({'detail': paginator.invalid_page_message}, status=404)
+        with profile_section('serializer'):
+            data = paginator.get_paginated_data(serializer_class(page, many=True).data)
+        await cache.aset(key, data, settings.API_CACHE_TIMEOUT)
+        return json_response(data, headers=headers)
+
+    view.__name__ = f'{model.__name__.lower()}_list'
+    return view
+
+
+khu_vuc_list = reference_list(KhuVuc, KhuVucSerializer)
+quoc_gia_list = reference_list(QuocGia, QuocGiaSerializer, ('id_khu_vuc',), (QuocGia, KhuVuc))
+dia_diem_list = reference_list(DiaDiem, DiaDiemSerializer, ('id_quoc_gia',), (DiaDiem, QuocGia))
+cong_viec_list = reference_list(CongViec, CongViecSerializer)
+phong_ban_list = reference_list(PhongBan, PhongBanSerializer, ('id_dia_diem',), (PhongBan, DiaDiem))
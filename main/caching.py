@@ -0,0 +1,37 @@
+import uuid
+from django.conf import settings
+from django.core.cache import caches
+
+
+def get_api_cache():
+    return caches[settings.API_CACHE_ALIAS]
+
+
+def get_versions(names):
+    """
+    Phiên bản hiện tại của từng nhóm dữ liệu, dùng làm một phần khóa cache.
+
+    Phiên bản là chuỗi ngẫu nhiên đổi mỗi khi dữ liệu thay đổi; nếu bị cache
+    xóa mất thì tạo phiên bản mới, nên không bao giờ trả nhầm dữ liệu cũ.
+    """
+    cache = get_api_cache()
+    keys = [f"api-version:{name}" for name in names]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, uuid.uuid4().hex, None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_version(name):
+    """Đổi phiên bản của một nhóm dữ liệu, mọi cache phụ thuộc vào nó coi như hết hạn"""
+    get_api_cache().set(f"api-version:{name}", uuid.uuid4().hex, None)
+
+
+def get_model_versions(models):
+    return get_versions([model._meta.label_lower for model in models])
+
+
+def bump_model_version(model):
+    bump_version(model._meta.label_lower)
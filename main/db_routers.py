@@ -0,0 +1,143 @@
+"""
+Chia truy vấn giữa database chính (primary, alias ``default``), các replica
+chỉ đọc khai báo trong DATABASE_REPLICAS và database báo cáo
+REPORTING_DATABASE.
+
+Mặc định mọi truy vấn vào primary. Chỉ những đoạn code chạy trong
+``read_from_replica()`` (các action GET liệt kê, xem ReplicaReadMixin) hoặc
+``read_for_reporting()`` (báo cáo nặng: tổng hợp, xuất file) mới đọc từ
+database khác; ghi thì luôn vào primary. Replica có thể trễ so với primary,
+nên không dùng cho các đoạn vừa ghi xong đã đọc lại, cũng như cho response
+có cache theo phiên bản (ResponseCacheMixin, sơ đồ tổ chức): đọc replica trễ
+ngay sau khi đổi phiên bản sẽ cache dữ liệu cũ dưới phiên bản mới.
+"""
+import contextvars
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+_read_alias = contextvars.ContextVar('read_alias', default=None)
+
+# Alias -> (thời điểm đo, độ trễ giây hoặc None nếu không đo được)
+_lag_cache = {}
+_lag_lock = threading.Lock()
+
+# Replica đã phát lại hết WAL nhận được thì coi như không trễ (primary không có
+# giao dịch mới thì pg_last_xact_replay_timestamp() cũ đi dù replica không trễ),
+# nhưng chỉ khi WAL receiver còn đang stream từ primary: mất kết nối thì hai LSN
+# cũng bằng nhau. Ngược lại tính trễ theo thời điểm giao dịch cuối được phát lại.
+# User database cần quyền pg_read_all_stats để đọc trạng thái trong
+# pg_stat_wal_receiver, thiếu quyền thì luôn tính theo cách sau.
+LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() AND EXISTS (
+            SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming'
+        ) THEN 0
+        ELSE GREATEST(0, EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()))
+    END
+"""
+
+
+@contextmanager
+def read_from(alias):
+    """Các truy vấn đọc (qua router) trong khối này đi tới ``alias``"""
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def read_from_replica():
+    """Đọc từ một replica (nếu có cấu hình)"""
+    return read_from(random.choice(settings.DATABASE_REPLICAS) if settings.DATABASE_REPLICAS else None)
+
+
+def replication_lag(alias):
+    """
+    Độ trễ (giây) của ``alias`` so với primary, None nếu không kết nối được.
+    Kết quả được dùng lại trong REPORTING_LAG_CHECK_INTERVAL giây.
+    """
+    now = time.monotonic()
+    with _lag_lock:
+        cached = _lag_cache.get(alias)
+    if cached and now - cached[0] < settings.REPORTING_LAG_CHECK_INTERVAL:
+        return cached[1]
+
+    connection = connections[alias]
+    try:
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(LAG_SQL)
+                lag = cursor.fetchone()[0]
+            lag = float(lag) if lag is not None else None
+        else:
+            # Database không có replication (VD: SQLite khi phát triển): chỉ kiểm tra kết nối
+            connection.ensure_connection()
+            lag = 0.0
+    except DatabaseError:
+        logger.warning('Không đo được độ trễ của database %s', alias, exc_info=True)
+        lag = None
+
+    with _lag_lock:
+        _lag_cache[alias] = (now, lag)
+    return lag
+
+
+def reporting_database():
+    """
+    Alias cho báo cáo: REPORTING_DATABASE nếu trễ không quá
+    REPORTING_MAX_LAG_SECONDS, ngược lại quay về primary (đếm trong
+    hr_reporting_reads_total với ly_do=tre hoặc loi).
+    """
+    alias = settings.REPORTING_DATABASE
+    if not alias:
+        return DEFAULT_DB_ALIAS
+
+    lag = replication_lag(alias)
+    if lag is not None and lag <= settings.REPORTING_MAX_LAG_SECONDS:
+        metrics.REPORTING_READS.inc(database=alias, ly_do='ok')
+        return alias
+
+    ly_do = 'loi' if lag is None else 'tre'
+    logger.info('Database báo cáo %s %s, đọc từ primary', alias, 'lỗi' if lag is None else f'trễ {lag:.1f}s')
+    metrics.REPORTING_READS.inc(database=DEFAULT_DB_ALIAS, ly_do=ly_do)
+    return DEFAULT_DB_ALIAS
+
+
+def read_for_reporting():
+    """Đọc từ database báo cáo, hoặc primary khi database báo cáo trễ/lỗi"""
+    return read_from(reporting_database())
+
+
+@metrics.register_collector
+def _reporting_lag(totals):
+    """Độ trễ của database báo cáo, đo lúc scrape (dùng lại kết quả đo gần nhất)"""
+    alias = settings.REPORTING_DATABASE
+    lag = replication_lag(alias) if alias else None
+    samples = [({'database': alias}, lag)] if lag is not None else []
+    return [('hr_reporting_lag_seconds', 'Độ trễ replication của database báo cáo', samples)]
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_alias.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Primary và replica chứa cùng dữ liệu
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replica nhận schema qua replication, không migrate trực tiếp
+        return db not in settings.DATABASE_REPLICAS and db != settings.REPORTING_DATABASE
@@ -0,0 +1,214 @@
+import csv
+import functools
+import shutil
+import tempfile
+import time
+from django.utils import timezone
+from . import metrics
+from .models import NhanVien, Attendance
+
+# Số dòng đọc từ DB mỗi lần khi xuất file
+EXPORT_CHUNK_SIZE = 2000
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def column_width(header, data_width):
+    """Độ rộng cột tính từ tiêu đề và độ dài tối đa đã biết của dữ liệu"""
+    return max(len(header), data_width) + 2
+
+
+def _export_metrics(dinh_dang):
+    """Đo số dòng và thời gian của một hàm ghi file (hàm trả về số dòng đã ghi)"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            count = func(*args, **kwargs)
+            metrics.EXPORT_DURATION.observe(time.perf_counter() - started, dinh_dang=dinh_dang)
+            metrics.EXPORT_ROWS.inc(count, dinh_dang=dinh_dang)
+            return count
+        return wrapper
+    return decorator
+
+
+@_export_metrics('xlsx')
+def write_xlsx(fileobj, title, columns, rows, number_formats=None):
+    """
+    Ghi ``rows`` vào một sheet Excel ở chế độ write-only.
+
+    ``columns`` là danh sách (tiêu đề, độ rộng dữ liệu tối đa). Độ rộng cột
+    được đặt trước khi ghi nên không phải duyệt lại các ô, còn các dòng được
+    openpyxl đẩy ra file tạm nên bộ nhớ không tăng theo số dòng.
+    ``number_formats`` là dict {vị trí cột (từ 0): định dạng số}.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, Alignment, PatternFill
+    from openpyxl.utils import get_column_letter
+
+    number_formats = number_formats or {}
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=title[:31])
+
+    for col, (header, data_width) in enumerate(columns, 1):
+        ws.column_dimensions[get_column_letter(col)].width = column_width(header, data_width)
+
+    center = Alignment(horizontal='center')
+    header_font = Font(bold=True)
+    header_fill = PatternFill(start_color='CCCCCC', end_color='CCCCCC', fill_type='solid')
+
+    header_row = []
+    for header, _ in columns:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.font = header_font
+        cell.fill = header_fill
+        cell.alignment = center
+        header_row.append(cell)
+    ws.append(header_row)
+
+    count = 0
+    for row in rows:
+        cells = []
+        for col, value in enumerate(row):
+            cell = WriteOnlyCell(ws, value=value)
+            cell.alignment = center
+            if col in number_formats:
+                cell.number_format = number_formats[col]
+            cells.append(cell)
+        ws.append(cells)
+        count += 1
+
+    wb.save(fileobj)
+    return count
+
+
+def xlsx_tempfile(*args, **kwargs):
+    """Ghi file Excel ra file tạm trên đĩa và trả về file đã tua về đầu"""
+    fileobj = tempfile.TemporaryFile()
+    write_xlsx(fileobj, *args, **kwargs)
+    fileobj.seek(0)
+    return fileobj
+
+
+@_export_metrics('csv')
+def write_csv(fileobj, columns, rows):
+    """Ghi CSV (UTF-8 có BOM để Excel đọc đúng tiếng Việt)"""
+    writer = csv.writer(fileobj)
+    writer.writerow([header for header, _ in columns])
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+@_export_metrics('parquet')
+def write_parquet(path, columns, rows, types, batch_size=EXPORT_CHUNK_SIZE):
+    """
+    Ghi Parquet theo từng khối dòng, cần cài thêm pyarrow.
+
+    ``types`` là tên kiểu pyarrow của từng cột (VD: 'string', 'float64').
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(header, getattr(pa, type_name)()) for (header, _), type_name in zip(columns, types)])
+    count = 0
+    batch = []
+    with pq.ParquetWriter(path, schema) as writer:
+        for row in rows:
+            batch.append(row)
+            count += 1
+            if len(batch) >= batch_size:
+                writer.write_table(pa.Table.from_pylist([dict(zip(schema.names, r)) for r in batch], schema=schema))
+                batch.clear()
+        if batch:
+            writer.write_table(pa.Table.from_pylist([dict(zip(schema.names, r)) for r in batch], schema=schema))
+    return count
+
+
+ATTENDANCE_COLUMNS = [
+    ('Họ tên nhân viên', NhanVien._meta.get_field('ho').max_length + NhanVien._meta.get_field('ten').max_length + 1),
+    ('Ngày chấm công', 10),
+    ('Giờ check-in', 5),
+    ('Giờ check-out', 5),
+    ('Số giờ làm việc', 5),
+    ('Số công', 5),
+]
+ATTENDANCE_PARQUET_TYPES = ['string', 'string', 'string', 'string', 'float64', 'float64']
+
+
+def iter_attendance_rows(start_date, end_date, id_phong_ban=None, split_department=False):
+    """
+    Đọc chấm công trong [start_date, end_date) bằng server-side cursor, từ
+    database báo cáo (primary nếu database báo cáo trễ).
+
+    ``split_department`` = True thì chỉ lấy nhân viên của ``id_phong_ban``
+    (None = nhân viên chưa có phòng ban).
+    """
+    attendances = Attendance.objects.using_reporting().filter(ngay_lam__gte=start_date, ngay_lam__lt=end_date)
+    if split_department:
+        attendances = attendances.filter(id_nhan_vien__id_phong_ban=id_phong_ban)
+    attendances = attendances.order_by(
+        'ngay_lam', 'id_nhan_vien__ho', 'id_nhan_vien__ten'
+    ).values_list(
+        'id_nhan_vien__ho', 'id_nhan_vien__ten', 'ngay_lam', 'check_in', 'check_out', 'gio_lam', 'ngay_cong'
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+    tz = timezone.get_current_timezone()
+    for ho, ten, ngay_lam, check_in, check_out, gio_lam, ngay_cong in attendances:
+        yield (
+            f"{ho} {ten}",
+            ngay_lam.strftime('%d/%m/%Y'),
+            check_in.astimezone(tz).strftime('%H:%M') if check_in else None,
+            check_out.astimezone(tz).strftime('%H:%M') if check_out else None,
+            gio_lam,
+            ngay_cong,
+        )
+
+
+def export_attendance_part(path, file_format, start_date, end_date, id_phong_ban=None, split_department=False):
+    """
+    Xuất một phần dữ liệu chấm công ra một file; chạy được trong process con.
+
+    Trả về (đường dẫn, số dòng).
+    """
+    rows = iter_attendance_rows(start_date, end_date, id_phong_ban, split_department)
+    if file_format == 'csv':
+        with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+            count = write_csv(f, ATTENDANCE_COLUMNS, rows)
+    elif file_format == 'parquet':
+        rows = ((ho_ten, ngay, vao, ra, float(gio) if gio is not None else None, float(cong) if cong is not None else None)
+                for ho_ten, ngay, vao, ra, gio, cong in rows)
+        count = write_parquet(path, ATTENDANCE_COLUMNS, rows, ATTENDANCE_PARQUET_TYPES)
+    else:
+        with open(path, 'wb') as f:
+            count = write_xlsx(f, 'Bảng chấm công', ATTENDANCE_COLUMNS, rows)
+    # Process con của ProcessPoolExecutor thoát không chạy atexit, ghi số liệu ngay
+    metrics.flush()
+    return path, count
+
+
+
+def merge_attendance_parts(paths, output, file_format):
+    """
+    Nối các file chấm công CSV hoặc Parquet (đã theo thứ tự ngày) thành ``output``
+    mà không đọc lại từng dòng: CSV bỏ dòng tiêu đề của các file sau, Parquet
+    chép từng bảng.
+    """
+    if file_format == 'csv':
+        with open(output, 'wb') as out:
+            for i, path in enumerate(paths):
+                with open(path, 'rb') as f:
+                    if i:
+                        f.readline()  # Dòng tiêu đề (kèm BOM) của file sau
+                    shutil.copyfileobj(f, out)
+    elif file_format == 'parquet':
+        import pyarrow.parquet as pq
+
+        with pq.ParquetWriter(output, pq.read_schema(paths[0])) as writer:
+            for path in paths:
+                writer.write_table(pq.read_table(path))
+    else:
+        raise ValueError(f'Không nối được file {file_format}')
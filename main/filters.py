@@ -0,0 +1,21 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+
+class QueryParamFilterBackend(BaseFilterBackend):
+    """
+    Lọc queryset theo query param, khai báo trên view bằng ``filter_params``:
+    {tên param: (lookup ORM, hàm chuyển kiểu)}.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        for param, (lookup, parse) in getattr(view, 'filter_params', {}).items():
+            value = request.query_params.get(param)
+            if value in (None, ''):
+                continue
+            try:
+                value = parse(value)
+            except (TypeError, ValueError, ArithmeticError):
+                raise ValidationError({'error': f'Giá trị của {param} không hợp lệ'})
+            queryset = queryset.filter(**{lookup: value})
+        return queryset
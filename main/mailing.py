@@ -0,0 +1,248 @@
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.utils import timezone
+from . import metrics
+from .models import PayrollEmail
+from .payslips import render_payslips
+
+# Lỗi có thể gặp khi gửi hoặc đóng kết nối SMTP (SMTPException là lớp con của OSError)
+SEND_ERRORS = (smtplib.SMTPException, OSError)
+
+
+def is_retryable(error):
+    """
+    Lỗi tạm thời đáng để gửi lại: mất kết nối, không kết nối được, lỗi mạng
+    hoặc server trả mã 4xx. Mã 5xx, người nhận/người gửi bị từ chối hay sai
+    tài khoản thì gửi lại cũng vô ích.
+    """
+    if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
+        return True
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    return not isinstance(error, smtplib.SMTPException)
+
+
+class RateLimiter:
+    """Giới hạn số email/giây dùng chung cho mọi thread (token bucket)"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, count=1):
+        """Chờ đến khi được gửi ``count`` email; lô lớn hơn rate thì các lần sau chờ bù"""
+        if not self.rate:
+            return
+        needed = min(count, self.rate)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= needed:
+                    self.tokens -= count
+                    return
+                wait = (needed - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class PayslipMessage(EmailMessage):
+    """
+    EmailMessage ghi nhận lúc được backend chuyển thành MIME (ngay trước khi
+    gửi), để biết một lần send_messages() lỗi đã dừng ở email nào.
+    """
+    serialized = False
+
+    def message(self, *args, **kwargs):
+        self.serialized = True
+        return super().message(*args, **kwargs)
+
+
+def build_payslip_message(payroll, to, html):
+    """Tạo email bảng lương cho một PayrollRecord từ HTML đã render"""
+    email = PayslipMessage(
+        subject=f'Bảng lương tháng {payroll.thang.strftime("%m-%Y")}',
+        body=html,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[to],
+    )
+    email.content_subtype = 'html'
+    return email
+
+
+class _Sender:
+    """Mỗi thread giữ một kết nối SMTP và dùng lại cho mọi lô email của nó"""
+
+    def __init__(self, rate_limiter, max_retries, retry_backoff):
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def get_connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = get_connection()
+            connection.open()
+            self.local.connection = connection
+            with self.lock:
+                self.connections.append(connection)
+        return connection
+
+    def reset_connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is not None:
+            try:
+                connection.close()
+            except SEND_ERRORS:
+                pass
+            connection.open()
+
+    def send_batch(self, batch):
+        """
+        Gửi một lô [(PayrollEmail, PayslipMessage)] bằng một lần send_messages(),
+        trả về kết quả từng người nhận [(PayrollEmail, số lần thử, lỗi)].
+
+        Backend gửi lần lượt và dừng ở email lỗi đầu tiên: các email trước nó
+        đã gửi, email lỗi được tính một lần thử (gửi lại nếu lỗi tạm thời),
+        các email sau được gửi tiếp trong lần send_messages() kế tiếp.
+        """
+        attempts = [0] * len(batch)
+        results = []
+        remaining = list(range(len(batch)))  # Vị trí trong lô của các email chưa có kết quả
+        while remaining:
+            self.rate_limiter.acquire(len(remaining))
+            for i in remaining:
+                batch[i][1].serialized = False
+            try:
+                self.get_connection().send_messages([batch[i][1] for i in remaining])
+            except SEND_ERRORS as e:
+                # Chưa email nào được chuyển thành MIME (VD: lỗi kết nối) thì tính cho email đầu
+                started = [n for n, i in enumerate(remaining) if batch[i][1].serialized]
+                failed = started[-1] if started else 0
+                for i in remaining[:failed]:
+                    attempts[i] += 1
+                    results.append((batch[i][0], attempts[i], None))
+                remaining = remaining[failed:]
+                i = remaining[0]
+                attempts[i] += 1
+                if not is_retryable(e) or attempts[i] >= self.max_retries:
+                    results.append((batch[i][0], attempts[i], str(e) or e.__class__.__name__))
+                    remaining = remaining[1:]
+                    continue
+                time.sleep(self.retry_backoff * 2 ** (attempts[i] - 1))
+                try:
+                    self.reset_connection()
+                except SEND_ERRORS:
+                    pass
+            else:
+                for i in remaining:
+                    attempts[i] += 1
+                    results.append((batch[i][0], attempts[i], None))
+                remaining = []
+        return results
+
+    def close(self):
+        for connection in self.connections:
+            try:
+                connection.close()
+            except SEND_ERRORS:
+                pass
+
+
+def dispatch_payroll_emails(payrolls, email_nhan=None, heartbeat=None, job=None):
+    """
+    Gửi email bảng lương cho các PayrollRecord và lưu trạng thái từng người nhận.
+
+    Email được chia thành từng lô, gửi song song bằng một thread pool giới hạn
+    số thread; mỗi thread dùng lại một kết nối SMTP, có giới hạn tốc độ và gửi
+    lại với thời gian chờ tăng dần khi gặp lỗi tạm thời.
+    ``email_nhan`` (nếu có) thay cho email của nhân viên, dùng khi demo/test.
+    ``heartbeat`` (nếu có) được gọi sau mỗi lô, VD: để worker gia hạn lease;
+    nó raise thì các lô chưa gửi bị hủy.
+    ``job`` (PayrollJob gửi email) gắn vào từng PayrollEmail: chạy lại cùng tác
+    vụ (phần việc lỗi hoặc được worker khác nhận lại) thì dùng lại các dòng đã
+    có và bỏ qua những người đã gửi thành công.
+    Trả về danh sách PayrollEmail của mọi bảng lương đã cập nhật trạng thái.
+    """
+    payrolls = list(payrolls)
+    existing = {}
+    if job is not None:
+        existing = {
+            delivery.id_payroll_id: delivery
+            for delivery in PayrollEmail.objects.filter(id_job=job, id_payroll__in=[payroll.pk for payroll in payrolls])
+        }
+    created = iter(PayrollEmail.objects.bulk_create([
+        PayrollEmail(id_payroll=payroll, id_job=job, email_nhan=email_nhan or payroll.id_nhan_vien.email)
+        for payroll in payrolls if payroll.pk not in existing
+    ]))
+    deliveries = [existing.get(payroll.pk) or next(created) for payroll in payrolls]
+
+    now = timezone.now()
+    pending = []
+    for payroll, delivery in zip(payrolls, deliveries):
+        if delivery.trang_thai == 'sent':
+            continue
+        if not delivery.email_nhan:
+            delivery.trang_thai = 'failed'
+            delivery.loi = 'Nhân viên chưa có email'
+            delivery.ngay_gui = now
+            continue
+        pending.append((payroll, delivery))
+    attempted = [delivery for _, delivery in pending]
+
+    # Render cả lô một lần, bảng lương chưa đổi lấy lại từ cache
+    htmls = render_payslips([payroll for payroll, _ in pending])
+    pending = [
+        (delivery, build_payslip_message(payroll, delivery.email_nhan, html))
+        for (payroll, delivery), html in zip(pending, htmls)
+    ]
+
+    batch_size = settings.PAYROLL_EMAIL_BATCH_SIZE
+    batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+    sender = _Sender(
+        RateLimiter(settings.PAYROLL_EMAIL_RATE_LIMIT),
+        settings.PAYROLL_EMAIL_MAX_RETRIES,
+        settings.PAYROLL_EMAIL_RETRY_BACKOFF
+    )
+
+    try:
+        with ThreadPoolExecutor(max_workers=settings.PAYROLL_EMAIL_WORKERS) as executor:
+            futures = [executor.submit(sender.send_batch, batch) for batch in batches]
+            try:
+                # Ghi trạng thái ở thread chính, mỗi lô một lệnh bulk_update
+                for future in as_completed(futures):
+                    updated = []
+                    for delivery, attempt, error in future.result():
+                        delivery.so_lan_thu = attempt
+                        delivery.trang_thai = 'failed' if error else 'sent'
+                        delivery.loi = error
+                        delivery.ngay_gui = timezone.now()
+                        updated.append(delivery)
+                    PayrollEmail.objects.bulk_update(updated, ['trang_thai', 'so_lan_thu', 'loi', 'ngay_gui'])
+                    if heartbeat is not None:
+                        heartbeat()
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+    finally:
+        sender.close()
+
+    failed_without_email = [d for d in deliveries if d.trang_thai == 'failed' and d.so_lan_thu == 0]
+    if failed_without_email:
+        PayrollEmail.objects.bulk_update(failed_without_email, ['trang_thai', 'loi', 'ngay_gui'])
+
+    # Chỉ đếm các email của lần chạy này
+    sent = sum(1 for d in attempted if d.trang_thai == 'sent')
+    metrics.PAYROLL_EMAILS.inc(sent, trang_thai='sent')
+    metrics.PAYROLL_EMAILS.inc(len(attempted) - sent + len(failed_without_email), trang_thai='failed')
+    return deliveries
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from main.profiling import get_slow_requests_dir
+from pathlib import Path
+import json
+
+class Command(BaseCommand):
+    help = 'In các request chậm mà RequestProfilingMiddleware đã ghi lại (gộp từ mọi tiến trình web)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', type=str, help='Chỉ lấy request có đường dẫn bắt đầu bằng chuỗi này, VD: /api/payroll/')
+        parser.add_argument('--limit', type=int, default=20, help='Số request tối đa')
+        parser.add_argument('--sort', choices=['total', 'db', 'queries', 'thoi_gian'], default='total', help='Sắp xếp giảm dần theo')
+        parser.add_argument('--json', action='store_true', help='In dạng JSON')
+        parser.add_argument('--clear', action='store_true', help='Xóa các file đã ghi sau khi in')
+
+    def handle(self, *args, **options):
+        files = sorted(Path(get_slow_requests_dir()).glob('slow-*.json'))
+        entries = []
+        for path in files:
+            try:
+                entries += json.loads(path.read_text(encoding='utf-8'))
+            except (OSError, ValueError):
+                continue
+
+        if options['path']:
+            entries = [e for e in entries if e['path'].startswith(options['path'])]
+        sort_key = {'total': 'total_ms', 'db': 'db_ms', 'queries': 'queries', 'thoi_gian': 'thoi_gian'}[options['sort']]
+        entries = sorted(entries, key=lambda e: e[sort_key], reverse=True)[:options['limit']]
+
+        if options['json']:
+            self.stdout.write(json.dumps(entries, ensure_ascii=False, indent=2))
+        elif not entries:
+            self.stdout.write('Chưa có request chậm nào')
+        else:
+            for e in entries:
+                sections = ' '.join(f'{name}={ms}ms' for name, ms in e['sections_ms'].items())
+                self.stdout.write(
+                    f"{e['thoi_gian']} {e['method']} {e['path']} -> {e['status']}: {e['total_ms']}ms, "
+                    f"db {e['db_ms']}ms / {e['queries']} truy vấn ({e['duplicates']} lặp lại) {sections}"
+                )
+                for dup in e.get('top_duplicates', []):
+                    self.stdout.write(f"    x{dup['so_lan']}: {dup['sql']}")
+
+        if options['clear']:
+            for path in files:
+                path.unlink(missing_ok=True)
+            self.stdout.write(self.style.SUCCESS(f'Đã xóa {len(files)} file request chậm'))
@@ -1,105 +1,131 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
 from django.utils import timezone
 from main.models import Attendance
-import openpyxl
-from openpyxl.styles import Font, Alignment, PatternFill
-from datetime import datetime
-from django.utils.timezone import make_aware, localtime
-import traceback
+from main.exports import export_attendance_part, merge_attendance_parts
+from main.utils import month_range
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+import multiprocessing
+import os
+import tempfile
+import time
+import django
 
 class Command(BaseCommand):
-    help = 'Xuất dữ liệu chấm công ra file Excel'
+    help = 'Xuất dữ liệu chấm công ra file Excel/CSV/Parquet'
 
     def add_arguments(self, parser):
         parser.add_argument('--from_date', type=str, help='Ngày bắt đầu (dd/mm/yyyy)')
         parser.add_argument('--to_date', type=str, help='Ngày kết thúc (dd/mm/yyyy)')
-        parser.add_argument('--output', type=str, help='Đường dẫn file Excel output')
+        parser.add_argument('--output', type=str, help='Đường dẫn file output')
+        parser.add_argument('--format', choices=['xlsx', 'csv', 'parquet'], default='xlsx', help='Định dạng file (mặc định: xlsx)')
+        parser.add_argument('--split-by', dest='split_by', choices=['month', 'department'], help='Tách thành nhiều file theo tháng hoặc phòng ban')
+        parser.add_argument('--workers', type=int, default=min(os.cpu_count() or 1, 8), help='Số process xuất song song')
 
     def handle(self, *args, **options):
         try:
-            # Parse ngày tháng
-            if options['from_date']:
-                from_date = datetime.strptime(options['from_date'], '%d/%m/%Y').date()
-            else:
-                # Mặc định là ngày hiện tại
-                from_date = timezone.now().date()
+            # Parse ngày tháng, mặc định là ngày hiện tại
+            today = timezone.now().date()
+            from_date = datetime.strptime(options['from_date'], '%d/%m/%Y').date() if options['from_date'] else today
+            to_date = datetime.strptime(options['to_date'], '%d/%m/%Y').date() if options['to_date'] else today
+        except ValueError:
+            raise CommandError('Định dạng ngày không đúng (dd/mm/yyyy)')
 
-            if options['to_date']:
-                to_date = datetime.strptime(options['to_date'], '%d/%m/%Y').date()
-            else:
-                # Mặc định là ngày hiện tại
-                to_date = timezone.now().date()
+        file_format = options['format']
+        if file_format == 'parquet':
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise CommandError('Xuất parquet cần cài thêm pyarrow (pip install pyarrow)')
 
-            # Lấy dữ liệu từ database
-            attendances = Attendance.objects.filter(
-                ngay_lam__range=(from_date, to_date)
-            ).select_related('id_nhan_vien').order_by('ngay_lam', 'id_nhan_vien__ho', 'id_nhan_vien__ten')
+        output = Path(options['output'] or 'cham_cong.xlsx')
+        output = output.with_suffix(f'.{file_format}')
+        output.parent.mkdir(parents=True, exist_ok=True)
+        end_date = to_date + timedelta(days=1)
 
-            self.stdout.write(f"Tìm thấy {attendances.count()} bản ghi chấm công")
+        try:
+            with tempfile.TemporaryDirectory(dir=output.parent, prefix='.export-') as tmp:
+                started = time.monotonic()
+                if options['split_by']:
+                    tasks = self.build_tasks(output, file_format, from_date, end_date, options['split_by'])
+                    results = self.run_tasks(tasks, options['workers'])
+                else:
+                    # Một file: chia khoảng ngày cho các process, ghi file tạm rồi nối lại theo thứ tự ngày.
+                    # File Excel không nối được mà phải đọc lại và ghi lại toàn bộ (chậm hơn ghi một lần),
+                    # nên vẫn do một process ghi; muốn song song thì dùng --split-by
+                    workers = 1 if file_format == 'xlsx' else options['workers']
+                    tasks = self.split_range(Path(tmp) / output.name, file_format, from_date, end_date, workers)
+                    parts = self.run_tasks(tasks, options['workers'])
+                    if len(parts) == 1:
+                        os.replace(parts[0][0], output)
+                    else:
+                        merge_attendance_parts([path for path, _ in parts], output, file_format)
+                    results = [(str(output), sum(count for _, count in parts))]
+                elapsed = time.monotonic() - started
+        except Exception as e:
+            raise CommandError(f'Lỗi khi xuất file: {e}') from e
 
-            # Debug thông tin bản ghi đầu tiên
-            if attendances:
-                first = attendances[0]
-                self.stdout.write(f"Thông tin bản ghi đầu tiên:")
-                self.stdout.write(f"- Nhân viên: {first.id_nhan_vien.ho} {first.id_nhan_vien.ten}")
-                self.stdout.write(f"- Ngày làm: {first.ngay_lam}")
-                self.stdout.write(f"- Check-in: {first.check_in}")
-                self.stdout.write(f"- Check-out: {first.check_out}")
-                self.stdout.write(f"- Giờ làm: {first.gio_lam}")
-                self.stdout.write(f"- Ngày công: {first.ngay_cong}")
+        total = 0
+        for path, count in results:
+            total += count
+            self.stdout.write(f'- {path}: {count} bản ghi')
 
-            # Tạo workbook và worksheet
-            wb = openpyxl.Workbook()
-            ws = wb.active
-            ws.title = "Bảng chấm công"
+        self.stdout.write(self.style.SUCCESS(
+            f'Đã xuất {total} bản ghi chấm công ra {len(results)} file trong {elapsed:.2f}s '
+            f'({total / elapsed if elapsed else 0:,.0f} dòng/giây)'
+        ))
 
-            # Định dạng header
-            headers = ['Họ tên nhân viên', 'Ngày chấm công', 'Giờ check-in', 'Giờ check-out', 'Số giờ làm việc', 'Số công']
-            header_fill = PatternFill(start_color='CCCCCC', end_color='CCCCCC', fill_type='solid')
-            
-            for col, header in enumerate(headers, 1):
-                cell = ws.cell(row=1, column=col)
-                cell.value = header
-                cell.font = Font(bold=True)
-                cell.fill = header_fill
-                cell.alignment = Alignment(horizontal='center')
+    def run_tasks(self, tasks, workers):
+        """Chạy export_attendance_part cho từng phần việc, song song nếu có nhiều phần"""
+        if len(tasks) <= 1 or workers <= 1:
+            return [export_attendance_part(*task) for task in tasks]
+        # Mỗi process con tự mở kết nối DB riêng
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup
+        ) as executor:
+            futures = [executor.submit(export_attendance_part, *task) for task in tasks]
+            return [future.result() for future in futures]
 
-            # Ghi dữ liệu
-            for row, attendance in enumerate(attendances, 2):
-                # Họ tên nhân viên
-                ws.cell(row=row, column=1).value = f"{attendance.id_nhan_vien.ho} {attendance.id_nhan_vien.ten}"
-                
-                # Ngày chấm công
-                ws.cell(row=row, column=2).value = attendance.ngay_lam.strftime('%d/%m/%Y')
-                
-                # Giờ check-in
-                if attendance.check_in:
-                    # Chuyển naive datetime sang aware datetime
-                    aware_checkin = make_aware(attendance.check_in)
-                    local_checkin = localtime(aware_checkin)
-                    ws.cell(row=row, column=3).value = local_checkin.strftime('%H:%M')
-                
-                # Giờ check-out
-                if attendance.check_out:
-                    # Chuyển naive datetime sang aware datetime
-                    aware_checkout = make_aware(attendance.check_out)
-                    local_checkout = localtime(aware_checkout)
-                    ws.cell(row=row, column=4).value = local_checkout.strftime('%H:%M')
-                
-                # Số giờ làm việc
-                ws.cell(row=row, column=5).value = attendance.gio_lam
-                
-                # Số công
-                ws.cell(row=row, column=6).value = attendance.ngay_cong
+    def split_range(self, output, file_format, start_date, end_date, workers):
+        """Chia [start_date, end_date) thành tối đa ``workers`` đoạn ngày liên tiếp, mỗi đoạn một file tạm"""
+        days = (end_date - start_date).days
+        parts = max(1, min(workers, days))
+        bounds = [start_date + timedelta(days=days * i // parts) for i in range(parts + 1)]
+        return [
+            (str(output.with_name(f'{output.stem}_{i}{output.suffix}')), file_format, bounds[i], bounds[i + 1])
+            for i in range(parts)
+        ]
 
-            # Căn chỉnh cột
-            for col in range(1, len(headers) + 1):
-                ws.column_dimensions[openpyxl.utils.get_column_letter(col)].width = 15
+    def build_tasks(self, output, file_format, start_date, end_date, split_by):
+        """Chia khoảng [start_date, end_date) thành các phần việc, mỗi phần một file"""
+        def part_path(suffix):
+            return str(output.with_name(f'{output.stem}_{suffix}{output.suffix}'))
 
-            # Lưu file
-            output_file = options['output'] or 'cham_cong.xlsx'
-            wb.save(output_file)
-            self.stdout.write(self.style.SUCCESS(f'Đã xuất dữ liệu ra file {output_file}'))
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f'Lỗi: {str(e)}'))
-            self.stdout.write(self.style.ERROR(traceback.format_exc())) 
\ No newline at end of file
+        if split_by == 'month':
+            tasks = []
+            month_start = month_range(start_date)[0]
+            while month_start < end_date:
+                month_end = month_range(month_start)[1]
+                tasks.append((
+                    part_path(month_start.strftime('%Y-%m')), file_format,
+                    max(month_start, start_date), min(month_end, end_date)
+                ))
+                month_start = month_end
+            return tasks
+
+        if split_by == 'department':
+            departments = Attendance.objects.using_reporting().filter(
+                ngay_lam__gte=start_date, ngay_lam__lt=end_date
+            ).order_by('id_nhan_vien__id_phong_ban').values_list('id_nhan_vien__id_phong_ban', flat=True).distinct()
+            return [
+                (part_path(f'pb{id_phong_ban}' if id_phong_ban else 'khong_phong_ban'), file_format,
+                 start_date, end_date, id_phong_ban, True)
+                for id_phong_ban in departments
+            ]
+
+        return [(str(output), file_format, start_date, end_date)]
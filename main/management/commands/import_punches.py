@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+from main.punches import ingest_punches
+from pathlib import Path
+import csv
+import json
+import time
+
+class Command(BaseCommand):
+    help = 'Nhập lượt chấm công từ file CSV/NDJSON của máy chấm công (id_nhan_vien, thoi_gian, loai)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', type=str, required=True, help='Đường dẫn file CSV (có dòng tiêu đề) hoặc NDJSON')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='Định dạng file (mặc định: theo đuôi file)')
+        parser.add_argument('--batch_size', type=int, default=5000, help='Số lượt chấm công mỗi lô')
+
+    def handle(self, *args, **options):
+        path = Path(options['file'])
+        if not path.exists():
+            raise CommandError(f'Không tìm thấy file {path}')
+        file_format = options['format'] or ('csv' if path.suffix.lower() == '.csv' else 'ndjson')
+
+        started = time.monotonic()
+        totals = {'created': 0, 'updated': 0, 'duplicates': 0, 'rejected': 0}
+        offset = 0
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            for batch in self.read_batches(f, file_format, options['batch_size']):
+                result = ingest_punches(batch)
+                for rejected in result['rejected']:
+                    # Dòng trong file (CSV tính cả dòng tiêu đề)
+                    line = offset + rejected['index'] + (2 if file_format == 'csv' else 1)
+                    self.stdout.write(self.style.WARNING(f'Dòng {line}: {rejected["error"]} - {rejected["event"]}'))
+                for key in ('created', 'updated', 'duplicates'):
+                    totals[key] += result[key]
+                totals['rejected'] += len(result['rejected'])
+                offset += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Đã nhập {offset} lượt chấm công trong {time.monotonic() - started:.2f}s: '
+            f'{totals["created"]} dòng mới, {totals["updated"]} dòng cập nhật, '
+            f'{totals["duplicates"]} lượt trùng, {totals["rejected"]} lượt bị từ chối'
+        ))
+
+    def read_batches(self, f, file_format, batch_size):
+        if file_format == 'csv':
+            events = csv.DictReader(f)
+        else:
+            events = (self.parse_line(line) for line in f if line.strip())
+
+        batch = []
+        for event in events:
+            batch.append(event)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def parse_line(self, line):
+        try:
+            return json.loads(line)
+        except json.JSONDecodeError:
+            # Để ingest_punches báo lỗi cho đúng dòng
+            return line.strip()
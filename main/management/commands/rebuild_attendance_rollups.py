@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from main.rollups import rebuild_attendance_rollups
+from datetime import datetime
+
+class Command(BaseCommand):
+    help = 'Tính lại bảng tổng hợp chấm công theo tháng từ dữ liệu chấm công gốc'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from_date', type=str, help='Ngày bắt đầu (dd/mm/yyyy), làm tròn về đầu tháng')
+        parser.add_argument('--to_date', type=str, help='Ngày kết thúc (dd/mm/yyyy), làm tròn về cuối tháng')
+
+    def handle(self, *args, **options):
+        try:
+            today = timezone.now().date()
+            from_date = datetime.strptime(options['from_date'], '%d/%m/%Y').date() if options['from_date'] else today
+            to_date = datetime.strptime(options['to_date'], '%d/%m/%Y').date() if options['to_date'] else today
+        except ValueError:
+            raise CommandError('Định dạng ngày không đúng (dd/mm/yyyy)')
+
+        if from_date > to_date:
+            raise CommandError('Ngày bắt đầu phải trước ngày kết thúc')
+
+        count = rebuild_attendance_rollups(from_date, to_date)
+        self.stdout.write(self.style.SUCCESS(
+            f'Đã tính lại {count} dòng tổng hợp chấm công từ {from_date.strftime("%m/%Y")} đến {to_date.strftime("%m/%Y")}'
+        ))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from main.models import PayrollDirty
+from main.payroll_engine import recalculate_dirty_payroll
+import time
+
+class Command(BaseCommand):
+    help = 'Tính lại lương cho các nhân viên có chấm công bị sửa sau lần tính lương gần nhất'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch_size', type=int, default=1000, help='Số dòng đánh dấu xử lý mỗi lượt')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('batch_size phải lớn hơn 0')
+        total = changed = 0
+        started = time.monotonic()
+        # Mỗi lượt một transaction ngắn, lặp đến khi không còn dòng đánh dấu
+        while PayrollDirty.objects.exists():
+            results = recalculate_dirty_payroll(options['batch_size'])
+            if not results:
+                break
+            total += len(results)
+            changed += sum(1 for r in results if r['changed'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Đã tính lại lương cho {total} nhân viên ({changed} thay đổi) trong {time.monotonic() - started:.2f}s'
+        ))
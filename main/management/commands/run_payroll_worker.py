@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from main.payroll_jobs import claim_next_chunk, run_chunk
+import time
+import traceback
+
+class Command(BaseCommand):
+    help = 'Chạy worker xử lý các tác vụ tính lương/gửi email bảng lương trong hàng đợi'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll_interval', type=float, default=2.0, help='Số giây chờ khi hàng đợi trống')
+        parser.add_argument('--once', action='store_true', help='Thoát khi hàng đợi trống')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Worker tính lương đang chạy...')
+        while True:
+            close_old_connections()
+            chunk = claim_next_chunk()
+            if chunk is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+
+            label = f"tác vụ #{chunk.id_job_id} ({chunk.id_job.get_loai_display()}), phòng ban {chunk.id_phong_ban_id or '-'}"
+            started = time.monotonic()
+            try:
+                results = run_chunk(chunk)
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f'Lỗi khi xử lý {label}: {str(e)}'))
+                self.stdout.write(self.style.ERROR(traceback.format_exc()))
+                continue
+
+            self.stdout.write(self.style.SUCCESS(
+                f'Đã xử lý {len(results)} nhân viên ({label}) trong {time.monotonic() - started:.2f}s'
+            ))
@@ -0,0 +1,196 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from main.models import (
+    KhuVuc, QuocGia, DiaDiem, CongViec, PhongBan, NhanVien, NguoiPhuThuoc, Attendance
+)
+from main.payroll_engine import calculate_work_hours
+from main.rollups import rebuild_attendance_rollups
+from datetime import datetime, timedelta
+from decimal import Decimal
+import io
+import random
+import time
+
+HO = ['Nguyễn', 'Trần', 'Lê', 'Phạm', 'Hoàng', 'Huỳnh', 'Phan', 'Vũ', 'Võ', 'Đặng', 'Bùi', 'Đỗ', 'Hồ', 'Ngô', 'Dương', 'Lý']
+TEN = ['An', 'Bình', 'Chi', 'Dũng', 'Giang', 'Hà', 'Hải', 'Hạnh', 'Hiếu', 'Hoa', 'Hùng', 'Hương', 'Khánh', 'Lan',
+       'Linh', 'Long', 'Mai', 'Minh', 'Nam', 'Ngọc', 'Phong', 'Phương', 'Quân', 'Sơn', 'Tâm', 'Thảo', 'Trang', 'Tuấn', 'Vy']
+QUAN_HE = ['Vợ', 'Chồng', 'Con', 'Con', 'Cha', 'Mẹ']
+
+KHU_VUC = {
+    'Châu Á': [('VN', 'Việt Nam', ['Hà Nội', 'Hồ Chí Minh', 'Đà Nẵng']), ('SG', 'Singapore', ['Singapore']), ('JP', 'Nhật Bản', ['Tokyo', 'Osaka'])],
+    'Châu Âu': [('DE', 'Đức', ['Berlin', 'Munich']), ('FR', 'Pháp', ['Paris'])],
+    'Châu Mỹ': [('US', 'Hoa Kỳ', ['New York', 'Seattle']), ('CA', 'Canada', ['Toronto'])],
+}
+PHONG_BAN = ['Kỹ thuật', 'Nhân sự', 'Kế toán', 'Kinh doanh', 'Marketing', 'Vận hành', 'Pháp chế', 'Chăm sóc khách hàng', 'Sản phẩm', 'Dữ liệu']
+CONG_VIEC = [
+    ('Giám đốc', 60000000, 150000000), ('Trưởng phòng', 35000000, 70000000), ('Trưởng nhóm', 25000000, 45000000),
+    ('Kỹ sư phần mềm', 15000000, 40000000), ('Kế toán viên', 10000000, 25000000), ('Chuyên viên nhân sự', 10000000, 22000000),
+    ('Nhân viên kinh doanh', 8000000, 30000000), ('Chuyên viên phân tích', 15000000, 35000000), ('Nhân viên hỗ trợ', 7000000, 15000000),
+]
+
+
+class Command(BaseCommand):
+    help = 'Sinh dữ liệu nhân sự giả (khu vực, phòng ban, nhân viên nhiều cấp, người phụ thuộc, chấm công nhiều năm) để đo hiệu năng'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--so_nhan_vien', type=int, default=1000, help='Số nhân viên')
+        parser.add_argument('--so_phong_ban', type=int, default=10, help='Số phòng ban')
+        parser.add_argument('--so_cap', type=int, default=5, help='Số cấp quản lý trong sơ đồ tổ chức')
+        parser.add_argument('--so_nam', type=float, default=1, help='Số năm dữ liệu chấm công tính đến hôm qua')
+        parser.add_argument('--ti_le_di_lam', type=float, default=0.95, help='Tỉ lệ ngày làm việc có chấm công')
+        parser.add_argument('--batch_size', type=int, default=5000, help='Số dòng mỗi lệnh ghi')
+        parser.add_argument('--seed', type=int, default=None, help='Seed sinh số ngẫu nhiên để dữ liệu lặp lại được')
+
+    def handle(self, *args, **options):
+        if options['so_nhan_vien'] < 1 or options['so_phong_ban'] < 1 or options['so_cap'] < 1:
+            raise CommandError('Số nhân viên, số phòng ban và số cấp phải lớn hơn 0')
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        started = time.monotonic()
+
+        with transaction.atomic():
+            phong_bans = self.seed_departments(options['so_phong_ban'])
+            cong_viecs = list(CongViec.objects.bulk_create(
+                CongViec(ten_cong_viec=ten, luong_toi_thieu=Decimal(thap), luong_toi_da=Decimal(cao))
+                for ten, thap, cao in CONG_VIEC
+            ))
+            nhan_viens = self.seed_employees(options['so_nhan_vien'], options['so_cap'], phong_bans, cong_viecs)
+            so_phu_thuoc = self.seed_dependents(nhan_viens)
+        self.stdout.write(
+            f'Đã tạo {len(phong_bans)} phòng ban, {len(nhan_viens)} nhân viên '
+            f'(ID {nhan_viens[0].pk} đến {nhan_viens[-1].pk}), {so_phu_thuoc} người phụ thuộc'
+        )
+
+        den_ngay = timezone.localdate() - timedelta(days=1)
+        tu_ngay = den_ngay - timedelta(days=int(365 * options['so_nam']))
+        so_cham_cong = self.seed_attendance(nhan_viens, tu_ngay, den_ngay, options['ti_le_di_lam'])
+        rebuild_attendance_rollups(tu_ngay, den_ngay)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Đã tạo {so_cham_cong} dòng chấm công từ {tu_ngay.strftime("%d/%m/%Y")} đến {den_ngay.strftime("%d/%m/%Y")} '
+            f'trong {time.monotonic() - started:.2f}s'
+        ))
+
+    def seed_departments(self, so_phong_ban):
+        """Khu vực, quốc gia, địa điểm và phòng ban; mỗi phòng ban đặt ở một thành phố"""
+        khu_vucs = KhuVuc.objects.bulk_create(KhuVuc(ten_khu_vuc=ten) for ten in KHU_VUC)
+        quoc_gias, thanh_phos = [], []
+        for khu_vuc, countries in zip(khu_vucs, KHU_VUC.values()):
+            for ma, ten, cities in countries:
+                quoc_gias.append(QuocGia(id_quoc_gia=ma, ten_quoc_gia=ten, id_khu_vuc=khu_vuc))
+                thanh_phos += [(ma, city) for city in cities]
+        QuocGia.objects.bulk_create(quoc_gias, ignore_conflicts=True)
+
+        dia_diems = DiaDiem.objects.bulk_create(
+            DiaDiem(
+                dia_chi_duong=f'{self.rng.randint(1, 300)} Đường số {self.rng.randint(1, 50)}',
+                ma_buu_dien=str(self.rng.randint(10000, 99999)),
+                thanh_pho=thanh_pho,
+                id_quoc_gia_id=ma,
+            )
+            for ma, thanh_pho in (self.rng.choice(thanh_phos) for _ in range(so_phong_ban))
+        )
+        return PhongBan.objects.bulk_create(
+            PhongBan(ten_phong_ban=f'{PHONG_BAN[i % len(PHONG_BAN)]} {i // len(PHONG_BAN) + 1}', id_dia_diem=dia_diem)
+            for i, dia_diem in enumerate(dia_diems)
+        )
+
+    def seed_employees(self, so_nhan_vien, so_cap, phong_bans, cong_viecs):
+        """
+        Tạo nhân viên theo từng cấp, cấp sau báo cáo cho một người ở cấp trước.
+
+        Số người mỗi cấp tăng theo cấp số nhân để cấp cuối là đông nhất; mỗi
+        cấp ghi bằng một bulk_create nên id_quan_ly luôn trỏ tới dòng đã có.
+        """
+        he_so = max(2, round(so_nhan_vien ** (1 / max(so_cap - 1, 1))))
+        levels = [1]
+        while sum(levels) < so_nhan_vien:
+            con_lai = so_nhan_vien - sum(levels)
+            levels.append(con_lai if len(levels) >= so_cap - 1 else min(levels[-1] * he_so, con_lai))
+
+        today = timezone.localdate()
+        nhan_viens, quan_lys = [], [None]
+        for cap, so_nguoi in enumerate(levels):
+            # Ba cấp đầu là giám đốc/trưởng phòng/trưởng nhóm, cấp cuối luôn là nhân viên
+            cong_viec_cap = cong_viecs[cap] if cap < min(3, len(levels) - 1) else None
+            level = []
+            for _ in range(so_nguoi):
+                quan_ly = self.rng.choice(quan_lys)
+                cong_viec = cong_viec_cap or self.rng.choice(cong_viecs[3:])
+                luong = self.rng.randint(int(cong_viec.luong_toi_thieu) // 100000, int(cong_viec.luong_toi_da) // 100000) * 100000
+                level.append(NhanVien(
+                    ho=self.rng.choice(HO),
+                    ten=self.rng.choice(TEN),
+                    email=f'nv{len(nhan_viens) + len(level) + 1}.{self.rng.randint(1000, 9999)}@example.com',
+                    so_dien_thoai=f'09{self.rng.randint(10000000, 99999999)}',
+                    ngay_thue=today - timedelta(days=self.rng.randint(30, 3650)),
+                    id_cong_viec=cong_viec,
+                    luong=Decimal(luong),
+                    id_quan_ly=quan_ly,
+                    # Cấp dưới ở cùng phòng ban với quản lý, trừ cấp cao nhất
+                    id_phong_ban=quan_ly.id_phong_ban if quan_ly and cap > 1 else self.rng.choice(phong_bans),
+                ))
+            quan_lys = NhanVien.objects.bulk_create(level, batch_size=self.batch_size)
+            nhan_viens += quan_lys
+        return nhan_viens
+
+    def seed_dependents(self, nhan_viens):
+        nguoi_phu_thuocs = [
+            NguoiPhuThuoc(ho=nhan_vien.ho, ten=self.rng.choice(TEN), quan_he=self.rng.choice(QUAN_HE), id_nhan_vien=nhan_vien)
+            for nhan_vien in nhan_viens
+            for _ in range(self.rng.choice((0, 0, 1, 1, 2, 3)))
+        ]
+        NguoiPhuThuoc.objects.bulk_create(nguoi_phu_thuocs, batch_size=self.batch_size)
+        return len(nguoi_phu_thuocs)
+
+    def seed_attendance(self, nhan_viens, tu_ngay, den_ngay, ti_le_di_lam):
+        """
+        Chấm công các ngày thứ 2 - thứ 6 từ ngày thuê (hoặc tu_ngay) đến den_ngay.
+
+        Giờ làm được tính bằng calculate_work_hours cho từng lô; trên Postgres
+        mỗi lô được ghi bằng COPY, database khác dùng bulk_create.
+        """
+        write = self.copy_attendance if connection.vendor == 'postgresql' else self.bulk_create_attendance
+        tz = timezone.get_current_timezone()
+        total = 0
+        batch = []
+        for nhan_vien in nhan_viens:
+            ngay = max(tu_ngay, nhan_vien.ngay_thue)
+            while ngay <= den_ngay:
+                if ngay.weekday() < 5 and self.rng.random() < ti_le_di_lam:
+                    check_in = datetime(ngay.year, ngay.month, ngay.day, 7, 30, tzinfo=tz) + timedelta(seconds=self.rng.randint(0, 5400))
+                    check_out = check_in + timedelta(seconds=self.rng.randint(4 * 3600, 10 * 3600))
+                    batch.append((nhan_vien.pk, ngay, check_in, check_out))
+                ngay += timedelta(days=1)
+            if len(batch) >= self.batch_size:
+                total += self.write_attendance(write, batch)
+                batch = []
+        if batch:
+            total += self.write_attendance(write, batch)
+        return total
+
+    def write_attendance(self, write, batch):
+        hours = calculate_work_hours([row[2] for row in batch], [row[3] for row in batch])
+        with transaction.atomic():
+            write([row + hour for row, hour in zip(batch, hours)])
+        return len(batch)
+
+    def bulk_create_attendance(self, rows):
+        Attendance.objects.bulk_create(
+            Attendance(id_nhan_vien_id=id_nhan_vien, ngay_lam=ngay_lam, check_in=check_in, check_out=check_out, gio_lam=gio_lam, ngay_cong=ngay_cong)
+            for id_nhan_vien, ngay_lam, check_in, check_out, gio_lam, ngay_cong in rows
+        )
+
+    def copy_attendance(self, rows):
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write('\t'.join(value.isoformat() if hasattr(value, 'isoformat') else str(value) for value in row))
+            buffer.write('\n')
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {Attendance._meta.db_table} (id_nhan_vien, ngay_lam, check_in, check_out, gio_lam, ngay_cong) FROM STDIN',
+                buffer
+            )
@@ -1,9 +1,9 @@
 from django.core.management.base import BaseCommand
-from django.core.mail import EmailMessage
-from django.conf import settings
-from django.template.loader import render_to_string
+from main.mailing import dispatch_payroll_emails
 from main.models import PayrollRecord
+from main.utils import month_range
 from datetime import datetime
+import time
 
 class Command(BaseCommand):
     help = 'Gửi email bảng lương cho nhân viên'
@@ -21,43 +21,32 @@ class Command(BaseCommand):
             now = datetime.now()
             month = datetime(now.year, now.month, 1).date()
 
+        start_date, end_date = month_range(month)
+
         # Email test
         test_email = options['test_email'] or 'hokhanhduong9204@gmail.com'
 
         # Lấy dữ liệu bảng lương
         payrolls = PayrollRecord.objects.select_related('id_nhan_vien').filter(
-            thang__year=month.year,
-            thang__month=month.month
+            thang__gte=start_date,
+            thang__lt=end_date
         )
 
-        # Gửi email cho từng nhân viên
-        for payroll in payrolls:
-            # Context cho template
-            context = {
-                'ho_ten': f"{payroll.id_nhan_vien.ho} {payroll.id_nhan_vien.ten}",
-                'thang': month.strftime('%m/%Y'),
-                'tong_ngay_lam': f"{payroll.tong_ngay_lam:.2f}",
-                'luong_thuc_nhan': f"{payroll.luong_thuc_nhan:,.0f}"
-            }
-
-            # Tạo nội dung email
-            html_content = render_to_string('email/payroll.html', context)
-
-            # Tạo email
-            email = EmailMessage(
-                subject=f'Bảng lương tháng {month.strftime("%m-%Y")}',
-                body=html_content,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                to=[test_email],  # Trong thực tế: payroll.id_nhan_vien.email
-            )
-            email.content_subtype = "html"  # Set để gửi dạng HTML
-
-            try:
-                email.send()
+        # Gửi song song, dùng lại kết nối SMTP (trong thực tế: bỏ test_email để gửi đến email nhân viên)
+        started = time.monotonic()
+        deliveries = dispatch_payroll_emails(payrolls, test_email)
+
+        sent = 0
+        for delivery in deliveries:
+            ho_ten = f"{delivery.id_payroll.id_nhan_vien.ho} {delivery.id_payroll.id_nhan_vien.ten}"
+            if delivery.trang_thai == 'sent':
+                sent += 1
+            else:
                 self.stdout.write(
-                    self.style.SUCCESS(f'Đã gửi email bảng lương cho {context["ho_ten"]}')
+                    self.style.ERROR(f'Lỗi gửi email cho {ho_ten}: {delivery.loi}')
                 )
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(f'Lỗi gửi email cho {context["ho_ten"]}: {str(e)}')
-                ) 
\ No newline at end of file
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Đã gửi {sent}/{len(deliveries)} email bảng lương tháng {month.strftime("%m/%Y")} '
+            f'trong {time.monotonic() - started:.2f}s'
+        ))
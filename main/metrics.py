@@ -0,0 +1,286 @@
+"""
+Số liệu vận hành theo định dạng text của Prometheus, đọc qua /metrics.
+
+Mỗi tiến trình giữ counter/histogram trong bộ nhớ. Khi đặt METRICS_DIR
+(thư mục dùng chung cho mọi worker Gunicorn, xóa trắng trước khi khởi động),
+mỗi tiến trình định kỳ ghi số liệu của mình ra metrics-<pid>.json và /metrics
+cộng dồn các file này, nên scrape vào worker nào cũng thấy số liệu của cả
+server. Các tỉ lệ thường xem (cache hit, nhân viên/giây, dòng xuất/giây)
+được tính sẵn thành gauge để chỉ cần scrape là kiểm tra được.
+"""
+import atexit
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .075, .1, .25, .5, .75, 1, 2.5, 5, 7.5, 10)
+LONG_BUCKETS = (.1, .5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+_lock = threading.Lock()
+_registry = {}
+_collectors = []
+_last_flush = 0.0
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}  # Giá trị nhãn (tuple) -> số liệu
+        _registry[name] = self
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} cần đúng các nhãn: {", ".join(self.labelnames)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        _maybe_flush()
+
+    @staticmethod
+    def merge(a, b):
+        return a + b
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            # [số lần rơi vào từng bucket (không cộng dồn, cuối cùng là +Inf), tổng, số lần]
+            data = self.values.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0, 0])
+            data[bisect_left(self.buckets, value)] += 1
+            data[-2] += value
+            data[-1] += 1
+        _maybe_flush()
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    @staticmethod
+    def merge(a, b):
+        return [x + y for x, y in zip(a, b)] if len(a) == len(b) else a
+
+
+def register_collector(func):
+    """
+    Đăng ký hàm sinh gauge lúc scrape: func(totals) trả về danh sách
+    (tên, mô tả, [(dict nhãn, giá trị)]); ``totals`` là số liệu đã cộng dồn.
+    """
+    _collectors.append(func)
+    return func
+
+
+# Các số liệu của API nhân sự
+PUNCHES = Counter('hr_punches_total', 'Số lượt chấm công đã xử lý', ('loai', 'ket_qua'))
+PUNCH_DURATION = Histogram('hr_punch_duration_seconds', 'Thời gian xử lý một lượt check-in/check-out', ('loai',))
+PAYROLL_RUN_DURATION = Histogram('hr_payroll_run_duration_seconds', 'Thời gian một lần tính lương tháng', buckets=LONG_BUCKETS)
+PAYROLL_EMPLOYEES = Counter('hr_payroll_employees_total', 'Số nhân viên đã tính lương')
+EXPORT_ROWS = Counter('hr_export_rows_total', 'Số dòng đã xuất ra file', ('dinh_dang',))
+EXPORT_DURATION = Histogram('hr_export_duration_seconds', 'Thời gian ghi một file xuất', ('dinh_dang',), buckets=LONG_BUCKETS)
+PAYROLL_EMAILS = Counter('hr_payroll_emails_total', 'Số email bảng lương đã gửi/lỗi', ('trang_thai',))
+CACHE_REQUESTS = Counter('hr_cache_requests_total', 'Số lần đọc cache', ('cache', 'ket_qua'))
+DB_CONNECTIONS_OPENED = Counter('hr_db_connections_opened_total', 'Số kết nối database đã mở', ('alias',))
+REPORTING_READS = Counter(
+    'hr_reporting_reads_total', 'Số báo cáo theo database được đọc (ly_do=tre/loi: database báo cáo trễ/lỗi, đọc primary)',
+    ('database', 'ly_do')
+)
+
+
+def record_cache(cache, hits, misses):
+    """Đếm cache hit/miss của một lần đọc (get hoặc get_many)"""
+    if hits:
+        CACHE_REQUESTS.inc(hits, cache=cache, ket_qua='hit')
+    if misses:
+        CACHE_REQUESTS.inc(misses, cache=cache, ket_qua='miss')
+
+
+def _snapshot():
+    with _lock:
+        return {
+            name: [[list(key), list(value) if isinstance(value, list) else value] for key, value in metric.values.items()]
+            for name, metric in _registry.items()
+        }
+
+
+def _file_path(pid):
+    return os.path.join(settings.METRICS_DIR, f'metrics-{pid}.json')
+
+
+def flush():
+    """Ghi số liệu của tiến trình này ra METRICS_DIR (ghi đè nguyên tử)"""
+    global _last_flush
+    if not settings.METRICS_DIR:
+        return
+    _last_flush = time.monotonic()
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=settings.METRICS_DIR, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(_snapshot(), f)
+    os.replace(tmp_path, _file_path(os.getpid()))
+
+
+def _maybe_flush():
+    if settings.METRICS_DIR and time.monotonic() - _last_flush >= settings.METRICS_FLUSH_INTERVAL:
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+@atexit.register
+def _flush_at_exit():
+    if settings.METRICS_DIR:
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+def collect():
+    """Số liệu của tiến trình này cộng với file của các tiến trình khác trong METRICS_DIR"""
+    totals = {name: {tuple(key): value for key, value in values} for name, values in _snapshot().items()}
+    if settings.METRICS_DIR and os.path.isdir(settings.METRICS_DIR):
+        own = os.path.basename(_file_path(os.getpid()))
+        for filename in os.listdir(settings.METRICS_DIR):
+            if not filename.startswith('metrics-') or not filename.endswith('.json') or filename == own:
+                continue
+            try:
+                with open(os.path.join(settings.METRICS_DIR, filename)) as f:
+                    other = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, values in other.items():
+                metric = _registry.get(name)
+                if metric is None:
+                    continue
+                merged = totals.setdefault(name, {})
+                for key, value in values:
+                    key = tuple(key)
+                    merged[key] = metric.merge(merged[key], value) if key in merged else value
+    return totals
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+def render_metrics():
+    """Toàn bộ số liệu theo định dạng text 0.0.4 của Prometheus"""
+    totals = collect()
+    lines = []
+    for name, metric in _registry.items():
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        for key, value in sorted(totals.get(name, {}).items()):
+            labels = dict(zip(metric.labelnames, key))
+            if metric.kind == 'counter':
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets + (float('inf'),), value[:-2]):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels({**labels, "le": _format_value(bound)})} {_format_value(cumulative)}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(value[-2])}')
+            lines.append(f'{name}_count{_format_labels(labels)} {_format_value(value[-1])}')
+
+    for collector in _collectors:
+        for name, documentation, samples in collector(totals):
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} gauge')
+            for labels, value in samples:
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+@register_collector
+def _ratios(totals):
+    """Các tỉ lệ tính từ counter/histogram đã cộng dồn"""
+    cache = {}
+    for (name, ket_qua), value in totals.get(CACHE_REQUESTS.name, {}).items():
+        cache.setdefault(name, {})[ket_qua] = value
+    hit_ratio = [
+        ({'cache': name}, counts.get('hit', 0) / (counts.get('hit', 0) + counts.get('miss', 0)))
+        for name, counts in sorted(cache.items())
+    ]
+
+    payroll = totals.get(PAYROLL_RUN_DURATION.name, {}).get(())
+    employees = totals.get(PAYROLL_EMPLOYEES.name, {}).get((), 0)
+    payroll_rate = [({}, employees / payroll[-2])] if payroll and payroll[-2] else []
+
+    export_rate = [
+        ({'dinh_dang': key[0]}, totals.get(EXPORT_ROWS.name, {}).get(key, 0) / value[-2])
+        for key, value in sorted(totals.get(EXPORT_DURATION.name, {}).items()) if value[-2]
+    ]
+    return [
+        ('hr_cache_hit_ratio', 'Tỉ lệ cache hit từ khi khởi động', hit_ratio),
+        ('hr_payroll_employees_per_second', 'Số nhân viên tính lương mỗi giây (trung bình các lần chạy)', payroll_rate),
+        ('hr_export_rows_per_second', 'Số dòng xuất mỗi giây (trung bình các lần xuất)', export_rate),
+    ]
+
+
+@register_collector
+def _db_connections(totals):
+    """
+    Số kết nối tới từng database Postgres theo trạng thái (active, idle, ...),
+    đọc từ pg_stat_activity nên gồm kết nối của mọi ứng dụng dùng database đó,
+    không chỉ của tiến trình này. Database không kết nối được thì bỏ qua.
+    """
+    samples = []
+    for alias in connections:
+        connection = connections[alias]
+        if connection.vendor != 'postgresql':
+            continue
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT COALESCE(state, 'unknown'), COUNT(*) FROM pg_stat_activity "
+                    "WHERE datname = current_database() GROUP BY 1"
+                )
+                rows = cursor.fetchall()
+        except DatabaseError:
+            logger.warning('Không đọc được pg_stat_activity của database %s', alias, exc_info=True)
+            continue
+        samples += [({'alias': alias, 'state': state}, count) for state, count in rows]
+    return [('hr_db_connections', 'Số kết nối tới database (mọi ứng dụng, theo pg_stat_activity) theo trạng thái', samples)]
@@ -0,0 +1,54 @@
+# Generated by Django 5.0.14 on 2026-10-18 17:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0002_alter_attendance_options_alter_congviec_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayrollJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('thang', models.DateField()),
+                ('trang_thai', models.CharField(choices=[('pending', 'Đang chờ'), ('running', 'Đang chạy'), ('done', 'Hoàn thành'), ('failed', 'Lỗi')], default='pending', max_length=10)),
+                ('tong_so_nhan_vien', models.IntegerField(default=0)),
+                ('so_nhan_vien_xong', models.IntegerField(default=0)),
+                ('loi', models.TextField(blank=True, null=True)),
+                ('ngay_tao', models.DateTimeField(auto_now_add=True)),
+                ('bat_dau', models.DateTimeField(blank=True, null=True)),
+                ('ket_thuc', models.DateTimeField(blank=True, null=True)),
+                ('id_nhan_vien', models.ForeignKey(blank=True, db_column='id_nhan_vien', null=True, on_delete=django.db.models.deletion.CASCADE, to='main.nhanvien')),
+            ],
+            options={
+                'verbose_name': 'Tác vụ tính lương',
+                'verbose_name_plural': 'Tác vụ tính lương',
+                'db_table': 'payroll_job',
+                'ordering': ['-ngay_tao'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PayrollJobChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trang_thai', models.CharField(choices=[('pending', 'Đang chờ'), ('running', 'Đang chạy'), ('done', 'Hoàn thành'), ('failed', 'Lỗi')], default='pending', max_length=10)),
+                ('so_nhan_vien', models.IntegerField(default=0)),
+                ('loi', models.TextField(blank=True, null=True)),
+                ('bat_dau', models.DateTimeField(blank=True, null=True)),
+                ('ket_thuc', models.DateTimeField(blank=True, null=True)),
+                ('id_job', models.ForeignKey(db_column='id_job', on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='main.payrolljob')),
+                ('id_phong_ban', models.ForeignKey(blank=True, db_column='id_phong_ban', null=True, on_delete=django.db.models.deletion.CASCADE, to='main.phongban')),
+            ],
+            options={
+                'verbose_name': 'Phần việc tính lương',
+                'verbose_name_plural': 'Phần việc tính lương',
+                'db_table': 'payroll_job_chunk',
+                'ordering': ['id'],
+            },
+        ),
+    ]
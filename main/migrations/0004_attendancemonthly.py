@@ -0,0 +1,60 @@
+# Generated by Django 5.0.14 on 2026-10-18 17:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+
+def populate_rollups(apps, schema_editor):
+    Attendance = apps.get_model('main', 'Attendance')
+    AttendanceMonthly = apps.get_model('main', 'AttendanceMonthly')
+    rows = Attendance.objects.annotate(thang=TruncMonth('ngay_lam')).order_by().values(
+        'id_nhan_vien', 'thang'
+    ).annotate(
+        tong_ngay_cong=Sum('ngay_cong'),
+        tong_gio_lam=Sum('gio_lam'),
+        so_ngay=Count('id')
+    )
+    AttendanceMonthly.objects.bulk_create(
+        [
+            AttendanceMonthly(
+                id_nhan_vien_id=row['id_nhan_vien'],
+                thang=row['thang'],
+                tong_ngay_cong=row['tong_ngay_cong'] or 0,
+                tong_gio_lam=row['tong_gio_lam'] or 0,
+                so_ngay=row['so_ngay'],
+            )
+            for row in rows
+        ],
+        batch_size=2000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0003_payrolljob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceMonthly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('thang', models.DateField()),
+                ('tong_ngay_cong', models.DecimalField(decimal_places=2, default=0, max_digits=6)),
+                ('tong_gio_lam', models.DecimalField(decimal_places=2, default=0, max_digits=7)),
+                ('so_ngay', models.IntegerField(default=0)),
+                ('id_nhan_vien', models.ForeignKey(db_column='id_nhan_vien', on_delete=django.db.models.deletion.CASCADE, to='main.nhanvien')),
+            ],
+            options={
+                'verbose_name': 'Tổng hợp chấm công tháng',
+                'verbose_name_plural': 'Tổng hợp chấm công tháng',
+                'db_table': 'attendance_monthly',
+                'ordering': ['-thang'],
+                'unique_together': {('id_nhan_vien', 'thang')},
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.14 on 2026-10-18 17:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0004_attendancemonthly'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['ngay_lam', 'id_nhan_vien'], include=('ngay_cong', 'gio_lam'), name='attendance_ngay_nv_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payrollrecord',
+            index=models.Index(fields=['thang', 'id_nhan_vien'], include=('tong_ngay_lam', 'luong_thuc_nhan'), name='payroll_thang_nv_idx'),
+        ),
+    ]
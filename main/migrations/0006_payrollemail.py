@@ -0,0 +1,43 @@
+# Generated by Django 5.0.14 on 2026-10-18 17:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0005_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payrolljob',
+            name='email_nhan',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='payrolljob',
+            name='loai',
+            field=models.CharField(choices=[('tinh_luong', 'Tính lương'), ('gui_email', 'Gửi email bảng lương')], default='tinh_luong', max_length=10),
+        ),
+        migrations.CreateModel(
+            name='PayrollEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email_nhan', models.CharField(blank=True, max_length=100, null=True)),
+                ('trang_thai', models.CharField(choices=[('pending', 'Đang chờ'), ('sent', 'Đã gửi'), ('failed', 'Lỗi')], default='pending', max_length=10)),
+                ('so_lan_thu', models.IntegerField(default=0)),
+                ('loi', models.TextField(blank=True, null=True)),
+                ('ngay_tao', models.DateTimeField(auto_now_add=True)),
+                ('ngay_gui', models.DateTimeField(blank=True, null=True)),
+                ('id_payroll', models.ForeignKey(db_column='id_payroll', on_delete=django.db.models.deletion.CASCADE, related_name='emails', to='main.payrollrecord')),
+            ],
+            options={
+                'verbose_name': 'Email bảng lương',
+                'verbose_name_plural': 'Email bảng lương',
+                'db_table': 'payroll_email',
+                'ordering': ['-ngay_tao'],
+            },
+        ),
+    ]
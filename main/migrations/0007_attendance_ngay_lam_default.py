@@ -0,0 +1,19 @@
+# Generated by Django 5.0.14 on 2026-10-18 17:22
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0006_payrollemail'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='attendance',
+            name='ngay_lam',
+            field=models.DateField(default=datetime.date.today, editable=False),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.14 on 2026-10-18 17:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_attendance_ngay_lam_default'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['ngay_lam', 'id'], name='attendance_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payrollrecord',
+            index=models.Index(fields=['thang', 'id'], name='payroll_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.14 on 2026-10-18 17:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='nhanvien',
+            index=models.Index(fields=['ten', 'ho'], name='nhan_vien_ten_ho_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='nhanvien',
+            index=models.Index(fields=['ho', 'ten'], name='nhan_vien_ho_ten_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='nhanvien',
+            index=models.Index(fields=['ngay_thue'], name='nhan_vien_ngay_thue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='nhanvien',
+            index=models.Index(fields=['luong'], name='nhan_vien_luong_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.14 on 2026-10-18 17:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_nhanvien_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayrollDirty',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('thang', models.DateField()),
+                ('ngay_danh_dau', models.DateTimeField()),
+                ('id_nhan_vien', models.ForeignKey(db_column='id_nhan_vien', on_delete=django.db.models.deletion.CASCADE, to='main.nhanvien')),
+            ],
+            options={
+                'verbose_name': 'Bảng lương cần tính lại',
+                'verbose_name_plural': 'Bảng lương cần tính lại',
+                'db_table': 'payroll_dirty',
+                'unique_together': {('id_nhan_vien', 'thang')},
+            },
+        ),
+    ]
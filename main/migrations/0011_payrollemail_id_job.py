@@ -0,0 +1,23 @@
+# Generated by Django 5.0.14 on 2026-10-18 18:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_payrolldirty'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payrollemail',
+            name='id_job',
+            field=models.ForeignKey(blank=True, db_column='id_job', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='emails', to='main.payrolljob'),
+        ),
+        migrations.AddConstraint(
+            model_name='payrollemail',
+            constraint=models.UniqueConstraint(fields=('id_job', 'id_payroll'), name='payroll_email_job_payroll_uniq'),
+        ),
+    ]
@@ -0,0 +1,200 @@
+import hashlib
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from . import metrics
+from .caching import get_api_cache, get_model_versions
+from .db_routers import read_for_reporting, read_from_replica
+from .profiling import profile_section
+
+
+class QueryPlan:
+    """
+    Các quan hệ cần nạp sẵn cho queryset mà một action sẽ serialize.
+
+    ``model`` chỉ cần khai báo khi action serialize một model khác với model
+    của viewset (VD: PhongBanViewSet.employees trả về NhanVien); khi đó plan
+    không được áp dụng cho queryset của viewset (get_object, ...).
+    """
+
+    def __init__(self, select_related=(), prefetch_related=(), model=None):
+        self.select_related = tuple(select_related)
+        self.prefetch_related = tuple(prefetch_related)
+        self.model = model
+
+    def apply(self, queryset):
+        if self.model is not None and queryset.model is not self.model:
+            return queryset
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
+        return queryset
+
+
+class QueryPlanMixin:
+    """
+    Áp dụng query plan khai báo theo từng action để tránh truy vấn N+1.
+
+    ``query_plans`` là dict {tên action: QueryPlan}; khóa ``'*'`` là plan mặc
+    định cho các action không khai báo riêng.
+    """
+    query_plans = {}
+
+    def get_query_plan(self):
+        return self.query_plans.get(self.action, self.query_plans.get('*', QueryPlan()))
+
+    def get_queryset(self):
+        return self.get_query_plan().apply(super().get_queryset())
+
+
+class ResponseCacheMixin:
+    """
+    Cache response của action list/retrieve cho dữ liệu danh mục ít thay đổi.
+
+    Khóa cache gồm URL, định dạng trả về và phiên bản của các model trong
+    ``cache_models`` (mặc định là model của viewset), không phụ thuộc người
+    dùng. Phiên bản được đổi bởi signal post_save/post_delete nên không cần
+    xóa cache khi ghi. Response có ETag, client gửi lại If-None-Match trùng
+    thì nhận 304 mà không cần đọc cache hay database.
+    """
+    cache_models = ()
+
+    def get_cache_models(self):
+        return self.cache_models or (self.queryset.model,)
+
+    def get_cache_key(self, request):
+        versions = get_model_versions(self.get_cache_models())
+        raw = '|'.join([request.build_absolute_uri(), request.accepted_renderer.format, *versions])
+        return f"api:{hashlib.sha1(raw.encode()).hexdigest()}"
+
+    def cached_response(self, view, request, *args, **kwargs):
+        key = self.get_cache_key(request)
+        etag = f'"{key[4:]}"'
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+        if_none_match = request.headers.get('If-None-Match', '')
+        if etag in [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        cache = get_api_cache()
+        data = cache.get(key)
+        metrics.record_cache('api', data is not None, data is None)
+        if data is not None:
+            return Response(data, headers=headers)
+
+        response = view(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, settings.API_CACHE_TIMEOUT)
+            for name, value in headers.items():
+                response[name] = value
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+
+class SparseFieldsMixin:
+    """
+    Cho phép client chọn cột trả về bằng ``?fields=a,b,c``.
+
+    Queryset chỉ đọc các cột cần thiết (``.only()``) và chỉ join/prefetch các
+    quan hệ mà những field được chọn dùng tới; serializer (kế thừa
+    SparseFieldsetSerializerMixin) bỏ các field còn lại.
+    ``sparse_field_sources`` khai báo cột ORM của các field không phải cột
+    trực tiếp của model, ``sparse_field_prefetch`` khai báo field cần prefetch.
+    """
+    fields_query_param = 'fields'
+    sparse_field_sources = {}
+    sparse_field_prefetch = {}
+
+    def get_sparse_fields(self):
+        if hasattr(self, '_sparse_fields'):
+            return self._sparse_fields
+        raw = self.request.query_params.get(self.fields_query_param) if self.request else None
+        self._sparse_fields = None
+        if raw:
+            fields = [f.strip() for f in raw.split(',') if f.strip()]
+            allowed = list(self.get_serializer_class()().fields)
+            invalid = [f for f in fields if f not in allowed]
+            if invalid or not fields:
+                raise ValidationError({'error': f'fields chỉ nhận: {", ".join(allowed)}'})
+            self._sparse_fields = fields
+        return self._sparse_fields
+
+    def get_sparse_queryset(self, queryset, fields):
+        model_fields = {f.name: f for f in queryset.model._meta.concrete_fields}
+        only = [queryset.model._meta.pk.name]
+        select_related = set()
+        prefetch = []
+        for field in fields:
+            if field in self.sparse_field_prefetch:
+                prefetch.append(self.sparse_field_prefetch[field])
+                continue
+            for path in self.sparse_field_sources.get(field, (field,)):
+                if path in model_fields or '__' in path:
+                    only.append(path)
+                if '__' in path:
+                    select_related.add(path.rsplit('__', 1)[0])
+        queryset = queryset.select_related(None).prefetch_related(None).only(*only)
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        return queryset
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields = self.get_sparse_fields() if self.action in ('list', 'retrieve') else None
+        if fields:
+            queryset = self.get_sparse_queryset(queryset, fields)
+        return queryset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action in ('list', 'retrieve'):
+            context['fields'] = self.get_sparse_fields()
+        return context
+
+
+
+class ProfilingMixin:
+    """
+    Đo thời gian serialize của viewset (kể cả truy vấn lazy phát sinh khi
+    serialize), hiện trong Server-Timing của RequestProfilingMiddleware.
+    """
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        to_representation = serializer.to_representation
+
+        def timed_to_representation(instance):
+            with profile_section('serializer'):
+                return to_representation(instance)
+
+        serializer.to_representation = timed_to_representation
+        return serializer
+
+
+class ReplicaReadMixin:
+    """
+    Request GET tới action trong ``replica_actions`` (liệt kê) đọc từ replica,
+    tới action trong ``reporting_actions`` (báo cáo nặng) đọc từ database báo
+    cáo; các action khác và mọi lệnh ghi dùng primary. Xem main.db_routers.
+    """
+    replica_actions = ('list',)
+    reporting_actions = ()
+
+    def dispatch(self, request, *args, **kwargs):
+        action = self.action_map.get(request.method.lower()) if request.method == 'GET' else None
+        if action in self.reporting_actions:
+            with read_for_reporting():
+                return super().dispatch(request, *args, **kwargs)
+        if action in self.replica_actions:
+            with read_from_replica():
+                return super().dispatch(request, *args, **kwargs)
+        return super().dispatch(request, *args, **kwargs)
@@ -1,8 +1,14 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
-from decimal import Decimal
 import datetime
-from django.db.models import Sum
+from .db_routers import reporting_database
+
+
+class ReportingQuerySet(models.QuerySet):
+    def using_reporting(self):
+        """Đọc từ database báo cáo (replica), tự quay về primary khi replica trễ quá mức cho phép"""
+        return self.using(reporting_database())
+
 
 class KhuVuc(models.Model):
     id_khu_vuc = models.AutoField(primary_key=True)
@@ -71,8 +77,26 @@ class NhanVien(models.Model):
     
     class Meta:
         db_table = 'nhan_vien'
+        indexes = [
+            # Lọc/sắp xếp danh sách nhân viên (?ordering=, ?ngay_thue_tu=, ?luong_tu=)
+            models.Index(fields=['ten', 'ho'], name='nhan_vien_ten_ho_idx'),
+            models.Index(fields=['ho', 'ten'], name='nhan_vien_ho_ten_idx'),
+            models.Index(fields=['ngay_thue'], name='nhan_vien_ngay_thue_idx'),
+            models.Index(fields=['luong'], name='nhan_vien_luong_idx'),
+        ]
         verbose_name = 'Nhân viên'
         verbose_name_plural = 'Nhân viên'
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Ghi nhớ quản lý/họ tên đang lưu trong DB để biết khi nào sơ đồ tổ chức thay đổi
+        instance._org_chart_state = instance._get_org_chart_state()
+        return instance
+    
+    def _get_org_chart_state(self):
+        values = self.__dict__
+        return (values.get('id_quan_ly_id'), values.get('ho'), values.get('ten'))
 
 class NguoiPhuThuoc(models.Model):
     id_nguoi_phu_thuoc = models.AutoField(primary_key=True)
@@ -88,30 +112,92 @@ class NguoiPhuThuoc(models.Model):
 
 class Attendance(models.Model):
     id_nhan_vien = models.ForeignKey(NhanVien, on_delete=models.CASCADE, db_column='id_nhan_vien')
-    ngay_lam = models.DateField(auto_now_add=True)
+    ngay_lam = models.DateField(default=datetime.date.today, editable=False)  # Nhập hàng loạt có thể ghi ngày khác
     check_in = models.DateTimeField(null=True, blank=True)
     check_out = models.DateTimeField(null=True, blank=True)
     gio_lam = models.DecimalField(max_digits=4, decimal_places=2, null=True, blank=True)
     ngay_cong = models.DecimalField(max_digits=4, decimal_places=2, null=True, blank=True)
     
+    objects = ReportingQuerySet.as_manager()
+    
     class Meta:
         db_table = 'attendance'
         unique_together = ('id_nhan_vien', 'ngay_lam')
+        indexes = [
+            # Quét chấm công theo khoảng ngày (tổng hợp tháng, xuất file) mà không cần đọc bảng
+            models.Index(fields=['ngay_lam', 'id_nhan_vien'], include=['ngay_cong', 'gio_lam'], name='attendance_ngay_nv_idx'),
+            # Phân trang keyset của /api/attendance/ theo (ngay_lam, id)
+            models.Index(fields=['ngay_lam', 'id'], name='attendance_keyset_idx'),
+        ]
         ordering = ['-ngay_lam']
         verbose_name = 'Chấm công'
         verbose_name_plural = 'Chấm công'
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Ghi nhớ giá trị đang lưu trong DB để cập nhật bảng tổng hợp theo chênh lệch
+        instance._rollup_state = instance._get_rollup_state()
+        return instance
+    
+    def _get_rollup_state(self):
+        values = self.__dict__
+        if 'ngay_lam' not in values or 'ngay_cong' not in values or 'gio_lam' not in values:
+            return None
+        return (self.id_nhan_vien_id, self.ngay_lam, self.ngay_cong or 0, self.gio_lam or 0)
+    
     def save(self, *args, **kwargs):
         # Tự động tính gio_lam và ngay_cong khi có check_out
         if self.check_in and self.check_out:
-            time_diff = self.check_out - self.check_in
-            self.gio_lam = Decimal(str(time_diff.total_seconds() / 3600))
-            self.ngay_cong = round(self.gio_lam / 8, 2)
-        super().save(*args, **kwargs)
+            from .payroll_engine import calculate_work_hours
+            [(self.gio_lam, self.ngay_cong)] = calculate_work_hours([self.check_in], [self.check_out])
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self._update_rollup()
+    
+    def _update_rollup(self):
+        from .rollups import apply_attendance_delta, refresh_attendance_rollup
+        
+        old = getattr(self, '_rollup_state', None)
+        new = self._get_rollup_state()
+        self._rollup_state = new
+        if old == new:
+            return
+        if new is None:
+            refresh_attendance_rollup(self.id_nhan_vien_id, self.ngay_lam)
+            return
+        
+        id_nhan_vien, ngay_lam, ngay_cong, gio_lam = new
+        if old is None:
+            apply_attendance_delta(id_nhan_vien, ngay_lam, ngay_cong, gio_lam, 1)
+        elif (old[0], old[1].year, old[1].month) == (id_nhan_vien, ngay_lam.year, ngay_lam.month):
+            apply_attendance_delta(id_nhan_vien, ngay_lam, ngay_cong - old[2], gio_lam - old[3], 0)
+        else:
+            apply_attendance_delta(old[0], old[1], -old[2], -old[3], -1)
+            apply_attendance_delta(id_nhan_vien, ngay_lam, ngay_cong, gio_lam, 1)
     
     def __str__(self):
         return f"{self.id_nhan_vien.ho} {self.id_nhan_vien.ten} - {self.ngay_lam}"
 
+
+class AttendanceMonthly(models.Model):
+    """Bảng tổng hợp chấm công theo (nhân viên, tháng), cập nhật khi lưu Attendance"""
+    id_nhan_vien = models.ForeignKey(NhanVien, on_delete=models.CASCADE, db_column='id_nhan_vien')
+    thang = models.DateField()  # Lưu ngày đầu tháng
+    tong_ngay_cong = models.DecimalField(max_digits=6, decimal_places=2, default=0)
+    tong_gio_lam = models.DecimalField(max_digits=7, decimal_places=2, default=0)
+    so_ngay = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'attendance_monthly'
+        unique_together = ('id_nhan_vien', 'thang')
+        ordering = ['-thang']
+        verbose_name = 'Tổng hợp chấm công tháng'
+        verbose_name_plural = 'Tổng hợp chấm công tháng'
+    
+    def __str__(self):
+        return f"{self.id_nhan_vien_id} - {self.thang.strftime('%m/%Y')}"
+
 class PayrollRecord(models.Model):
     id_nhan_vien = models.ForeignKey(NhanVien, on_delete=models.CASCADE, db_column='id_nhan_vien')
     thang = models.DateField()  # Lưu ngày đầu tháng
@@ -119,24 +205,27 @@ class PayrollRecord(models.Model):
     luong_thuc_nhan = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     ngay_tinh = models.DateTimeField(auto_now_add=True)
     
+    objects = ReportingQuerySet.as_manager()
+    
     class Meta:
         db_table = 'payrollrecord'
         unique_together = ('id_nhan_vien', 'thang')
+        indexes = [
+            # Bảng lương của cả tháng (xuất Excel, gửi email, theo phòng ban)
+            models.Index(fields=['thang', 'id_nhan_vien'], include=['tong_ngay_lam', 'luong_thuc_nhan'], name='payroll_thang_nv_idx'),
+            # Phân trang keyset của /api/payroll/ theo (thang, id)
+            models.Index(fields=['thang', 'id'], name='payroll_keyset_idx'),
+        ]
         ordering = ['-thang']
         verbose_name = 'Bảng lương'
         verbose_name_plural = 'Bảng lương'
     
     def calculate_total_days(self):
-        # Lấy tháng và năm từ trường thang
-        month = self.thang.month
-        year = self.thang.year
-        
-        # Tính tổng số ngày công từ bảng Attendance
-        total_days = Attendance.objects.filter(
+        # Lấy tổng số ngày công từ bảng tổng hợp chấm công theo tháng
+        total_days = AttendanceMonthly.objects.filter(
             id_nhan_vien=self.id_nhan_vien,
-            ngay_lam__year=year,
-            ngay_lam__month=month
-        ).aggregate(total=Sum('ngay_cong'))['total'] or 0
+            thang=self.thang.replace(day=1)
+        ).values_list('tong_ngay_cong', flat=True).first() or 0
         
         return total_days
     
@@ -146,9 +235,112 @@ class PayrollRecord(models.Model):
         
         # Tính lương thực nhận dựa trên số ngày làm
         if self.tong_ngay_lam > 0:
-            self.luong_thuc_nhan = round(self.tong_ngay_lam * (self.id_nhan_vien.luong / 22), 2)
+            from .payroll_engine import calculate_net_salary
+            self.luong_thuc_nhan = calculate_net_salary(self.tong_ngay_lam, self.id_nhan_vien.luong)
         
         super().save(*args, **kwargs)
     
     def __str__(self):
-        return f"{self.id_nhan_vien.ho} {self.id_nhan_vien.ten} - {self.thang.strftime('%m/%Y')}"
\ No newline at end of file
+        return f"{self.id_nhan_vien.ho} {self.id_nhan_vien.ten} - {self.thang.strftime('%m/%Y')}"
+
+class PayrollDirty(models.Model):
+    """(Nhân viên, tháng) đã có bảng lương nhưng chấm công thay đổi sau đó, cần tính lại"""
+    id_nhan_vien = models.ForeignKey(NhanVien, on_delete=models.CASCADE, db_column='id_nhan_vien')
+    thang = models.DateField()  # Lưu ngày đầu tháng
+    ngay_danh_dau = models.DateTimeField()
+    
+    class Meta:
+        db_table = 'payroll_dirty'
+        unique_together = ('id_nhan_vien', 'thang')
+        verbose_name = 'Bảng lương cần tính lại'
+        verbose_name_plural = 'Bảng lương cần tính lại'
+    
+    def __str__(self):
+        return f"{self.id_nhan_vien_id} - {self.thang.strftime('%m/%Y')}"
+
+class PayrollJob(models.Model):
+    TRANG_THAI_CHOICES = [
+        ('pending', 'Đang chờ'),
+        ('running', 'Đang chạy'),
+        ('done', 'Hoàn thành'),
+        ('failed', 'Lỗi'),
+    ]
+
+    LOAI_CHOICES = [
+        ('tinh_luong', 'Tính lương'),
+        ('gui_email', 'Gửi email bảng lương'),
+    ]
+
+    loai = models.CharField(max_length=10, choices=LOAI_CHOICES, default='tinh_luong')
+    thang = models.DateField()  # Lưu ngày đầu tháng
+    id_nhan_vien = models.ForeignKey(NhanVien, on_delete=models.CASCADE, null=True, blank=True, db_column='id_nhan_vien')
+    email_nhan = models.CharField(max_length=100, null=True, blank=True)  # Gửi tất cả email về địa chỉ này (demo/test)
+    trang_thai = models.CharField(max_length=10, choices=TRANG_THAI_CHOICES, default='pending')
+    tong_so_nhan_vien = models.IntegerField(default=0)
+    so_nhan_vien_xong = models.IntegerField(default=0)
+    loi = models.TextField(null=True, blank=True)
+    ngay_tao = models.DateTimeField(auto_now_add=True)
+    bat_dau = models.DateTimeField(null=True, blank=True)
+    ket_thuc = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'payroll_job'
+        ordering = ['-ngay_tao']
+        verbose_name = 'Tác vụ tính lương'
+        verbose_name_plural = 'Tác vụ tính lương'
+
+    def __str__(self):
+        return f"{self.get_loai_display()} {self.thang.strftime('%m/%Y')} - {self.get_trang_thai_display()}"
+
+
+class PayrollJobChunk(models.Model):
+    id_job = models.ForeignKey(PayrollJob, on_delete=models.CASCADE, related_name='chunks', db_column='id_job')
+    # Mỗi phần việc tính lương cho một phòng ban (null = nhân viên chưa có phòng ban)
+    id_phong_ban = models.ForeignKey(PhongBan, on_delete=models.CASCADE, null=True, blank=True, db_column='id_phong_ban')
+    trang_thai = models.CharField(max_length=10, choices=PayrollJob.TRANG_THAI_CHOICES, default='pending')
+    so_nhan_vien = models.IntegerField(default=0)
+    loi = models.TextField(null=True, blank=True)
+    bat_dau = models.DateTimeField(null=True, blank=True)
+    ket_thuc = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'payroll_job_chunk'
+        ordering = ['id']
+        verbose_name = 'Phần việc tính lương'
+        verbose_name_plural = 'Phần việc tính lương'
+
+    def __str__(self):
+        return f"{self.id_job} - phòng ban {self.id_phong_ban_id or '-'}"
+
+
+
+class PayrollEmail(models.Model):
+    TRANG_THAI_CHOICES = [
+        ('pending', 'Đang chờ'),
+        ('sent', 'Đã gửi'),
+        ('failed', 'Lỗi'),
+    ]
+
+    id_payroll = models.ForeignKey(PayrollRecord, on_delete=models.CASCADE, related_name='emails', db_column='id_payroll')
+    # Tác vụ gửi email tạo ra dòng này: phần việc chạy lại không gửi lại email đã gửi
+    id_job = models.ForeignKey(
+        PayrollJob, on_delete=models.CASCADE, null=True, blank=True, related_name='emails', db_column='id_job'
+    )
+    email_nhan = models.CharField(max_length=100, null=True, blank=True)
+    trang_thai = models.CharField(max_length=10, choices=TRANG_THAI_CHOICES, default='pending')
+    so_lan_thu = models.IntegerField(default=0)
+    loi = models.TextField(null=True, blank=True)
+    ngay_tao = models.DateTimeField(auto_now_add=True)
+    ngay_gui = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'payroll_email'
+        ordering = ['-ngay_tao']
+        constraints = [
+            models.UniqueConstraint(fields=['id_job', 'id_payroll'], name='payroll_email_job_payroll_uniq'),
+        ]
+        verbose_name = 'Email bảng lương'
+        verbose_name_plural = 'Email bảng lương'
+
+    def __str__(self):
+        return f"{self.email_nhan or '-'} - {self.get_trang_thai_display()}"
@@ -0,0 +1,109 @@
+from django.conf import settings
+from django.db.models.expressions import RawSQL
+from django.db import connections, router
+from . import metrics
+from .caching import get_api_cache, get_versions
+from .models import NhanVien
+
+# Tên nhóm dữ liệu trong cache, đổi phiên bản khi id_quan_ly thay đổi
+ORG_CHART_VERSION = 'org-chart'
+
+TABLE = NhanVien._meta.db_table
+
+# Cây cấp dưới của một nhân viên (kể cả chính họ, cap = 0)
+SUBTREE_SQL = f"""
+    WITH RECURSIVE cay (id_nhan_vien, ho, ten, id_quan_ly, cap) AS (
+        SELECT id_nhan_vien, ho, ten, id_quan_ly, 0 FROM {TABLE} WHERE id_nhan_vien = %s
+        UNION ALL
+        SELECT nv.id_nhan_vien, nv.ho, nv.ten, nv.id_quan_ly, cay.cap + 1
+        FROM {TABLE} nv JOIN cay ON nv.id_quan_ly = cay.id_nhan_vien
+        WHERE cay.cap < %s
+    )
+"""
+
+# Chuỗi quản lý từ chính nhân viên (cap = 0) lên tới cấp cao nhất
+ANCESTORS_SQL = f"""
+    WITH RECURSIVE chuoi (id_nhan_vien, ho, ten, id_quan_ly, cap) AS (
+        SELECT id_nhan_vien, ho, ten, id_quan_ly, 0 FROM {TABLE} WHERE id_nhan_vien = %s
+        UNION ALL
+        SELECT nv.id_nhan_vien, nv.ho, nv.ten, nv.id_quan_ly, chuoi.cap + 1
+        FROM {TABLE} nv JOIN chuoi ON nv.id_nhan_vien = chuoi.id_quan_ly
+        WHERE chuoi.cap < %s
+    )
+    SELECT id_nhan_vien, ho, ten, id_quan_ly, cap FROM chuoi ORDER BY cap
+"""
+
+# Mọi cặp (quản lý, cấp dưới) ở mọi cấp, gom lại thành số người trực tiếp/tổng
+HEADCOUNT_SQL = f"""
+    WITH RECURSIVE quan_he (id_quan_ly, id_nhan_vien, cap) AS (
+        SELECT id_quan_ly, id_nhan_vien, 1 FROM {TABLE} WHERE id_quan_ly IS NOT NULL
+        UNION ALL
+        SELECT nv.id_quan_ly, quan_he.id_nhan_vien, quan_he.cap + 1
+        FROM quan_he JOIN {TABLE} nv ON nv.id_nhan_vien = quan_he.id_quan_ly
+        WHERE nv.id_quan_ly IS NOT NULL AND quan_he.cap < %s
+    )
+    SELECT ql.id_nhan_vien, ql.ho, ql.ten,
+           SUM(CASE WHEN quan_he.cap = 1 THEN 1 ELSE 0 END), COUNT(*)
+    FROM quan_he JOIN {TABLE} ql ON ql.id_nhan_vien = quan_he.id_quan_ly
+    GROUP BY ql.id_nhan_vien, ql.ho, ql.ten
+    ORDER BY ql.id_nhan_vien
+"""
+
+COLUMNS = ('id_nhan_vien', 'ho', 'ten', 'id_quan_ly', 'cap')
+
+
+def _fetch(sql, params):
+    with connections[router.db_for_read(NhanVien)].cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _cached(name, compute):
+    """Đọc kết quả từ cache theo phiên bản sơ đồ tổ chức hiện tại, thiếu thì tính"""
+    version, = get_versions([ORG_CHART_VERSION])
+    cache = get_api_cache()
+    key = f"org-chart:{version}:{name}"
+    result = cache.get(key)
+    metrics.record_cache('org_chart', result is not None, result is None)
+    if result is None:
+        result = compute()
+        cache.set(key, result, settings.API_CACHE_TIMEOUT)
+    return result
+
+
+def get_subtree(id_nhan_vien):
+    """Nhân viên và toàn bộ cấp dưới (mọi cấp); rỗng nếu nhân viên không tồn tại"""
+    return _cached(f'subtree:{id_nhan_vien}', lambda: [
+        dict(zip(COLUMNS, row)) for row in _fetch(
+            SUBTREE_SQL + "SELECT id_nhan_vien, ho, ten, id_quan_ly, cap FROM cay ORDER BY cap, id_nhan_vien",
+            [id_nhan_vien, settings.ORG_CHART_MAX_DEPTH]
+        )
+    ])
+
+
+def get_ancestors(id_nhan_vien):
+    """Nhân viên và chuỗi quản lý của họ lên tới cấp cao nhất"""
+    return _cached(f'ancestors:{id_nhan_vien}', lambda: [
+        dict(zip(COLUMNS, row)) for row in _fetch(ANCESTORS_SQL, [id_nhan_vien, settings.ORG_CHART_MAX_DEPTH])
+    ])
+
+
+def get_headcounts():
+    """Số cấp dưới trực tiếp và tổng số cấp dưới (mọi cấp) của từng quản lý"""
+    return _cached('headcount', lambda: [
+        {'id_nhan_vien': id_nv, 'ho': ho, 'ten': ten, 'truc_tiep': truc_tiep, 'tong': tong}
+        for id_nv, ho, ten, truc_tiep, tong in _fetch(HEADCOUNT_SQL, [settings.ORG_CHART_MAX_DEPTH])
+    ])
+
+
+def reports_under(id_quan_ly):
+    """
+    Subquery id các nhân viên dưới quyền ``id_quan_ly`` (mọi cấp, không gồm họ).
+
+    Dùng trong filter(id_nhan_vien__in=...), nên lọc chấm công/bảng lương theo
+    quản lý chỉ tốn một truy vấn.
+    """
+    return RawSQL(
+        SUBTREE_SQL + "SELECT id_nhan_vien FROM cay WHERE cap > 0",
+        [int(id_quan_ly), settings.ORG_CHART_MAX_DEPTH]
+    )
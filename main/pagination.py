@@ -0,0 +1,210 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class SummaryPagination(PageNumberPagination):
+    """Phân trang cho các báo cáo tổng hợp, cho phép client chọn page_size"""
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+class AsyncPageNumberPagination:
+    """
+    Phân trang theo số trang cho các view async (main.async_views), cùng định
+    dạng với PageNumberPagination của DRF: {count, next, previous, results}.
+    Đếm và đọc trang bằng ORM async (acount, async for).
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_query_param = 'page'
+    page_size_query_param = None
+    max_page_size = None
+    invalid_page_message = 'Invalid page.'
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                page_size = int(request.GET[self.page_size_query_param])
+            except (KeyError, ValueError):
+                return self.page_size
+            if page_size > 0:
+                return min(page_size, self.max_page_size) if self.max_page_size else page_size
+        return self.page_size
+
+    async def paginate_queryset(self, queryset, request):
+        """Các dòng của trang được yêu cầu, None nếu số trang không hợp lệ"""
+        self.page_size = self.get_page_size(request)
+        self.count = await queryset.acount()
+        num_pages = max(1, -(-self.count // self.page_size))
+        try:
+            self.page_number = int(request.GET.get(self.page_query_param, 1))
+        except ValueError:
+            return None
+        if not 1 <= self.page_number <= num_pages:
+            return None
+        self.has_next = self.page_number < num_pages
+        self.base_url = request.build_absolute_uri()
+        offset = (self.page_number - 1) * self.page_size
+        return [row async for row in queryset[offset:offset + self.page_size]]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(self.base_url, self.page_query_param, self.page_number + 1)
+
+    def get_previous_link(self):
+        if self.page_number <= 1:
+            return None
+        if self.page_number == 2:
+            return remove_query_param(self.base_url, self.page_query_param)
+        return replace_query_param(self.base_url, self.page_query_param, self.page_number - 1)
+
+    def get_paginated_data(self, data):
+        return {
+            'count': self.count,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+
+
+class AsyncSummaryPagination(AsyncPageNumberPagination):
+    """Như SummaryPagination: client chọn được page_size"""
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+class KeysetPagination(BasePagination):
+    """
+    Phân trang theo con trỏ (keyset) cho các bảng lớn.
+
+    Trang sau được lọc bằng giá trị các cột sắp xếp của dòng cuối trang trước
+    (VD: ngay_lam < x OR (ngay_lam = x AND id < y)) nên không cần OFFSET, và
+    đi được bằng index trên đúng các cột đó. Thứ tự lấy từ ``keyset_ordering``
+    của view, cột cuối phải là khóa duy nhất (id). Không đếm tổng số dòng,
+    trừ khi client gửi ``?count=true``.
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    ordering = ('-id',)
+    invalid_cursor_message = 'Cursor không hợp lệ'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.ordering = tuple(getattr(view, 'keyset_ordering', self.ordering))
+        self.page_size = self.get_page_size(request)
+
+        self.count = None
+        if request.query_params.get(self.count_query_param, '').lower() in ('1', 'true'):
+            self.count = queryset.count()
+
+        cursor = self.decode_cursor(request, queryset.model)
+        reverse = False
+        if cursor is not None:
+            values, reverse = cursor
+            queryset = queryset.filter(self.keyset_filter(values, reverse))
+
+        order_by = [self._reverse(field) for field in self.ordering] if reverse else list(self.ordering)
+        rows = list(queryset.order_by(*order_by)[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        # Đi lùi thì chắc chắn còn trang sau; đi tiến từ một cursor thì còn trang trước
+        self.has_next = True if reverse else has_more
+        self.has_previous = has_more if reverse else cursor is not None
+        self.page = rows
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    @staticmethod
+    def _reverse(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    def keyset_filter(self, values, reverse):
+        """Điều kiện lấy các dòng đứng sau (hoặc trước, khi ``reverse``) bộ giá trị ``values``"""
+        condition = Q()
+        for i, field in enumerate(self.ordering):
+            descending = field.startswith('-') != reverse
+            name = field.lstrip('-')
+            term = Q(**{f'{name}__{"lt" if descending else "gt"}': values[i]})
+            for prev_field, prev_value in zip(self.ordering[:i], values):
+                term &= Q(**{prev_field.lstrip('-'): prev_value})
+            condition |= term
+        return condition
+
+    def decode_cursor(self, request, model):
+        """
+        (giá trị, reverse) của cursor trong request, mỗi giá trị đã đổi sang kiểu
+        của cột sắp xếp tương ứng. Cursor sai (kể cả giá trị sai kiểu) thì 404.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            data = json.loads(urlsafe_b64decode(encoded.encode()).decode())
+            values, reverse = data['v'], bool(data.get('r'))
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                raise ValueError
+            fields = [model._meta.get_field(field.lstrip('-')) for field in self.ordering]
+            values = [field.to_python(value) for field, value in zip(fields, values)]
+            for field, value in zip(fields, values):
+                if value is None:
+                    raise ValueError
+                # VD: id vượt quá khoảng của cột integer
+                field.run_validators(value)
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    def encode_cursor(self, row, reverse):
+        values = [getattr(row, field.lstrip('-')) for field in self.ordering]
+        data = json.dumps({'v': values, 'r': int(reverse)}, cls=DjangoJSONEncoder, separators=(',', ':'))
+        return replace_query_param(self.base_url, self.cursor_query_param, urlsafe_b64encode(data.encode()).decode())
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        response = {'next': self.get_next_link(), 'previous': self.get_previous_link()}
+        if self.count is not None:
+            response['count'] = self.count
+        response['results'] = data
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'count': {'type': 'integer', 'description': f'Chỉ có khi gửi ?{self.count_query_param}=true'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,218 @@
+import time
+from datetime import timedelta
+from decimal import Decimal, ROUND_HALF_EVEN
+from django.db import transaction
+from django.db.models import FilteredRelation, Q
+from . import metrics
+from .models import NhanVien, PayrollRecord, PayrollDirty
+from .utils import month_range
+
+# Số ngày công chuẩn trong một tháng
+SO_NGAY_CONG_CHUAN = 22
+
+# Số giờ làm của một ngày công
+SO_GIO_MOT_CONG = 8
+
+_MICROSECOND = timedelta(microseconds=1)
+_MICROSECONDS_PER_HOUR = 3600 * 10 ** 6
+_MICROSECONDS_PER_CONG = _MICROSECONDS_PER_HOUR * SO_GIO_MOT_CONG
+_CENT = Decimal('0.01')
+
+# Decimal dựng sẵn cho 0.00 .. 24.00 (số đơn vị 0.01), tránh tạo Decimal mới mỗi dòng
+_CENTS = tuple(Decimal(cents).scaleb(-2) for cents in range(24 * 100 + 1))
+
+
+def _from_cents(cents):
+    """Số nguyên đơn vị 0.01 -> Decimal 2 chữ số thập phân"""
+    if 0 <= cents < len(_CENTS):
+        return _CENTS[cents]
+    return Decimal(cents).scaleb(-2)
+
+
+def calculate_work_hours(check_ins, check_outs):
+    """
+    Tính (gio_lam, ngay_cong) cho cả lô cặp check-in/check-out.
+
+    Thời lượng được đổi sang số micro giây nguyên rồi tính hoàn toàn bằng số
+    nguyên (đơn vị 0.01) nên kết quả chính xác, không qua float: gio_lam làm
+    tròn nửa lên như cột numeric(4, 2), ngay_cong = gio_lam chưa làm tròn / 8,
+    làm tròn về số chẵn. Attendance.save() cũng gọi hàm này nên nhập hàng loạt
+    và lưu từng dòng cho cùng kết quả.
+    """
+    results = []
+    for check_in, check_out in zip(check_ins, check_outs):
+        micro = (check_out - check_in) // _MICROSECOND * 100
+        sign = -1 if micro < 0 else 1
+        micro = abs(micro)
+
+        # Làm tròn nửa lên (ra xa số 0)
+        gio_lam, remainder = divmod(micro, _MICROSECONDS_PER_HOUR)
+        if 2 * remainder >= _MICROSECONDS_PER_HOUR:
+            gio_lam += 1
+
+        # Làm tròn nửa về số chẵn
+        ngay_cong, remainder = divmod(micro, _MICROSECONDS_PER_CONG)
+        remainder *= 2
+        if remainder > _MICROSECONDS_PER_CONG or (remainder == _MICROSECONDS_PER_CONG and ngay_cong % 2):
+            ngay_cong += 1
+
+        results.append((_from_cents(sign * gio_lam), _from_cents(sign * ngay_cong)))
+    return results
+
+
+def work_hours_sql(micro):
+    """
+    Biểu thức SQL (gio_lam, ngay_cong) tính từ biểu thức số micro giây nguyên
+    micro, cùng phép tính số nguyên và cách làm tròn như calculate_work_hours
+    (phép chia số nguyên của PostgreSQL và SQLite đều cắt về 0 nên dùng ABS).
+    Trả về chuỗi SQL, dấu % của phép chia lấy dư đã được escape.
+    """
+    sign = f"(CASE WHEN {micro} < 0 THEN -1 ELSE 1 END)"
+    cents = f"(ABS({micro}) * 100)"
+    gio_lam = f"({cents} + {_MICROSECONDS_PER_HOUR // 2}) / {_MICROSECONDS_PER_HOUR}"
+    quotient = f"({cents} / {_MICROSECONDS_PER_CONG})"
+    remainder = f"(2 * ({cents} %% {_MICROSECONDS_PER_CONG}))"
+    ngay_cong = (
+        f"({quotient} + CASE WHEN {remainder} > {_MICROSECONDS_PER_CONG}"
+        f" OR ({remainder} = {_MICROSECONDS_PER_CONG} AND {quotient} %% 2 = 1) THEN 1 ELSE 0 END)"
+    )
+    return f"{sign} * {gio_lam} / 100.0", f"{sign} * {ngay_cong} / 100.0"
+
+
+def calculate_net_salaries(rows):
+    """
+    Tính lương thực nhận cho cả lô (tong_ngay_lam, luong).
+
+    Lương thực nhận = số ngày làm * lương cơ bản / số ngày công chuẩn, làm
+    tròn 2 chữ số về số chẵn; không có ngày làm thì lương bằng 0. Tích
+    tong_ngay_lam * luong (đều 2 chữ số thập phân) là chính xác, và thương
+    cho 22 cách điểm làm tròn ít nhất 1/2200 đơn vị 0.01 nên 28 chữ số của
+    Decimal đủ để kết quả đúng như phép chia chính xác.
+    """
+    zero = Decimal('0')
+    return [
+        (tong_ngay_lam * luong / SO_NGAY_CONG_CHUAN).quantize(_CENT, rounding=ROUND_HALF_EVEN)
+        if tong_ngay_lam > 0 else zero
+        for tong_ngay_lam, luong in rows
+    ]
+
+
+def calculate_net_salary(tong_ngay_lam, luong):
+    """Lương thực nhận của một nhân viên, xem calculate_net_salaries()"""
+    return calculate_net_salaries([(tong_ngay_lam, luong)])[0]
+
+
+def preview_monthly_payroll(thang, nhan_viens=None):
+    """
+    Tính thử lương tháng mà không ghi gì vào database.
+
+    Một truy vấn duy nhất LEFT JOIN nhân viên với bảng tổng hợp chấm công và
+    bảng lương đã lưu của tháng, đọc bằng iterator() nên kết quả được trả về
+    dần từng dòng. Mỗi dòng gồm kết quả mới (giống PayrollRecord.save()) và
+    giá trị đang lưu để so sánh; ``trang_thai`` là 'moi', 'thay_doi' hoặc
+    'khong_doi'.
+    """
+    start_date, _ = month_range(thang)
+    if nhan_viens is None:
+        nhan_viens = NhanVien.objects.all()
+
+    rows = nhan_viens.annotate(
+        cham_cong=FilteredRelation('attendancemonthly', condition=Q(attendancemonthly__thang=start_date)),
+        bang_luong=FilteredRelation('payrollrecord', condition=Q(payrollrecord__thang=start_date)),
+    ).order_by('id_nhan_vien').values_list(
+        'id_nhan_vien', 'ho', 'ten', 'luong', 'cham_cong__tong_ngay_cong',
+        'bang_luong__id', 'bang_luong__tong_ngay_lam', 'bang_luong__luong_thuc_nhan'
+    )
+
+    for id_nhan_vien, ho, ten, luong, tong_ngay_cong, id_payroll, ngay_lam_cu, luong_cu in rows.iterator(chunk_size=2000):
+        tong_ngay_lam = tong_ngay_cong or Decimal('0')
+        luong_thuc_nhan = calculate_net_salary(tong_ngay_lam, luong)
+        if id_payroll is None:
+            trang_thai = 'moi'
+        elif (ngay_lam_cu, luong_cu) != (tong_ngay_lam, luong_thuc_nhan):
+            trang_thai = 'thay_doi'
+        else:
+            trang_thai = 'khong_doi'
+        yield {
+            'id_nhan_vien': id_nhan_vien,
+            'ho_ten': f"{ho} {ten}",
+            'luong_co_ban': luong,
+            'tong_ngay_lam': tong_ngay_lam,
+            'luong_thuc_nhan': luong_thuc_nhan,
+            'tong_ngay_lam_da_luu': ngay_lam_cu,
+            'luong_thuc_nhan_da_luu': luong_cu,
+            'trang_thai': trang_thai,
+        }
+
+
+def calculate_monthly_payroll(thang, nhan_viens=None):
+    """
+    Tính lương tháng cho một tập nhân viên với số truy vấn cố định.
+
+    Kết quả được tính bằng preview_monthly_payroll(), sau đó chỉ những bảng
+    lương mới hoặc có thay đổi mới được ghi, bằng một lệnh
+    bulk_create(update_conflicts=True).
+    """
+    start_date, _ = month_range(thang)
+    started = time.perf_counter()
+
+    records = []
+    results = []
+    for row in preview_monthly_payroll(thang, nhan_viens):
+        if row['trang_thai'] != 'khong_doi':
+            records.append(PayrollRecord(
+                id_nhan_vien_id=row['id_nhan_vien'],
+                thang=start_date,
+                tong_ngay_lam=row['tong_ngay_lam'],
+                luong_thuc_nhan=row['luong_thuc_nhan']
+            ))
+        results.append({
+            'id_nhan_vien': row['id_nhan_vien'],
+            'ho_ten': row['ho_ten'],
+            'luong_co_ban': float(row['luong_co_ban']),
+            'tong_ngay_lam': float(row['tong_ngay_lam']),
+            'luong_thuc_nhan': float(row['luong_thuc_nhan']),
+            'created': row['trang_thai'] == 'moi',
+            'changed': row['trang_thai'] != 'khong_doi'
+        })
+
+    if records:
+        with transaction.atomic():
+            PayrollRecord.objects.bulk_create(
+                records,
+                update_conflicts=True,
+                unique_fields=['id_nhan_vien', 'thang'],
+                update_fields=['tong_ngay_lam', 'luong_thuc_nhan']
+            )
+
+    metrics.PAYROLL_RUN_DURATION.observe(time.perf_counter() - started)
+    metrics.PAYROLL_EMPLOYEES.inc(len(results))
+    return results
+
+
+def recalculate_dirty_payroll(limit=None):
+    """
+    Tính lại lương cho các (nhân viên, tháng) đã được đánh dấu trong PayrollDirty.
+
+    Chi phí tỉ lệ với số dòng chấm công bị sửa chứ không với số nhân viên:
+    mỗi tháng có dòng đánh dấu chỉ tốn một truy vấn tính thử và một lệnh ghi.
+    Các dòng đánh dấu được khóa (bỏ qua dòng worker khác đang xử lý) và xóa
+    trong cùng transaction. Trả về danh sách kết quả như calculate_monthly_payroll.
+    """
+    results = []
+    with transaction.atomic():
+        dirty = PayrollDirty.objects.select_for_update(skip_locked=True).order_by('thang', 'id_nhan_vien')
+        if limit:
+            dirty = dirty[:limit]
+        months = {}
+        for id_dirty, id_nhan_vien, thang in dirty.values_list('id', 'id_nhan_vien', 'thang'):
+            ids, dirty_ids = months.setdefault(thang, ([], []))
+            ids.append(id_nhan_vien)
+            dirty_ids.append(id_dirty)
+
+        for thang, (ids, dirty_ids) in months.items():
+            for result in calculate_monthly_payroll(thang, NhanVien.objects.filter(id_nhan_vien__in=ids)):
+                result['thang'] = thang
+                results.append(result)
+            PayrollDirty.objects.filter(id__in=dirty_ids).delete()
+    return results
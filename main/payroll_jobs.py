@@ -0,0 +1,152 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from .mailing import dispatch_payroll_emails
+from .models import NhanVien, PayrollRecord, PayrollJob, PayrollJobChunk
+from .payroll_engine import calculate_monthly_payroll
+from .utils import month_range
+
+
+class LeaseLost(Exception):
+    """Phần việc đã bị worker khác nhận lại (lease hết hạn), worker hiện tại phải dừng"""
+
+
+def enqueue_payroll_job(thang, id_nhan_vien=None, loai='tinh_luong', email_nhan=None):
+    """
+    Tạo tác vụ tính lương/gửi email bảng lương và chia thành các phần việc theo phòng ban.
+
+    Các worker (lệnh ``run_payroll_worker``) sẽ lấy từng phần việc ra xử lý,
+    nên nhiều tiến trình có thể cùng xử lý một tháng.
+    """
+    start_date, end_date = month_range(thang)
+    if loai == 'gui_email':
+        # Chỉ gửi cho những nhân viên đã có bảng lương tháng này
+        nhan_viens = NhanVien.objects.filter(
+            payrollrecord__thang__gte=start_date,
+            payrollrecord__thang__lt=end_date
+        )
+    else:
+        nhan_viens = NhanVien.objects.all()
+    if id_nhan_vien:
+        nhan_viens = nhan_viens.filter(id_nhan_vien=id_nhan_vien)
+
+    departments = list(
+        nhan_viens.order_by().values('id_phong_ban').annotate(so_nhan_vien=Count('id_nhan_vien', distinct=True))
+    )
+    tong_so_nhan_vien = sum(d['so_nhan_vien'] for d in departments)
+
+    with transaction.atomic():
+        job = PayrollJob.objects.create(
+            loai=loai,
+            thang=start_date,
+            id_nhan_vien_id=id_nhan_vien,
+            email_nhan=email_nhan,
+            tong_so_nhan_vien=tong_so_nhan_vien,
+        )
+        PayrollJobChunk.objects.bulk_create([
+            PayrollJobChunk(
+                id_job=job,
+                id_phong_ban_id=d['id_phong_ban'],
+                so_nhan_vien=d['so_nhan_vien'],
+            )
+            for d in departments
+        ])
+        if not departments:
+            job.trang_thai = 'done'
+            job.ket_thuc = timezone.now()
+            job.save(update_fields=['trang_thai', 'ket_thuc'])
+    return job
+
+
+def claim_next_chunk():
+    """
+    Lấy một phần việc đang chờ, bỏ qua các dòng đã bị worker khác khóa.
+
+    Phần việc 'running' không được gia hạn lease trong PAYROLL_CHUNK_LEASE_SECONDS
+    (worker nhận nó đã chết, xem renew_lease) cũng được nhận lại. ``bat_dau`` là thời điểm nhận, dùng làm mã
+    lease: worker cũ nếu còn chạy sẽ không ghi đè kết quả (xem run_chunk).
+    """
+    now = timezone.now()
+    expired = now - timedelta(seconds=settings.PAYROLL_CHUNK_LEASE_SECONDS)
+    with transaction.atomic():
+        chunk = (
+            PayrollJobChunk.objects.select_for_update(skip_locked=True)
+            .filter(Q(trang_thai='pending') | Q(trang_thai='running', bat_dau__lt=expired))
+            .order_by('id')
+            .first()
+        )
+        if chunk is None:
+            return None
+        chunk.trang_thai = 'running'
+        chunk.bat_dau = now
+        chunk.save(update_fields=['trang_thai', 'bat_dau'])
+        PayrollJob.objects.filter(pk=chunk.id_job_id, trang_thai='pending').update(
+            trang_thai='running', bat_dau=now
+        )
+    return chunk
+
+
+def _leased(chunk):
+    """Phần việc nếu worker này vẫn giữ lease (``bat_dau`` chưa bị worker khác đổi)"""
+    return PayrollJobChunk.objects.filter(pk=chunk.pk, trang_thai='running', bat_dau=chunk.bat_dau)
+
+
+def renew_lease(chunk):
+    """Gia hạn lease của phần việc đang chạy, raise LeaseLost nếu worker khác đã nhận lại"""
+    now = timezone.now()
+    if not _leased(chunk).update(bat_dau=now):
+        raise LeaseLost(f'Phần việc #{chunk.pk} đã bị worker khác nhận lại')
+    chunk.bat_dau = now
+
+
+def run_chunk(chunk):
+    """
+    Xử lý một phần việc (tính lương hoặc gửi email) và cập nhật tiến độ của tác vụ.
+
+    Gửi email có thể lâu hơn PAYROLL_CHUNK_LEASE_SECONDS, nên lease được gia
+    hạn sau mỗi lô email (tối đa mỗi 1/3 thời hạn lease một lần).
+    """
+    job = chunk.id_job
+    nhan_viens = NhanVien.objects.filter(id_phong_ban=chunk.id_phong_ban_id)
+    if job.id_nhan_vien_id:
+        nhan_viens = nhan_viens.filter(id_nhan_vien=job.id_nhan_vien_id)
+
+    renewed = time.monotonic()
+
+    def heartbeat():
+        nonlocal renewed
+        if time.monotonic() - renewed >= settings.PAYROLL_CHUNK_LEASE_SECONDS / 3:
+            renew_lease(chunk)
+            renewed = time.monotonic()
+
+    try:
+        if job.loai == 'gui_email':
+            start_date, end_date = month_range(job.thang)
+            payrolls = PayrollRecord.objects.filter(
+                id_nhan_vien__in=nhan_viens,
+                thang__gte=start_date,
+                thang__lt=end_date
+            ).select_related('id_nhan_vien')
+            results = dispatch_payroll_emails(payrolls, job.email_nhan, heartbeat, job)
+        else:
+            results = calculate_monthly_payroll(job.thang, nhan_viens)
+    except Exception as e:
+        now = timezone.now()
+        # Chỉ cập nhật khi vẫn giữ lease; phần việc đã bị nhận lại thì để worker mới báo kết quả
+        if _leased(chunk).update(trang_thai='failed', loi=str(e), ket_thuc=now):
+            PayrollJob.objects.filter(pk=job.pk).update(trang_thai='failed', loi=str(e), ket_thuc=now)
+        raise
+
+    now = timezone.now()
+    with transaction.atomic():
+        if not _leased(chunk).update(trang_thai='done', ket_thuc=now):
+            return results
+        PayrollJob.objects.filter(pk=job.pk).update(so_nhan_vien_xong=F('so_nhan_vien_xong') + len(results))
+
+    # Phần việc cuối cùng hoàn thành thì đánh dấu cả tác vụ
+    if not PayrollJobChunk.objects.filter(id_job=job).exclude(trang_thai='done').exists():
+        PayrollJob.objects.filter(pk=job.pk, trang_thai='running').update(trang_thai='done', ket_thuc=now)
+    return results
@@ -0,0 +1,67 @@
+import hashlib
+from functools import lru_cache
+from django.conf import settings
+from django.core.cache import cache
+from django.template import Context
+from django.template.loader import get_template
+from . import metrics
+from .utils import format_vnd
+
+PAYSLIP_TEMPLATE = 'email/payroll.html'
+
+
+@lru_cache(maxsize=None)
+def get_payslip_template():
+    """
+    Biên dịch template bảng lương một lần cho mỗi process.
+
+    Trả về (template đã biên dịch, dấu vân tay nội dung template); dấu vân tay
+    nằm trong khóa cache nên sửa template sẽ không dùng lại HTML cũ.
+    """
+    template = get_template(PAYSLIP_TEMPLATE).template
+    return template, hashlib.sha1(template.source.encode()).hexdigest()[:12]
+
+
+def payslip_context(payroll):
+    """Context của template bảng lương cho một PayrollRecord (đã select_related id_nhan_vien)"""
+    nv = payroll.id_nhan_vien
+    return {
+        'ho_ten': f"{nv.ho} {nv.ten}",
+        'thang': payroll.thang.strftime('%m/%Y'),
+        'tong_ngay_lam': f"{payroll.tong_ngay_lam:.2f}",
+        'luong_thuc_nhan': format_vnd(payroll.luong_thuc_nhan),
+    }
+
+
+def payslip_cache_key(payroll, context, template_version):
+    """
+    Khóa cache theo (nhân viên, tháng, phiên bản bảng lương).
+
+    Phiên bản là dấu vân tay của dữ liệu hiển thị, nên bảng lương được tính
+    lại với kết quả khác sẽ có khóa mới.
+    """
+    version = hashlib.sha1('|'.join(context.values()).encode()).hexdigest()[:12]
+    return f"payslip:{payroll.id_nhan_vien_id}:{payroll.thang:%Y%m}:{template_version}:{version}"
+
+
+def render_payslips(payrolls):
+    """
+    Render HTML bảng lương cho nhiều PayrollRecord, trả về list theo đúng thứ tự.
+
+    Bảng lương chưa thay đổi được lấy từ cache, chỉ những bảng còn thiếu mới
+    được render (dùng chung template đã biên dịch) và ghi lại vào cache.
+    """
+    template, template_version = get_payslip_template()
+    contexts = [payslip_context(payroll) for payroll in payrolls]
+    keys = [payslip_cache_key(payroll, context, template_version) for payroll, context in zip(payrolls, contexts)]
+
+    cached = cache.get_many(keys)
+    metrics.record_cache('payslip', len(cached), len(set(keys)) - len(cached))
+    rendered = {}
+    for key, context in zip(keys, contexts):
+        if key not in cached and key not in rendered:
+            rendered[key] = template.render(Context(context, autoescape=True))
+    if rendered:
+        cache.set_many(rendered, settings.PAYSLIP_CACHE_TIMEOUT)
+
+    return [cached.get(key) or rendered[key] for key in keys]
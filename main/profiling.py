@@ -0,0 +1,254 @@
+import contextvars
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger('main.profiling')
+
+_current = contextvars.ContextVar('request_profile', default=None)
+
+# Các request chậm gần nhất của tiến trình này (mới nhất ở cuối)
+_slow_requests = deque(maxlen=settings.PROFILING_SLOW_BUFFER_SIZE)
+_slow_lock = threading.Lock()
+
+
+class RequestProfile:
+    """Số liệu đo được của một request: truy vấn SQL, thời gian DB và các đoạn đo thêm"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = Counter()  # SQL (chưa gắn tham số) -> số lần chạy
+        self.db_time = 0.0
+        self.sections = {}  # Tên -> giây, VD: serializer
+
+    def add_section(self, name, seconds):
+        self.sections[name] = self.sections.get(name, 0.0) + seconds
+
+    @property
+    def query_count(self):
+        return sum(self.queries.values())
+
+    @property
+    def duplicate_count(self):
+        """Số lần chạy lại một câu SQL đã chạy trong request (dấu hiệu N+1)"""
+        return sum(count - 1 for count in self.queries.values())
+
+    def top_duplicates(self, limit=3):
+        return [
+            {'sql': sql[:300], 'so_lan': count}
+            for sql, count in self.queries.most_common(limit) if count > 1
+        ]
+
+
+def get_current_profile():
+    return _current.get()
+
+
+def profile_query(execute, sql, params, many, context):
+    """
+    execute_wrapper gắn một lần cho mỗi kết nối (xem install_query_profiler).
+
+    Số liệu được ghi vào profile của request hiện tại lấy từ contextvar, nên
+    đúng cả khi nhiều request async dùng chung thread hoặc khi truy vấn chạy
+    trong thread của sync_to_async.
+    """
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.db_time += time.perf_counter() - started
+        profile.queries[sql] += 1
+
+
+def install_query_profiler(connection):
+    if profile_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(profile_query)
+
+
+@contextmanager
+def profile_section(name):
+    """Đo thời gian một đoạn xử lý trong request, hiện trong Server-Timing (VD: tạo file Excel)"""
+    profile = _current.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if profile is not None:
+            profile.add_section(name, time.perf_counter() - started)
+
+
+def _server_timing(profile, total):
+    parts = [f'db;dur={profile.db_time * 1000:.1f};desc="{profile.query_count} queries, {profile.duplicate_count} dup"']
+    parts += [f'{name};dur={seconds * 1000:.1f}' for name, seconds in profile.sections.items()]
+    parts.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(parts)
+
+
+def get_slow_requests_dir():
+    return settings.PROFILING_DIR or os.path.join(tempfile.gettempdir(), 'hr-profiling')
+
+
+def _record_slow_request(entry):
+    """
+    Thêm request chậm vào ring buffer và ghi buffer ra file của tiến trình.
+
+    Mỗi tiến trình một file slow-<pid>.json (ghi đè nguyên tử), lệnh
+    dump_slow_requests đọc và gộp các file này.
+    """
+    with _slow_lock:
+        _slow_requests.append(entry)
+        entries = list(_slow_requests)
+    directory = get_slow_requests_dir()
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(directory, f'slow-{os.getpid()}.json'))
+    except OSError:
+        logger.warning('Không ghi được danh sách request chậm vào %s', directory, exc_info=True)
+
+
+def get_slow_requests():
+    """Các request chậm của tiến trình hiện tại"""
+    with _slow_lock:
+        return list(_slow_requests)
+
+
+class RequestProfilingMiddleware:
+    """
+    Đo từng request: số truy vấn SQL, thời gian DB, số truy vấn lặp lại
+    (N+1), các đoạn đo thêm (serializer, ...) và kích thước response.
+
+    Kết quả được ghi log có cấu trúc qua logger ``main.profiling``; request
+    chậm hơn PROFILING_SLOW_REQUEST_MS được giữ trong ring buffer để xem bằng
+    lệnh dump_slow_requests. Header Server-Timing chỉ trả về khi DEBUG hoặc
+    cho người dùng staff. Response streaming (VD: xem trước bảng lương) gửi
+    header trước khi tạo nội dung, nên Server-Timing của chúng chỉ tính đến
+    lúc đó; log và request chậm thì được ghi khi đã gửi hết nội dung.
+    Chạy được cả WSGI lẫn ASGI (không ép view async chạy trong thread).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.PROFILING_ENABLED:
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        token = _current.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, profile)
+
+    async def __acall__(self, request):
+        if not settings.PROFILING_ENABLED:
+            return await self.get_response(request)
+
+        profile = RequestProfile()
+        token = _current.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, profile)
+
+    def finish(self, request, response, profile):
+        user = getattr(request, 'user', None)
+        if settings.DEBUG or getattr(user, 'is_staff', False):
+            response['Server-Timing'] = _server_timing(profile, time.perf_counter() - profile.started)
+
+        if getattr(response, 'streaming', False):
+            self.profile_streaming(request, response, profile)
+        else:
+            self.log(request, response, profile, len(response.content))
+        return response
+
+    def profile_streaming(self, request, response, profile):
+        """Đo cả phần tạo nội dung của response streaming, ghi log khi gửi xong"""
+        content = response.streaming_content
+        size = 0
+
+        if response.is_async:
+            async def wrapper():
+                nonlocal size
+                iterator = aiter(content)
+                try:
+                    while True:
+                        token = _current.set(profile)
+                        try:
+                            chunk = await anext(iterator)
+                        except StopAsyncIteration:
+                            break
+                        finally:
+                            _current.reset(token)
+                        size += len(chunk)
+                        yield chunk
+                finally:
+                    self.log(request, response, profile, size)
+        else:
+            def wrapper():
+                nonlocal size
+                iterator = iter(content)
+                try:
+                    while True:
+                        # Truy vấn chạy khi tạo từng phần nội dung vẫn tính vào request
+                        token = _current.set(profile)
+                        try:
+                            chunk = next(iterator)
+                        except StopIteration:
+                            break
+                        finally:
+                            _current.reset(token)
+                        size += len(chunk)
+                        yield chunk
+                finally:
+                    self.log(request, response, profile, size)
+
+        response.streaming_content = wrapper()
+
+    def log(self, request, response, profile, size):
+        total = time.perf_counter() - profile.started
+        entry = {
+            'thoi_gian': timezone.now().isoformat(),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+            'db_ms': round(profile.db_time * 1000, 1),
+            'queries': profile.query_count,
+            'duplicates': profile.duplicate_count,
+            'sections_ms': {name: round(seconds * 1000, 1) for name, seconds in profile.sections.items()},
+            'bytes': size,
+        }
+        # Request thường ghi ở mức DEBUG, request chậm ở mức WARNING
+        slow = total * 1000 >= settings.PROFILING_SLOW_REQUEST_MS
+        logger.log(
+            logging.WARNING if slow else logging.DEBUG,
+            '%(method)s %(path)s status=%(status)s total_ms=%(total_ms)s db_ms=%(db_ms)s '
+            'queries=%(queries)s duplicates=%(duplicates)s bytes=%(bytes)s', entry,
+            extra={'profile': entry}
+        )
+        if slow:
+            entry['top_duplicates'] = profile.top_duplicates()
+            _record_slow_request(entry)
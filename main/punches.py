@@ -0,0 +1,310 @@
+from datetime import date, datetime
+from django.db import IntegrityError, connections, router, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import NhanVien, Attendance
+from .payroll_engine import calculate_work_hours, work_hours_sql
+from .rollups import apply_attendance_delta, apply_attendance_deltas
+
+PUNCH_TYPES = ('check_in', 'check_out')
+
+# Số lần ghép lại một lô khi đụng dòng vừa được tạo đồng thời
+INGEST_MAX_ATTEMPTS = 3
+
+
+# Số micro giây nguyên từ check_in tới %(now)s, tính chính xác (không qua float)
+_MICROSECONDS_SQL = {
+    'postgresql': "CAST(EXTRACT(EPOCH FROM (%(now)s - check_in)) * 1000000 AS BIGINT)",
+    # SQLite lưu datetime dạng 'YYYY-MM-DD HH:MM:SS[.ffffff]': giây lấy qua strftime,
+    # phần micro giây cắt từ ký tự thứ 21 (chuỗi rỗng khi không có -> 0)
+    'sqlite': (
+        "((strftime('%%s', %(now)s) - strftime('%%s', check_in)) * 1000000"
+        " + CAST(substr(%(now)s, 21) AS INTEGER) - CAST(substr(check_in, 21) AS INTEGER))"
+    ),
+}
+
+
+class PunchError(Exception):
+    """Lỗi chấm công, kèm HTTP status để view trả về"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _connection():
+    return connections[router.db_for_write(Attendance)]
+
+
+def _from_db(connection, field, value):
+    """Đổi giá trị đọc bằng cursor thô sang kiểu Python như ORM (VD: SQLite trả datetime dạng chuỗi)"""
+    expression = field.get_col(field.model._meta.db_table)
+    for converter in connection.ops.get_db_converters(expression) + expression.get_db_converters(connection):
+        value = converter(value, expression, connection)
+    return value
+
+
+def _punch_error(id_nhan_vien, ngay_lam, check_out):
+    """Chỉ chạy khi lệnh chấm công không ghi được dòng nào: tìm lý do để báo lỗi"""
+    row = Attendance.objects.filter(
+        id_nhan_vien_id=id_nhan_vien, ngay_lam=ngay_lam
+    ).values_list('check_in', 'check_out').first()
+    if row is None:
+        if not NhanVien.objects.filter(id_nhan_vien=id_nhan_vien).exists():
+            return PunchError('Nhân viên không tồn tại', 404)
+        return PunchError('Chưa check-in hôm nay')
+    if not check_out:
+        return PunchError('Đã check-in hôm nay rồi')
+    if row[0] is None:
+        return PunchError('Chưa check-in hôm nay')
+    return PunchError('Đã check-out hôm nay rồi')
+
+
+def check_in(id_nhan_vien, now):
+    """
+    Check-in bằng một lệnh INSERT ... ON CONFLICT DO NOTHING RETURNING.
+
+    Dòng chỉ được thêm khi nhân viên tồn tại và chưa chấm công hôm nay, nên
+    không cần đọc trước. Bảng tổng hợp tháng được cộng thêm một ngày trong
+    cùng transaction. Trả về dict tối thiểu cho response, lỗi thì raise PunchError.
+    """
+    ngay_lam = date.today()
+    connection = _connection()
+    table = Attendance._meta.db_table
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} (id_nhan_vien, ngay_lam, check_in)
+            SELECT id_nhan_vien, %s, %s FROM {NhanVien._meta.db_table} WHERE id_nhan_vien = %s
+            ON CONFLICT (id_nhan_vien, ngay_lam) DO NOTHING
+            RETURNING id
+            """,
+            [
+                connection.ops.adapt_datefield_value(ngay_lam),
+                connection.ops.adapt_datetimefield_value(now),
+                id_nhan_vien,
+            ]
+        )
+        row = cursor.fetchone()
+        if row is not None:
+            apply_attendance_delta(id_nhan_vien, ngay_lam, 0, 0, 1)
+
+    if row is None:
+        # Dòng đã có nhưng chưa check-in (tạo tay qua API) thì điền giờ check-in
+        with transaction.atomic(using=connection.alias):
+            if Attendance.objects.filter(
+                id_nhan_vien_id=id_nhan_vien, ngay_lam=ngay_lam, check_in__isnull=True
+            ).update(check_in=now):
+                row = Attendance.objects.filter(id_nhan_vien_id=id_nhan_vien, ngay_lam=ngay_lam).values_list('id').get()
+        if row is None:
+            raise _punch_error(id_nhan_vien, ngay_lam, check_out=False)
+
+    return {
+        'id': row[0],
+        'id_nhan_vien': int(id_nhan_vien),
+        'ngay_lam': ngay_lam,
+        'check_in': now,
+    }
+
+
+def check_out(id_nhan_vien, now):
+    """
+    Check-out bằng một lệnh UPDATE ... RETURNING có điều kiện.
+
+    gio_lam và ngay_cong được tính ngay trong lệnh UPDATE từ check_in bằng
+    phép tính số nguyên của work_hours_sql (cùng cách làm tròn với
+    Attendance.save() và nhập hàng loạt), sau đó cộng chênh lệch vào bảng
+    tổng hợp tháng trong cùng transaction.
+    """
+    ngay_lam = date.today()
+    connection = _connection()
+    table = Attendance._meta.db_table
+    gio_lam_sql, ngay_cong_sql = work_hours_sql(_MICROSECONDS_SQL[connection.vendor])
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {table} SET check_out = %(now)s, gio_lam = {gio_lam_sql}, ngay_cong = {ngay_cong_sql}
+            WHERE id_nhan_vien = %(id_nhan_vien)s AND ngay_lam = %(ngay_lam)s
+              AND check_in IS NOT NULL AND check_out IS NULL
+            RETURNING id, gio_lam, ngay_cong
+            """,
+            {
+                'now': connection.ops.adapt_datetimefield_value(now),
+                'id_nhan_vien': id_nhan_vien,
+                'ngay_lam': connection.ops.adapt_datefield_value(ngay_lam),
+            }
+        )
+        row = cursor.fetchone()
+        if row is not None:
+            pk = row[0]
+            gio_lam = _from_db(connection, Attendance._meta.get_field('gio_lam'), row[1])
+            ngay_cong = _from_db(connection, Attendance._meta.get_field('ngay_cong'), row[2])
+            apply_attendance_delta(id_nhan_vien, ngay_lam, ngay_cong, gio_lam, 0)
+
+    if row is None:
+        raise _punch_error(id_nhan_vien, ngay_lam, check_out=True)
+
+    return {
+        'id': pk,
+        'id_nhan_vien': int(id_nhan_vien),
+        'ngay_lam': ngay_lam,
+        'check_out': now,
+        'gio_lam': gio_lam,
+        'ngay_cong': ngay_cong,
+    }
+
+
+def _parse_event(event):
+    """Chuẩn hóa một lượt chấm công thành (id_nhan_vien, thoi_gian, loai), lỗi thì raise ValueError"""
+    if not isinstance(event, dict):
+        raise ValueError('Lượt chấm công phải là object {id_nhan_vien, thoi_gian, loai}')
+    try:
+        id_nhan_vien = int(event.get('id_nhan_vien'))
+    except (TypeError, ValueError):
+        raise ValueError('ID nhân viên không hợp lệ')
+
+    thoi_gian = event.get('thoi_gian')
+    if not isinstance(thoi_gian, datetime):
+        thoi_gian = parse_datetime(str(thoi_gian or '').strip())
+    if thoi_gian is None:
+        raise ValueError('Thời gian không đúng định dạng ISO 8601')
+    if timezone.is_naive(thoi_gian):
+        thoi_gian = timezone.make_aware(thoi_gian)
+
+    loai = event.get('loai')
+    if loai not in PUNCH_TYPES:
+        raise ValueError(f'Loại chấm công chỉ nhận: {", ".join(PUNCH_TYPES)}')
+    return id_nhan_vien, thoi_gian, loai
+
+
+def _locked_attendances(days):
+    """Một truy vấn đọc (và khóa) các dòng đã có của những (nhân viên, ngày) trong lô"""
+    return {
+        (attendance.id_nhan_vien_id, attendance.ngay_lam): attendance
+        for attendance in Attendance.objects.select_for_update().filter(
+            id_nhan_vien__in={key[0] for key in days},
+            ngay_lam__in={key[1] for key in days}
+        )
+    }
+
+
+def _merge_days(days):
+    """
+    Ghép các lượt của ``days`` với dòng đã có và ghi trong một transaction.
+    Trả về (dòng tạo, dòng cập nhật, {(id, ngày): lỗi}); ``days`` không bị sửa
+    nên gọi lại được khi transaction bị hủy.
+    """
+    created, updated, errors = [], [], {}
+    with transaction.atomic():
+        attendances = _locked_attendances(days)
+
+        rows = []
+        for key, day in days.items():
+            attendance = attendances.get(key)
+            check_ins = day['check_in'] + ([attendance.check_in] if attendance and attendance.check_in else [])
+            check_outs = day['check_out'] + ([attendance.check_out] if attendance and attendance.check_out else [])
+            check_in = min(check_ins) if check_ins else None
+            check_out = max(check_outs) if check_outs else None
+            if check_out and not check_in:
+                errors[key] = 'Chưa check-in trong ngày'
+                continue
+            if check_out and check_out <= check_in:
+                errors[key] = 'Giờ check-out phải sau giờ check-in'
+                continue
+            if attendance is None:
+                attendance = Attendance(id_nhan_vien_id=key[0], ngay_lam=key[1])
+                created.append(attendance)
+            elif (attendance.check_in, attendance.check_out) == (check_in, check_out):
+                continue
+            else:
+                updated.append(attendance)
+            attendance.check_in, attendance.check_out = check_in, check_out
+            rows.append(attendance)
+
+        # Tính giờ làm cho cả lô thay vì gọi save() từng dòng
+        completed = [attendance for attendance in rows if attendance.check_out]
+        hours = calculate_work_hours(
+            [attendance.check_in for attendance in completed],
+            [attendance.check_out for attendance in completed]
+        )
+        for attendance, (gio_lam, ngay_cong) in zip(completed, hours):
+            attendance.gio_lam, attendance.ngay_cong = gio_lam, ngay_cong
+
+        deltas = []
+        for attendance in created:
+            deltas.append((attendance.id_nhan_vien_id, attendance.ngay_lam, attendance.ngay_cong or 0, attendance.gio_lam or 0, 1))
+        for attendance in updated:
+            _, _, old_ngay_cong, old_gio_lam = attendance._rollup_state
+            deltas.append((
+                attendance.id_nhan_vien_id, attendance.ngay_lam,
+                (attendance.ngay_cong or 0) - old_ngay_cong, (attendance.gio_lam or 0) - old_gio_lam, 0
+            ))
+
+        Attendance.objects.bulk_create(created, batch_size=1000)
+        Attendance.objects.bulk_update(updated, ['check_in', 'check_out', 'gio_lam', 'ngay_cong'], batch_size=1000)
+        apply_attendance_deltas(deltas)
+
+    return created, updated, errors
+
+
+def ingest_punches(events):
+    """
+    Nhập một lô lượt chấm công {id_nhan_vien, thoi_gian, loai} từ máy chấm công.
+
+    Các lượt trùng bị bỏ qua, các lượt còn lại được ghép theo (nhân viên, ngày):
+    check-in sớm nhất và check-out muộn nhất trong ngày, gộp với dòng đã có.
+    Giờ làm của cả lô được tính một lần, dòng mới ghi bằng bulk_create, dòng đã
+    có ghi bằng bulk_update, bảng tổng hợp tháng cộng chênh lệch một lần.
+    Trả về dict gồm số dòng tạo/cập nhật, số lượt trùng và danh sách lượt bị từ chối.
+    """
+    rejected = []
+    seen = {}  # (id_nhan_vien, thoi_gian, loai) -> (vị trí, lượt gốc)
+    duplicates = 0
+    for index, event in enumerate(events):
+        try:
+            parsed = _parse_event(event)
+        except ValueError as e:
+            rejected.append({'index': index, 'event': event, 'error': str(e)})
+            continue
+        if parsed in seen:
+            duplicates += 1
+            continue
+        seen[parsed] = (index, event)
+
+    # Ghép các lượt theo (nhân viên, ngày): {(id, ngày): {'check_in': [thời gian], 'check_out': [thời gian]}}
+    days = {}
+    for id_nhan_vien, thoi_gian, loai in seen:
+        day = days.setdefault((id_nhan_vien, timezone.localdate(thoi_gian)), {'check_in': [], 'check_out': []})
+        day[loai].append(thoi_gian)
+
+    ids = {id_nhan_vien for id_nhan_vien, _ in days}
+    existing_ids = set(NhanVien.objects.filter(id_nhan_vien__in=ids).values_list('id_nhan_vien', flat=True))
+
+    def reject_day(key, error):
+        for loai, times in days.pop(key).items():
+            for thoi_gian in times:
+                index, event = seen[(key[0], thoi_gian, loai)]
+                rejected.append({'index': index, 'event': event, 'error': error})
+
+    for key in [key for key in days if key[0] not in existing_ids]:
+        reject_day(key, 'Nhân viên không tồn tại')
+
+    # select_for_update không khóa được dòng chưa có: check-in đồng thời có thể tạo
+    # dòng của cùng (nhân viên, ngày) trước khi lô được ghi. Khi đó cả transaction
+    # bị hủy và lô được ghép lại với dòng vừa tạo.
+    for attempt in range(1, INGEST_MAX_ATTEMPTS + 1):
+        try:
+            created, updated, errors = _merge_days(days)
+            break
+        except IntegrityError:
+            if attempt == INGEST_MAX_ATTEMPTS:
+                raise
+    for key, error in errors.items():
+        reject_day(key, error)
+
+    return {
+        'created': len(created),
+        'updated': len(updated),
+        'duplicates': duplicates,
+        'rejected': rejected,
+    }
@@ -0,0 +1,164 @@
+from functools import partial
+from django.db import connections, router, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from .models import Attendance, AttendanceMonthly, PayrollRecord, PayrollDirty
+from .utils import month_range
+
+
+def apply_attendance_delta(id_nhan_vien, ngay_lam, ngay_cong, gio_lam, so_ngay):
+    """
+    Cộng chênh lệch của một dòng chấm công vào bảng tổng hợp tháng.
+
+    Dùng một lệnh INSERT ... ON CONFLICT DO UPDATE nên nhiều request chấm công
+    cùng lúc không ghi đè lên nhau.
+    """
+    apply_attendance_deltas([(id_nhan_vien, ngay_lam, ngay_cong, gio_lam, so_ngay)])
+
+
+def apply_attendance_deltas(deltas):
+    """
+    Cộng nhiều chênh lệch (id_nhan_vien, ngay_lam, ngay_cong, gio_lam, so_ngay).
+
+    Các chênh lệch cùng (nhân viên, tháng) được gộp trước, rồi ghi bằng một
+    lệnh executemany.
+    """
+    totals = {}
+    for id_nhan_vien, ngay_lam, ngay_cong, gio_lam, so_ngay in deltas:
+        key = (id_nhan_vien, month_range(ngay_lam)[0])
+        tong_ngay_cong, tong_gio_lam, tong_so_ngay = totals.get(key, (0, 0, 0))
+        totals[key] = (tong_ngay_cong + ngay_cong, tong_gio_lam + gio_lam, tong_so_ngay + so_ngay)
+    if not totals:
+        return
+
+    table = AttendanceMonthly._meta.db_table
+    connection = connections[router.db_for_write(AttendanceMonthly)]
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"""
+            INSERT INTO {table} (id_nhan_vien, thang, tong_ngay_cong, tong_gio_lam, so_ngay)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (id_nhan_vien, thang) DO UPDATE SET
+                tong_ngay_cong = {table}.tong_ngay_cong + EXCLUDED.tong_ngay_cong,
+                tong_gio_lam = {table}.tong_gio_lam + EXCLUDED.tong_gio_lam,
+                so_ngay = {table}.so_ngay + EXCLUDED.so_ngay
+            """,
+            [
+                (id_nhan_vien, connection.ops.adapt_datefield_value(thang), *values)
+                for (id_nhan_vien, thang), values in totals.items()
+            ]
+        )
+    mark_payroll_dirty(totals)
+
+
+def mark_payroll_dirty(keys):
+    """
+    Đánh dấu các (id_nhan_vien, tháng) cần tính lại lương.
+
+    Chỉ những tháng đã có bảng lương mới được đánh dấu: tháng chưa tính lương
+    thì lần tính đầu tiên đã dùng số liệu mới. ON CONFLICT DO UPDATE khóa dòng
+    đang có nên không bị mất khi recalculate_dirty_payroll đang xử lý dòng đó.
+    """
+    keys = list(keys)
+    if not keys:
+        return
+    dirty_table = PayrollDirty._meta.db_table
+    connection = connections[router.db_for_write(PayrollDirty)]
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"""
+            INSERT INTO {dirty_table} (id_nhan_vien, thang, ngay_danh_dau)
+            SELECT id_nhan_vien, thang, %s FROM {PayrollRecord._meta.db_table}
+            WHERE id_nhan_vien = %s AND thang = %s
+            ON CONFLICT (id_nhan_vien, thang) DO UPDATE SET ngay_danh_dau = EXCLUDED.ngay_danh_dau
+            """,
+            [(now, id_nhan_vien, connection.ops.adapt_datefield_value(thang)) for id_nhan_vien, thang in keys]
+        )
+
+
+def remove_attendance(id_nhan_vien, ngay_lam, ngay_cong, gio_lam):
+    """Trừ một dòng chấm công đã xóa khỏi bảng tổng hợp tháng."""
+    thang, _ = month_range(ngay_lam)
+    # Chỉ UPDATE: khi xóa dây chuyền theo nhân viên thì dòng tổng hợp có thể đã bị xóa trước
+    AttendanceMonthly.objects.filter(id_nhan_vien_id=id_nhan_vien, thang=thang).update(
+        tong_ngay_cong=F('tong_ngay_cong') - ngay_cong,
+        tong_gio_lam=F('tong_gio_lam') - gio_lam,
+        so_ngay=F('so_ngay') - 1
+    )
+    # Đánh dấu sau khi commit: khi xóa dây chuyền, bảng lương và nhân viên bị xóa
+    # sau dòng chấm công, nên lúc commit chỉ còn đánh dấu được bảng lương còn tồn tại
+    transaction.on_commit(
+        partial(mark_payroll_dirty, [(id_nhan_vien, thang)]),
+        using=router.db_for_write(PayrollDirty)
+    )
+
+
+def refresh_attendance_rollup(id_nhan_vien, ngay_lam):
+    """Tính lại một dòng tổng hợp (nhân viên, tháng) từ bảng Attendance."""
+    start_date, end_date = month_range(ngay_lam)
+    totals = Attendance.objects.filter(
+        id_nhan_vien_id=id_nhan_vien,
+        ngay_lam__gte=start_date,
+        ngay_lam__lt=end_date
+    ).aggregate(
+        tong_ngay_cong=Sum('ngay_cong'),
+        tong_gio_lam=Sum('gio_lam'),
+        so_ngay=Count('id')
+    )
+    AttendanceMonthly.objects.update_or_create(
+        id_nhan_vien_id=id_nhan_vien,
+        thang=start_date,
+        defaults={
+            'tong_ngay_cong': totals['tong_ngay_cong'] or 0,
+            'tong_gio_lam': totals['tong_gio_lam'] or 0,
+            'so_ngay': totals['so_ngay'],
+        }
+    )
+    mark_payroll_dirty([(id_nhan_vien, start_date)])
+
+
+def rebuild_attendance_rollups(from_date, to_date):
+    """
+    Tính lại toàn bộ bảng tổng hợp cho các tháng nằm trong [from_date, to_date].
+
+    Dùng sau khi nhập dữ liệu chấm công hàng loạt không đi qua Attendance.save().
+    Trả về số dòng tổng hợp đã ghi.
+    """
+    start_date, _ = month_range(from_date)
+    _, end_date = month_range(to_date)
+
+    rows = Attendance.objects.filter(
+        ngay_lam__gte=start_date,
+        ngay_lam__lt=end_date
+    ).annotate(thang=TruncMonth('ngay_lam')).order_by().values('id_nhan_vien', 'thang').annotate(
+        tong_ngay_cong=Sum('ngay_cong'),
+        tong_gio_lam=Sum('gio_lam'),
+        so_ngay=Count('id')
+    )
+
+    with transaction.atomic():
+        existing = AttendanceMonthly.objects.filter(thang__gte=start_date, thang__lt=end_date)
+        old_totals = {
+            (id_nhan_vien, thang): totals
+            for id_nhan_vien, thang, *totals in existing.values_list('id_nhan_vien', 'thang', 'tong_ngay_cong', 'tong_gio_lam', 'so_ngay')
+        }
+        existing.delete()
+        created = AttendanceMonthly.objects.bulk_create(
+            AttendanceMonthly(
+                id_nhan_vien_id=row['id_nhan_vien'],
+                thang=row['thang'],
+                tong_ngay_cong=row['tong_ngay_cong'] or 0,
+                tong_gio_lam=row['tong_gio_lam'] or 0,
+                so_ngay=row['so_ngay'],
+            )
+            for row in rows.iterator(chunk_size=2000)
+        )
+        # Chỉ đánh dấu tính lại lương cho những dòng tổng hợp thực sự thay đổi
+        new_totals = {
+            (row.id_nhan_vien_id, row.thang): [row.tong_ngay_cong, row.tong_gio_lam, row.so_ngay]
+            for row in created
+        }
+        mark_payroll_dirty(key for key in old_totals.keys() | new_totals.keys() if old_totals.get(key) != new_totals.get(key))
+    return len(created)
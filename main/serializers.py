@@ -3,7 +3,7 @@ from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
 from .models import (
     KhuVuc, QuocGia, DiaDiem, CongViec, PhongBan, 
-    NhanVien, NguoiPhuThuoc, Attendance, PayrollRecord
+    NhanVien, NguoiPhuThuoc, Attendance, PayrollRecord, PayrollJob
 )
 
 
@@ -79,13 +79,24 @@ class PhongBanSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class SparseFieldsetSerializerMixin:
+    """Chỉ giữ các field có trong context['fields'] (xem SparseFieldsMixin)"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = self.context.get('fields')
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
 class NguoiPhuThuocSerializer(serializers.ModelSerializer):
     class Meta:
         model = NguoiPhuThuoc
         fields = '__all__'
 
 
-class NhanVienSerializer(serializers.ModelSerializer):
+class NhanVienSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     ten_cong_viec = serializers.CharField(source='id_cong_viec.ten_cong_viec', read_only=True)
     ten_phong_ban = serializers.CharField(source='id_phong_ban.ten_phong_ban', read_only=True)
     ten_quan_ly = serializers.SerializerMethodField()
@@ -101,7 +112,7 @@ class NhanVienSerializer(serializers.ModelSerializer):
         return None
 
 
-class NhanVienDetailSerializer(serializers.ModelSerializer):
+class NhanVienDetailSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     ten_cong_viec = serializers.CharField(source='id_cong_viec.ten_cong_viec', read_only=True)
     ten_phong_ban = serializers.CharField(source='id_phong_ban.ten_phong_ban', read_only=True)
     ten_quan_ly = serializers.SerializerMethodField()
@@ -152,4 +163,12 @@ class PayrollRecordSerializer(serializers.ModelSerializer):
 
 class PayrollCalculationSerializer(serializers.Serializer):
     thang = serializers.DateField(help_text="Ngày đầu tháng (VD: 2024-01-01)")
-    id_nhan_vien = serializers.IntegerField(required=False, help_text="ID nhân viên cụ thể (nếu không có sẽ tính cho tất cả)") 
\ No newline at end of file
+    id_nhan_vien = serializers.IntegerField(required=False, help_text="ID nhân viên cụ thể (nếu không có sẽ tính cho tất cả)") 
+
+
+class PayrollJobSerializer(serializers.ModelSerializer):
+    trang_thai_display = serializers.CharField(source='get_trang_thai_display', read_only=True)
+
+    class Meta:
+        model = PayrollJob
+        fields = '__all__'
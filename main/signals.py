@@ -0,0 +1,51 @@
+from functools import partial
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from . import metrics
+from .profiling import install_query_profiler
+from .caching import bump_model_version, bump_version
+from .models import KhuVuc, QuocGia, DiaDiem, CongViec, PhongBan, NhanVien, Attendance
+from .org_chart import ORG_CHART_VERSION
+from .rollups import remove_attendance
+
+# Dữ liệu danh mục được cache response (xem ResponseCacheMixin)
+CACHED_MODELS = (KhuVuc, QuocGia, DiaDiem, CongViec, PhongBan)
+
+
+@receiver(post_delete, sender=Attendance)
+def attendance_deleted(sender, instance, **kwargs):
+    state = getattr(instance, '_rollup_state', None) or instance._get_rollup_state()
+    if state is not None:
+        remove_attendance(*state)
+
+
+# Phiên bản chỉ đổi sau khi transaction commit: đổi sớm hơn thì request khác có
+# thể đọc dữ liệu cũ (chưa commit) và cache nó dưới phiên bản mới
+def reference_data_changed(sender, using, **kwargs):
+    transaction.on_commit(partial(bump_model_version, sender), using=using)
+
+
+for model in CACHED_MODELS:
+    post_save.connect(reference_data_changed, sender=model)
+    post_delete.connect(reference_data_changed, sender=model)
+
+
+@receiver(post_save, sender=NhanVien)
+def employee_saved(sender, instance, created, using, **kwargs):
+    state = instance._get_org_chart_state()
+    if created or state != getattr(instance, '_org_chart_state', None):
+        instance._org_chart_state = state
+        transaction.on_commit(partial(bump_version, ORG_CHART_VERSION), using=using)
+
+
+@receiver(post_delete, sender=NhanVien)
+def employee_deleted(sender, instance, using, **kwargs):
+    transaction.on_commit(partial(bump_version, ORG_CHART_VERSION), using=using)
+
+
+@receiver(connection_created)
+def database_connected(sender, connection, **kwargs):
+    metrics.DB_CONNECTIONS_OPENED.inc(alias=connection.alias)
+    install_query_profiler(connection)
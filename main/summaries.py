@@ -0,0 +1,121 @@
+"""
+Queryset của các báo cáo tổng hợp, dùng chung cho view DRF (WSGI) và view
+async (main.async_views). Các hàm chỉ dựng queryset, chưa chạy truy vấn,
+nên bên gọi tự chọn cách đọc (đồng bộ hay async).
+"""
+from datetime import date
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncWeek
+from django.utils import timezone
+from .models import Attendance, AttendanceMonthly, PayrollRecord
+from .org_chart import reports_under
+from .utils import month_range
+
+
+class SummaryError(Exception):
+    """Tham số báo cáo không hợp lệ, view trả về 400"""
+
+
+# Các chiều gom nhóm của summary: tên trong ?group_by= -> {khóa trả về: cột hoặc biểu thức}
+SUMMARY_GROUPS = {
+    'nhan_vien': {'id_nhan_vien': 'id_nhan_vien', 'ho': 'id_nhan_vien__ho', 'ten': 'id_nhan_vien__ten'},
+    'phong_ban': {'id_phong_ban': 'id_nhan_vien__id_phong_ban', 'ten_phong_ban': 'id_nhan_vien__id_phong_ban__ten_phong_ban'},
+    'tuan': {'tuan': TruncWeek('ngay_lam')},
+    'ngay': {'ngay': 'ngay_lam'},
+}
+
+
+def parse_month(thang):
+    """Khoảng ngày của tháng ``thang`` (YYYY-MM), mặc định tháng hiện tại"""
+    if not thang:
+        thang = timezone.now().strftime('%Y-%m')
+    try:
+        year, month = map(int, thang.split('-'))
+        return month_range(date(year, month, 1))
+    except ValueError:
+        raise SummaryError('Định dạng tháng không đúng (YYYY-MM)')
+
+
+def parse_id(value, label):
+    """ID từ query param (chuỗi số, trong khoảng bigint), sai thì raise SummaryError"""
+    if not (value.isascii() and value.isdigit() and len(value) <= 18):
+        raise SummaryError(f'ID {label} không hợp lệ')
+    return int(value)
+
+
+def attendance_summary(params):
+    """
+    Queryset tổng hợp chấm công theo tháng (một truy vấn GROUP BY) từ query
+    params của request. Trả về (queryset các dict, đổi tên cột).
+    """
+    id_nhan_vien = params.get('id_nhan_vien')
+    id_phong_ban = params.get('id_phong_ban')
+    quan_ly = params.get('quan_ly')  # Chỉ tính các nhân viên dưới quyền (mọi cấp)
+    group_by = params.get('group_by', 'nhan_vien')  # VD: nhan_vien,tuan
+
+    start_date, end_date = parse_month(params.get('thang'))
+
+    groups = [g.strip() for g in group_by.split(',') if g.strip()]
+    invalid = [g for g in groups if g not in SUMMARY_GROUPS]
+    if not groups or invalid:
+        raise SummaryError(f'group_by chỉ nhận: {", ".join(SUMMARY_GROUPS)}')
+
+    # Gom theo nhân viên/phòng ban thì đọc bảng tổng hợp tháng, theo tuần/ngày thì đọc dữ liệu gốc
+    if set(groups) <= {'nhan_vien', 'phong_ban'}:
+        queryset = AttendanceMonthly.objects.filter(thang=start_date)
+        totals = {
+            'tong_ngay_lam': Sum('tong_ngay_cong'),
+            'tong_gio_lam': Sum('tong_gio_lam'),
+            'so_ngay_cham_cong': Sum('so_ngay')
+        }
+    else:
+        queryset = Attendance.objects.filter(ngay_lam__gte=start_date, ngay_lam__lt=end_date)
+        totals = {
+            'tong_ngay_lam': Sum('ngay_cong'),
+            'tong_gio_lam': Sum('gio_lam'),
+            'so_ngay_cham_cong': Count('id')
+        }
+
+    if id_nhan_vien:
+        queryset = queryset.filter(id_nhan_vien_id=parse_id(id_nhan_vien, 'nhân viên'))
+    if id_phong_ban:
+        queryset = queryset.filter(id_nhan_vien__id_phong_ban_id=parse_id(id_phong_ban, 'phòng ban'))
+    if quan_ly:
+        queryset = queryset.filter(id_nhan_vien__in=reports_under(parse_id(quan_ly, 'quản lý')))
+
+    fields, expressions, renames = [], {}, {}
+    for g in groups:
+        for key, column in SUMMARY_GROUPS[g].items():
+            if isinstance(column, str):
+                fields.append(column)
+                renames[column] = key
+            else:
+                expressions[key] = column
+    queryset = queryset.values(*fields, **expressions).annotate(**totals).order_by(*fields, *expressions)
+    return queryset, renames
+
+
+def format_summary_row(row, renames):
+    row = {renames.get(key, key): value for key, value in row.items()}
+    if 'ho' in row:
+        row['ho_ten'] = f"{row.pop('ho')} {row.pop('ten')}"
+    row['tong_ngay_lam'] = float(row['tong_ngay_lam'] or 0)
+    row['tong_gio_lam'] = float(row['tong_gio_lam'] or 0)
+    return row
+
+
+def payroll_by_department(params, queryset=None):
+    """Queryset bảng lương của một phòng ban trong tháng (kèm nhân viên để serialize)"""
+    id_phong_ban = params.get('id_phong_ban')
+    if not id_phong_ban:
+        raise SummaryError('ID phòng ban là bắt buộc')
+    id_phong_ban = parse_id(id_phong_ban, 'phòng ban')
+    start_date, end_date = parse_month(params.get('thang'))
+
+    if queryset is None:
+        queryset = PayrollRecord.objects.select_related('id_nhan_vien')
+    return queryset.filter(
+        id_nhan_vien__id_phong_ban_id=id_phong_ban,
+        thang__gte=start_date,
+        thang__lt=end_date
+    )
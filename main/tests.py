@@ -1,3 +1,1041 @@
-from django.test import TestCase
+from datetime import date, datetime, timedelta
+from decimal import Decimal, ROUND_HALF_EVEN, ROUND_HALF_UP, localcontext
+import base64
+import io
+import json
+import os
+import random
+import smtplib
+import tempfile
+from concurrent.futures import Future
+from unittest.mock import patch
+from django.db import connection
+from django.db.models import Sum
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from .models import (
+    KhuVuc, QuocGia, DiaDiem, CongViec, PhongBan, NhanVien, NguoiPhuThuoc,
+    Attendance, AttendanceMonthly, PayrollRecord, PayrollJob, PayrollJobChunk, PayrollEmail, PayrollDirty
+)
+from .mailing import dispatch_payroll_emails
+from .payroll_engine import calculate_monthly_payroll, calculate_net_salaries, calculate_work_hours
+from .payslips import get_payslip_template, render_payslips
+from .payroll_jobs import LeaseLost, enqueue_payroll_job, claim_next_chunk, run_chunk
+from .rollups import rebuild_attendance_rollups
+from .db_routers import PrimaryReplicaRouter, read_for_reporting, read_from_replica, replication_lag
+from . import metrics, punches
+from .urls import router
 
-# Create your tests here.
+
+def tao_nhan_vien(cong_viec, phong_ban=None, luong=Decimal('22000000'), **kwargs):
+    return NhanVien.objects.create(
+        ho=kwargs.pop('ho', 'Nguyen'),
+        ten=kwargs.pop('ten', 'An'),
+        ngay_thue=kwargs.pop('ngay_thue', date(2024, 1, 1)),
+        id_cong_viec=cong_viec,
+        id_phong_ban=phong_ban,
+        luong=luong,
+        **kwargs
+    )
+
+
+def tao_cham_cong(nhan_vien, ngay_lam, so_gio=8):
+    check_in = timezone.make_aware(datetime(ngay_lam.year, ngay_lam.month, ngay_lam.day, 8))
+    return Attendance.objects.create(
+        id_nhan_vien=nhan_vien,
+        ngay_lam=ngay_lam,
+        check_in=check_in,
+        check_out=check_in + timedelta(hours=so_gio)
+    )
+
+
+class PayrollEngineTests(TestCase):
+    def setUp(self):
+        self.cong_viec = CongViec.objects.create(ten_cong_viec='Dev')
+        self.phong_ban = PhongBan.objects.create(ten_phong_ban='IT')
+
+    def test_matches_payroll_record_save(self):
+        nhan_vien = tao_nhan_vien(self.cong_viec, self.phong_ban)
+        tao_cham_cong(nhan_vien, date(2024, 3, 4))
+        tao_cham_cong(nhan_vien, date(2024, 3, 5), so_gio=4)
+        tao_cham_cong(nhan_vien, date(2024, 4, 1))
+
+        results = calculate_monthly_payroll(date(2024, 3, 1))
+
+        record = PayrollRecord.objects.get(id_nhan_vien=nhan_vien, thang=date(2024, 3, 1))
+        self.assertEqual(record.tong_ngay_lam, Decimal('1.50'))
+        self.assertEqual(record.luong_thuc_nhan, Decimal('1500000.00'))
+        self.assertTrue(results[0]['created'])
+
+        reference = PayrollRecord(id_nhan_vien=nhan_vien, thang=date(2024, 3, 1))
+        reference.tong_ngay_lam = reference.calculate_total_days()
+        self.assertEqual(reference.tong_ngay_lam, record.tong_ngay_lam)
+
+        results = calculate_monthly_payroll(date(2024, 3, 1))
+        self.assertFalse(results[0]['created'])
+        self.assertEqual(PayrollRecord.objects.count(), 1)
+
+    def test_query_count_is_constant(self):
+        def count_queries(so_nhan_vien):
+            for _ in range(so_nhan_vien):
+                tao_cham_cong(tao_nhan_vien(self.cong_viec, self.phong_ban), date(2024, 3, 4))
+            with CaptureQueriesContext(connection) as ctx:
+                calculate_monthly_payroll(date(2024, 3, 1))
+            return len(ctx.captured_queries)
+
+        self.assertEqual(count_queries(2), count_queries(20))
+
+    def test_fixed_point_math_matches_exact_decimal(self):
+        check_in = timezone.make_aware(datetime(2024, 3, 4, 8))
+        durations = [timedelta(hours=8), timedelta(minutes=30, seconds=18), timedelta(minutes=36),
+                     timedelta(hours=9, microseconds=1), timedelta(seconds=-18)]
+        rng = random.Random(2024)
+        durations += [timedelta(microseconds=rng.randrange(86400 * 10 ** 6)) for _ in range(500)]
+        rows = [(Decimal(rng.randrange(3100)).scaleb(-2), Decimal(rng.randrange(10 ** 10)).scaleb(-2)) for _ in range(500)]
+        rows += [(Decimal('0.01'), Decimal('11.00')), (Decimal('0.03'), Decimal('11.00')), (Decimal('0'), Decimal('1000'))]
+
+        with localcontext(prec=60):
+            exact_hours = [
+                (Decimal(d // timedelta(microseconds=1)) / 3600000000).quantize(Decimal('0.01'), ROUND_HALF_UP)
+                for d in durations
+            ]
+            exact_days = [
+                (Decimal(d // timedelta(microseconds=1)) / 28800000000).quantize(Decimal('0.01'), ROUND_HALF_EVEN)
+                for d in durations
+            ]
+            exact_salaries = [
+                (ngay * luong / 22).quantize(Decimal('0.01'), ROUND_HALF_EVEN) if ngay > 0 else Decimal('0')
+                for ngay, luong in rows
+            ]
+
+        results = calculate_work_hours([check_in] * len(durations), [check_in + d for d in durations])
+        self.assertEqual([gio_lam for gio_lam, _ in results], exact_hours)
+        self.assertEqual([ngay_cong for _, ngay_cong in results], exact_days)
+        self.assertEqual(calculate_net_salaries(rows), exact_salaries)
+        self.assertEqual(str(calculate_net_salaries([(Decimal('1'), Decimal('22000000'))])[0]), '1000000.00')
+
+
+class PayrollPreviewTests(TestCase):
+    def setUp(self):
+        cong_viec = CongViec.objects.create(ten_cong_viec='Dev')
+        self.an = tao_nhan_vien(cong_viec)
+        self.binh = tao_nhan_vien(cong_viec, ten='Binh')
+        tao_cham_cong(self.an, date(2024, 3, 4))
+        tao_cham_cong(self.binh, date(2024, 3, 4), so_gio=4)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('hr'))
+
+    def preview(self, **params):
+        response = self.client.get('/api/payroll/preview/', {'thang': '2024-03-01', **params})
+        self.assertEqual(response.status_code, 200)
+        return json.loads(b''.join(response.streaming_content))
+
+    def test_preview_writes_nothing_and_diffs_stored_records(self):
+        with CaptureQueriesContext(connection) as ctx:
+            rows = self.preview()
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertFalse(PayrollRecord.objects.exists())
+        self.assertEqual([(row['luong_thuc_nhan'], row['trang_thai']) for row in rows], [('1000000.00', 'moi'), ('500000.00', 'moi')])
+
+        calculate_monthly_payroll(date(2024, 3, 1))
+        tao_cham_cong(self.binh, date(2024, 3, 5))
+        rows = self.preview(chi_thay_doi='true')
+        self.assertEqual([(row['id_nhan_vien'], row['luong_thuc_nhan_da_luu'], row['luong_thuc_nhan']) for row in rows],
+                         [(self.binh.pk, '500000.00', '1500000.00')])
+
+        # Chỉ ghi lại bảng lương có thay đổi
+        with CaptureQueriesContext(connection) as ctx:
+            results = calculate_monthly_payroll(date(2024, 3, 1))
+        self.assertEqual([r['changed'] for r in results], [False, True])
+        self.assertEqual(len([q for q in ctx.captured_queries if q['sql'].startswith('INSERT')]), 1)
+        with CaptureQueriesContext(connection) as ctx:
+            calculate_monthly_payroll(date(2024, 3, 1))
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_attendance_edits_mark_payroll_dirty_and_recalculate_incrementally(self):
+        calculate_monthly_payroll(date(2024, 3, 1))
+        self.assertFalse(PayrollDirty.objects.exists())
+
+        tao_cham_cong(self.binh, date(2024, 3, 5))
+        tao_cham_cong(self.an, date(2024, 4, 1))  # Tháng 4 chưa tính lương thì không đánh dấu
+        self.assertEqual(list(PayrollDirty.objects.values_list('id_nhan_vien', 'thang')), [(self.binh.pk, date(2024, 3, 1))])
+
+        self.assertEqual(self.client.post('/api/payroll/recalculate_dirty/', {'limit': -5}, format='json').status_code, 400)
+        response = self.client.post('/api/payroll/recalculate_dirty/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(r['id_nhan_vien'], r['changed']) for r in response.data['results']], [(self.binh.pk, True)])
+        self.assertEqual(PayrollRecord.objects.get(id_nhan_vien=self.binh, thang=date(2024, 3, 1)).luong_thuc_nhan, Decimal('1500000.00'))
+        self.assertFalse(PayrollDirty.objects.exists())
+
+        # Xóa chấm công cũng đánh dấu lại (sau khi commit)
+        with self.captureOnCommitCallbacks(execute=True):
+            Attendance.objects.filter(id_nhan_vien=self.binh, ngay_lam=date(2024, 3, 5)).delete()
+        self.assertTrue(PayrollDirty.objects.filter(id_nhan_vien=self.binh).exists())
+
+    def test_deleting_employee_with_payroll_and_attendance(self):
+        phong_ban = PhongBan.objects.create(ten_phong_ban='IT')
+        NhanVien.objects.filter(pk=self.an.pk).update(id_phong_ban=phong_ban)
+        calculate_monthly_payroll(date(2024, 3, 1))
+
+        # Xóa dây chuyền không được đánh dấu bảng lương của nhân viên đang bị xóa
+        with self.captureOnCommitCallbacks(execute=True):
+            self.binh.delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            phong_ban.delete()
+        connection.check_constraints()
+        self.assertFalse(PayrollRecord.objects.exists())
+        self.assertFalse(PayrollDirty.objects.exists())
+        self.assertFalse(AttendanceMonthly.objects.exists())
+
+
+class PayrollJobTests(TestCase):
+    def test_job_is_split_by_department_and_tracks_progress(self):
+        cong_viec = CongViec.objects.create(ten_cong_viec='Dev')
+        it = PhongBan.objects.create(ten_phong_ban='IT')
+        hr = PhongBan.objects.create(ten_phong_ban='HR')
+        for phong_ban in (it, it, hr, None):
+            tao_cham_cong(tao_nhan_vien(cong_viec, phong_ban), date(2024, 3, 4))
+
+        job = enqueue_payroll_job(date(2024, 3, 15))
+        self.assertEqual(job.tong_so_nhan_vien, 4)
+        self.assertEqual(job.chunks.count(), 3)
+
+        while (chunk := claim_next_chunk()) is not None:
+            run_chunk(chunk)
+
+        job = PayrollJob.objects.get(pk=job.pk)
+        self.assertEqual(job.trang_thai, 'done')
+        self.assertEqual(job.so_nhan_vien_xong, 4)
+        self.assertEqual(PayrollRecord.objects.filter(thang=date(2024, 3, 1)).count(), 4)
+
+    def test_chunk_of_dead_worker_is_reclaimed_after_lease(self):
+        cong_viec = CongViec.objects.create(ten_cong_viec='Dev')
+        tao_cham_cong(tao_nhan_vien(cong_viec, PhongBan.objects.create(ten_phong_ban='IT')), date(2024, 3, 4))
+        job = enqueue_payroll_job(date(2024, 3, 15))
+
+        dead = claim_next_chunk()
+        self.assertIsNone(claim_next_chunk())  # Còn trong thời hạn lease
+        PayrollJobChunk.objects.filter(pk=dead.pk).update(bat_dau=timezone.now() - timedelta(hours=1))
+        dead.refresh_from_db()
+
+        chunk = claim_next_chunk()
+        self.assertEqual(chunk.pk, dead.pk)
+        run_chunk(chunk)
+        # Worker cũ chạy xong muộn không ghi đè trạng thái, không đếm trùng tiến độ
+        run_chunk(dead)
+
+        job = PayrollJob.objects.get(pk=job.pk)
+        self.assertEqual((job.trang_thai, job.so_nhan_vien_xong), ('done', 1))
+
+    @override_settings(PAYROLL_CHUNK_LEASE_SECONDS=0, EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+                       PAYROLL_EMAIL_BATCH_SIZE=1, PAYROLL_EMAIL_RATE_LIMIT=0)
+    def test_long_running_chunk_renews_lease_and_stops_when_lost(self):
+        cong_viec = CongViec.objects.create(ten_cong_viec='Dev')
+        it = PhongBan.objects.create(ten_phong_ban='IT')
+        for i in range(2):
+            tao_cham_cong(tao_nhan_vien(cong_viec, it, email=f'nv{i}@company.com'), date(2024, 3, 4))
+        calculate_monthly_payroll(date(2024, 3, 1))
+
+        # Mỗi lô email gia hạn lease: bat_dau của phần việc tiến lên trong lúc chạy
+        job = enqueue_payroll_job(date(2024, 3, 15), loai='gui_email')
+        chunk = claim_next_chunk()
+        claimed_at = chunk.bat_dau
+        run_chunk(chunk)
+        self.assertGreater(chunk.bat_dau, claimed_at)
+        self.assertEqual(PayrollJobChunk.objects.get(pk=chunk.pk).bat_dau, chunk.bat_dau)
+        self.assertEqual(PayrollJob.objects.get(pk=job.pk).trang_thai, 'done')
+
+        # Worker khác đã nhận lại phần việc thì worker cũ dừng, không ghi kết quả
+        job = enqueue_payroll_job(date(2024, 3, 15), loai='gui_email')
+        chunk = claim_next_chunk()
+        PayrollJobChunk.objects.filter(pk=chunk.pk).update(bat_dau=timezone.now() + timedelta(seconds=1))
+        with self.assertRaises(LeaseLost):
+            run_chunk(chunk)
+        self.assertEqual(PayrollJob.objects.get(pk=job.pk).trang_thai, 'running')
+
+
+class AttendanceSummaryTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('hr', password='x'))
+        cong_viec = CongViec.objects.create(ten_cong_viec='Dev')
+        self.it = PhongBan.objects.create(ten_phong_ban='IT')
+        self.an = tao_nhan_vien(cong_viec, self.it, ho='Nguyen', ten='An')
+        self.binh = tao_nhan_vien(cong_viec, self.it, ho='Tran', ten='Binh')
+        tao_cham_cong(self.an, date(2024, 3, 4))
+        tao_cham_cong(self.an, date(2024, 3, 12), so_gio=4)
+        tao_cham_cong(self.binh, date(2024, 3, 4))
+
+    def test_summary_per_employee(self):
+        response = self.client.get('/api/attendance/summary/', {'thang': '2024-03'})
+        self.assertEqual(response.status_code, 200)
+        rows = {row['id_nhan_vien']: row for row in response.data['results']}
+        self.assertEqual(rows[self.an.pk]['ho_ten'], 'Nguyen An')
+        self.assertEqual(rows[self.an.pk]['tong_ngay_lam'], 1.5)
+        self.assertEqual(rows[self.an.pk]['tong_gio_lam'], 12.0)
+        self.assertEqual(rows[self.an.pk]['so_ngay_cham_cong'], 2)
+
+    def test_summary_grouped_by_department_and_week(self):
+        response = self.client.get('/api/attendance/summary/', {'thang': '2024-03', 'group_by': 'phong_ban,tuan'})
+        self.assertEqual(response.status_code, 200)
+        rows = response.data['results']
+        self.assertEqual([row['tuan'] for row in rows], [date(2024, 3, 4), date(2024, 3, 11)])
+        self.assertEqual(rows[0]['ten_phong_ban'], 'IT')
+        self.assertEqual(rows[0]['so_ngay_cham_cong'], 2)
+
+    def test_summary_rejects_unknown_group(self):
+        response = self.client.get('/api/attendance/summary/', {'group_by': 'quoc_gia'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_summary_rejects_non_numeric_ids(self):
+        for params in ({'id_nhan_vien': 'abc'}, {'id_phong_ban': '1;'}, {'quan_ly': '²'}):
+            response = self.client.get('/api/attendance/summary/', {'thang': '2024-03', **params})
+            self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/payroll/by_department/', {'id_phong_ban': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+
+class AttendanceRollupTests(TestCase):
+    def setUp(self):
+        cong_viec = CongViec.objects.create(ten_cong_viec='Dev')
+        self.nhan_vien = tao_nhan_vien(cong_viec)
+        self.thang = date.today().replace(day=1)
+
+    def get_rollup(self):
+        return AttendanceMonthly.objects.get(id_nhan_vien=self.nhan_vien, thang=self.thang)
+
+    def test_rollup_follows_check_in_check_out_and_delete(self):
+        check_in = timezone.now() - timedelta(hours=6)
+        attendance = Attendance.objects.create(id_nhan_vien=self.nhan_vien, check_in=check_in)
+        self.assertEqual((self.get_rollup().so_ngay, self.get_rollup().tong_ngay_cong), (1, 0))
+
+        attendance = Attendance.objects.get(pk=attendance.pk)
+        attendance.check_out = check_in + timedelta(hours=6)
+        attendance.save()
+        rollup = self.get_rollup()
+        self.assertEqual((rollup.so_ngay, rollup.tong_gio_lam, rollup.tong_ngay_cong), (1, Decimal('6.00'), Decimal('0.75')))
+
+        Attendance.objects.filter(pk=attendance.pk).delete()
+        rollup = self.get_rollup()
+        self.assertEqual((rollup.so_ngay, rollup.tong_gio_lam, rollup.tong_ngay_cong), (0, 0, 0))
+
+    def test_rebuild_repairs_rows_written_without_save(self):
+        Attendance.objects.bulk_create([
+            Attendance(id_nhan_vien=self.nhan_vien, gio_lam=Decimal('8.00'), ngay_cong=Decimal('1.00'))
+        ])
+        self.assertFalse(AttendanceMonthly.objects.exists())
+
+        self.assertEqual(rebuild_attendance_rollups(self.thang, self.thang), 1)
+        self.assertEqual(self.get_rollup().tong_ngay_cong, Decimal('1.00'))
+
+
+class AttendancePunchTests(TestCase):
+    def setUp(self):
+        self.nhan_vien = tao_nhan_vien(CongViec.objects.create(ten_cong_viec='Dev'))
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('nv'))
+
+    def punch(self, action, id_nhan_vien=None):
+        return self.client.post(f'/api/attendance/{action}/', {'id_nhan_vien': id_nhan_vien or self.nhan_vien.pk}, format='json')
+
+    def test_check_in_and_check_out(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.punch('check_in')
+        self.assertEqual(response.status_code, 201)
+        self.assertLessEqual(len([q for q in ctx.captured_queries if 'attendance' in q['sql']]), 2)
+        self.assertEqual(self.punch('check_in').data, {'error': 'Đã check-in hôm nay rồi'})
+
+        Attendance.objects.filter(pk=response.data['id']).update(check_in=timezone.now() - timedelta(hours=6))
+        response = self.punch('check_out')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['gio_lam'], response.data['ngay_cong']), (Decimal('6.00'), Decimal('0.75')))
+        self.assertEqual(self.punch('check_out').data, {'error': 'Đã check-out hôm nay rồi'})
+
+        attendance = Attendance.objects.get()
+        self.assertEqual((attendance.gio_lam, attendance.ngay_cong), (Decimal('6.00'), Decimal('0.75')))
+        rollup = AttendanceMonthly.objects.get()
+        self.assertEqual((rollup.tong_ngay_cong, rollup.tong_gio_lam, rollup.so_ngay), (Decimal('0.75'), Decimal('6.00'), 1))
+
+    def test_check_out_rounds_like_calculate_work_hours(self):
+        now = timezone.now()
+        Attendance.objects.create(id_nhan_vien=self.nhan_vien, ngay_lam=date.today(), check_in=now - timedelta(hours=1))
+        data = punches.check_out(self.nhan_vien.pk, now)
+
+        # 1 giờ = 0.125 ngày công, làm tròn về số chẵn
+        self.assertEqual((data['gio_lam'], data['ngay_cong']), (Decimal('1.00'), Decimal('0.12')))
+        self.assertEqual(Attendance.objects.values_list('ngay_cong', flat=True).get(), Decimal('0.12'))
+
+    def test_punch_errors(self):
+        self.assertEqual(self.punch('check_out').data, {'error': 'Chưa check-in hôm nay'})
+        self.assertEqual(self.punch('check_in', 999999).status_code, 404)
+        self.assertEqual(self.punch('check_in', 'abc').status_code, 400)
+        self.assertFalse(Attendance.objects.exists())
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user('hr')
+        self.headers = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(user).access_token}'}
+        self.api = APIClient()
+        self.api.force_authenticate(user)
+        cong_viec = CongViec.objects.create(ten_cong_viec='Dev')
+        self.it = PhongBan.objects.create(ten_phong_ban='IT')
+        self.an = tao_nhan_vien(cong_viec, self.it)
+        tao_cham_cong(self.an, date(2024, 3, 4))
+        calculate_monthly_payroll(date(2024, 3, 1))
+
+    def test_matches_drf_endpoints(self):
+        for async_url, url in [
+            ('/api/async/attendance/summary/?thang=2024-03&group_by=phong_ban,tuan', '/api/attendance/summary/?thang=2024-03&group_by=phong_ban,tuan'),
+            (f'/api/async/payroll/by_department/?id_phong_ban={self.it.pk}&thang=2024-03', f'/api/payroll/by_department/?id_phong_ban={self.it.pk}&thang=2024-03'),
+            ('/api/async/jobs/', '/api/jobs/'),
+        ]:
+            response = self.client.get(async_url, **self.headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), self.api.get(url).json())
+
+        response = self.client.get('/api/async/departments/', **self.headers)
+        self.assertEqual(self.client.get('/api/async/departments/', HTTP_IF_NONE_MATCH=response['ETag'], **self.headers).status_code, 304)
+        self.assertEqual(self.client.get('/api/async/attendance/summary/?group_by=quoc_gia', **self.headers).status_code, 400)
+
+    def test_punches_and_jwt(self):
+        self.assertEqual(self.client.get('/api/async/jobs/').status_code, 401)
+        self.assertEqual(self.client.get('/api/async/jobs/', HTTP_AUTHORIZATION='Bearer x').status_code, 401)
+
+        def punch(action):
+            return self.client.post(f'/api/async/attendance/{action}/', {'id_nhan_vien': self.an.pk}, content_type='application/json', **self.headers)
+
+        response = punch('check_in')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(punch('check_in').json(), {'error': 'Đã check-in hôm nay rồi'})
+        self.assertEqual(punch('check_out').status_code, 200)
+        self.assertTrue(Attendance.objects.filter(pk=response.json()['id'], check_out__isnull=False).exists())
+
+
+class DatabaseRouterTests(TestCase):
+    def test_reads_go_to_replica_only_inside_read_from_replica(self):
+        router = PrimaryReplicaRouter()
+        with override_settings(DATABASE_REPLICAS=['replica']):
+            self.assertEqual(router.db_for_read(Attendance), 'default')
+            with read_from_replica():
+                self.assertEqual(router.db_for_read(Attendance), 'replica')
+                self.assertEqual(router.db_for_write(Attendance), 'default')
+            self.assertFalse(router.allow_migrate('replica', 'main'))
+        with read_from_replica():
+            # Không cấu hình replica thì vẫn đọc primary
+            self.assertEqual(router.db_for_read(Attendance), 'default')
+
+    def test_only_listed_get_actions_read_from_replica(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('hr'))
+        with patch('main.mixins.read_from_replica', wraps=read_from_replica) as replica:
+            client.get('/api/attendance/')
+            client.get('/api/payroll/')
+            client.post('/api/attendance/check_in/', {'id_nhan_vien': 1}, format='json')
+            client.get('/api/regions/')
+        self.assertEqual(replica.call_count, 2)
+
+    @override_settings(REPORTING_DATABASE='default', REPORTING_MAX_LAG_SECONDS=10)
+    def test_reports_fall_back_to_primary_when_reporting_database_lags(self):
+        def fallbacks(ly_do):
+            return metrics.REPORTING_READS.values.get(('default', ly_do), 0)
+
+        router = PrimaryReplicaRouter()
+        before = fallbacks('tre'), fallbacks('loi')
+        with override_settings(REPORTING_DATABASE='reporting'):
+            with patch('main.db_routers.replication_lag', return_value=3):
+                self.assertEqual(PayrollRecord.objects.using_reporting().db, 'reporting')
+                with read_for_reporting():
+                    self.assertEqual(router.db_for_read(Attendance), 'reporting')
+            with patch('main.db_routers.replication_lag', return_value=60):
+                self.assertEqual(Attendance.objects.using_reporting().db, 'default')
+            with patch('main.db_routers.replication_lag', return_value=None):
+                self.assertEqual(Attendance.objects.using_reporting().db, 'default')
+        self.assertEqual((fallbacks('tre'), fallbacks('loi')), (before[0] + 1, before[1] + 1))
+
+        # Database không có replication (SQLite) luôn được coi là không trễ
+        self.assertEqual(replication_lag('default'), 0.0)
+        self.assertIn('hr_reporting_lag_seconds{database="default"} 0.0', self.client.get('/metrics').content.decode())
+
+
+class BulkPunchTests(TestCase):
+    def setUp(self):
+        cong_viec = CongViec.objects.create(ten_cong_viec='Dev')
+        self.an = tao_nhan_vien(cong_viec)
+        self.binh = tao_nhan_vien(cong_viec, ten='Binh')
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('may_cham_cong'))
+
+    def test_bulk_punch_pairs_and_rejects_events(self):
+        tao_cham_cong(self.binh, date(2024, 3, 4), so_gio=4)
+        events = [
+            {'id_nhan_vien': self.an.pk, 'thoi_gian': '2024-03-04T08:00:00', 'loai': 'check_in'},
+            {'id_nhan_vien': self.an.pk, 'thoi_gian': '2024-03-04T08:00:00', 'loai': 'check_in'},
+            {'id_nhan_vien': self.an.pk, 'thoi_gian': '2024-03-04T17:00:00', 'loai': 'check_out'},
+            {'id_nhan_vien': self.an.pk, 'thoi_gian': '2024-03-04T17:20:00', 'loai': 'check_out'},
+            {'id_nhan_vien': self.an.pk, 'thoi_gian': '2024-03-05T17:00:00', 'loai': 'check_out'},
+            {'id_nhan_vien': self.binh.pk, 'thoi_gian': '2024-03-04T18:00:00', 'loai': 'check_out'},
+            {'id_nhan_vien': 999999, 'thoi_gian': '2024-03-04T08:00:00', 'loai': 'check_in'},
+            {'id_nhan_vien': self.an.pk, 'thoi_gian': 'hom nay', 'loai': 'check_in'},
+        ]
+        response = self.client.post('/api/attendance/bulk_punch/', {'events': events}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['updated'], response.data['duplicates']), (1, 1, 1))
+        self.assertEqual(sorted(r['index'] for r in response.data['rejected']), [4, 6, 7])
+
+        an = Attendance.objects.get(id_nhan_vien=self.an)
+        self.assertEqual((an.gio_lam, an.ngay_cong), (Decimal('9.33'), Decimal('1.17')))
+        binh = Attendance.objects.get(id_nhan_vien=self.binh)
+        self.assertEqual((binh.gio_lam, binh.ngay_cong), (Decimal('10.00'), Decimal('1.25')))
+
+        # Bảng tổng hợp cộng theo chênh lệch phải khớp với tính lại từ đầu
+        rollups = list(AttendanceMonthly.objects.order_by('id_nhan_vien').values_list('tong_ngay_cong', 'tong_gio_lam', 'so_ngay'))
+        rebuild_attendance_rollups(date(2024, 3, 1), date(2024, 3, 31))
+        self.assertEqual(rollups, [(Decimal('1.17'), Decimal('9.33'), 1), (Decimal('1.25'), Decimal('10.00'), 1)])
+        self.assertEqual(rollups, list(AttendanceMonthly.objects.order_by('id_nhan_vien').values_list('tong_ngay_cong', 'tong_gio_lam', 'so_ngay')))
+
+    def test_row_created_after_read_is_merged(self):
+        # Dòng được check-in đồng thời tạo sau khi lô đã đọc (lần đọc đầu không thấy)
+        Attendance.objects.create(
+            id_nhan_vien=self.an, ngay_lam=date(2024, 3, 4),
+            check_in=timezone.make_aware(datetime(2024, 3, 4, 8, 0))
+        )
+        locked_attendances = punches._locked_attendances
+        reads = []
+
+        def first_read_misses(days):
+            reads.append(days)
+            return {} if len(reads) == 1 else locked_attendances(days)
+
+        with patch('main.punches._locked_attendances', side_effect=first_read_misses):
+            result = punches.ingest_punches([
+                {'id_nhan_vien': self.an.pk, 'thoi_gian': '2024-03-04T09:00:00', 'loai': 'check_in'},
+                {'id_nhan_vien': self.an.pk, 'thoi_gian': '2024-03-04T17:00:00', 'loai': 'check_out'},
+            ])
+
+        self.assertEqual(len(reads), 2)
+        self.assertEqual((result['created'], result['updated'], result['rejected']), (0, 1, []))
+        an = Attendance.objects.get(id_nhan_vien=self.an)
+        self.assertEqual((an.gio_lam, an.ngay_cong), (Decimal('9.00'), Decimal('1.12')))
+        self.assertEqual(AttendanceMonthly.objects.values_list('tong_gio_lam', 'so_ngay').get(), (Decimal('9.00'), 1))
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cong_viec = CongViec.objects.create(ten_cong_viec='Dev')
+        for ten in ('An', 'Binh', 'Chi'):
+            nhan_vien = tao_nhan_vien(cong_viec, ten=ten)
+            for day in (4, 5):
+                tao_cham_cong(nhan_vien, date(2024, 3, day))
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('hr'))
+
+    def test_walks_all_pages_forward_and_back(self):
+        response = self.client.get('/api/attendance/', {'page_size': 4})
+        self.assertNotIn('count', response.data)
+        self.assertIsNone(response.data['previous'])
+        first = [row['id'] for row in response.data['results']]
+
+        response = self.client.get(response.data['next'])
+        second = [row['id'] for row in response.data['results']]
+        self.assertIsNone(response.data['next'])
+
+        expected = list(Attendance.objects.order_by('-ngay_lam', '-id').values_list('id', flat=True))
+        self.assertEqual(first + second, expected)
+
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([row['id'] for row in response.data['results']], first)
+
+    def test_count_page_size_cap_and_invalid_cursor(self):
+        response = self.client.get('/api/attendance/', {'count': 'true', 'page_size': 5000})
+        self.assertEqual((response.data['count'], len(response.data['results'])), (6, 6))
+        self.assertEqual(self.client.get('/api/payroll/', {'cursor': 'khong-hop-le'}).status_code, 404)
+        for values in (['notadate', 'x'], ['2024-03-04', 10 ** 30], ['2024-03-04', None], {'a': 1}):
+            cursor = base64.urlsafe_b64encode(json.dumps({'v': values}).encode()).decode()
+            self.assertEqual(self.client.get('/api/attendance/', {'cursor': cursor}).status_code, 404)
+
+
+class NhanVienListTests(TestCase):
+    def setUp(self):
+        cong_viec = CongViec.objects.create(ten_cong_viec='Dev')
+        self.it = PhongBan.objects.create(ten_phong_ban='IT')
+        self.quan_ly = tao_nhan_vien(cong_viec, self.it, luong=Decimal('30000000'), ten='Quan')
+        tao_nhan_vien(cong_viec, self.it, luong=Decimal('15000000'), ten='Binh', id_quan_ly=self.quan_ly)
+        tao_nhan_vien(cong_viec, self.it, luong=Decimal('9000000'), ten='Chi', id_quan_ly=self.quan_ly)
+        tao_nhan_vien(cong_viec, None, luong=Decimal('20000000'), ten='Dung')
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('hr'))
+
+    def test_filters_and_ordering(self):
+        response = self.client.get('/api/employees/', {
+            'id_phong_ban': self.it.pk, 'luong_tu': '10000000', 'ordering': '-luong'
+        })
+        self.assertEqual([row['ten'] for row in response.data['results']], ['Quan', 'Binh'])
+        response = self.client.get('/api/employees/', {'id_quan_ly': self.quan_ly.pk, 'ordering': 'ten'})
+        self.assertEqual([row['ten'] for row in response.data['results']], ['Binh', 'Chi'])
+        self.assertEqual(self.client.get('/api/employees/', {'ngay_thue_tu': '2024-13-01'}).status_code, 400)
+
+    def test_sparse_fieldset_limits_columns(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/employees/', {'fields': 'id_nhan_vien,ho,ten,ten_quan_ly'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data['results'][1]), {'id_nhan_vien', 'ho', 'ten', 'ten_quan_ly'})
+        self.assertEqual(response.data['results'][1]['ten_quan_ly'], 'Nguyen Quan')
+
+        sql = ctx.captured_queries[-1]['sql']
+        self.assertNotIn('"luong"', sql)
+        self.assertNotIn('nguoi_phu_thuoc', ' '.join(q['sql'] for q in ctx.captured_queries))
+        self.assertEqual(self.client.get('/api/employees/', {'fields': 'id_nhan_vien,mat_khau'}).status_code, 400)
+
+
+class OrgChartTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        cong_viec = CongViec.objects.create(ten_cong_viec='Dev')
+        self.giam_doc = tao_nhan_vien(cong_viec, ten='GiamDoc')
+        self.truong_phong = tao_nhan_vien(cong_viec, ten='TruongPhong', id_quan_ly=self.giam_doc)
+        self.nhan_vien = tao_nhan_vien(cong_viec, ten='NhanVien', id_quan_ly=self.truong_phong)
+        self.khac = tao_nhan_vien(cong_viec, ten='Khac')
+        for nv in (self.truong_phong, self.nhan_vien, self.khac):
+            tao_cham_cong(nv, date(2024, 3, 4))
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('hr'))
+
+    def test_subtree_ancestors_and_headcount(self):
+        response = self.client.get(f'/api/employees/{self.giam_doc.pk}/subtree/')
+        self.assertEqual(
+            [(nv['ten'], nv['cap']) for nv in response.data['nhan_viens']], [('TruongPhong', 1), ('NhanVien', 2)]
+        )
+        response = self.client.get(f'/api/employees/{self.nhan_vien.pk}/ancestors/')
+        self.assertEqual([nv['ten'] for nv in response.data], ['TruongPhong', 'GiamDoc'])
+        response = self.client.get('/api/employees/headcount/')
+        self.assertEqual(
+            [(row['ten'], row['truc_tiep'], row['tong']) for row in response.data],
+            [('GiamDoc', 1, 2), ('TruongPhong', 1, 1)]
+        )
+        self.assertEqual(self.client.get('/api/employees/999999/subtree/').status_code, 404)
+
+    def test_cache_is_invalidated_when_manager_changes(self):
+        url = f'/api/employees/{self.giam_doc.pk}/subtree/'
+        self.assertEqual(self.client.get(url).data['so_cap_duoi'], 2)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        khac = NhanVien.objects.get(pk=self.khac.pk)
+        khac.id_quan_ly = self.truong_phong
+        with self.captureOnCommitCallbacks(execute=True):
+            khac.save()
+        self.assertEqual(self.client.get(url).data['so_cap_duoi'], 3)
+
+    def test_filter_attendance_and_payroll_by_manager(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/attendance/', {'quan_ly': self.giam_doc.pk})
+        self.assertEqual({row['id_nhan_vien'] for row in response.data['results']}, {self.truong_phong.pk, self.nhan_vien.pk})
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+        calculate_monthly_payroll(date(2024, 3, 1))
+        response = self.client.get('/api/payroll/', {'quan_ly': self.truong_phong.pk})
+        self.assertEqual([row['id_nhan_vien'] for row in response.data['results']], [self.nhan_vien.pk])
+        response = self.client.get('/api/attendance/summary/', {'thang': '2024-03', 'quan_ly': self.giam_doc.pk})
+        self.assertEqual(len(response.data['results']), 2)
+
+
+class ListQueryCountTests(TestCase):
+    """Số truy vấn của các endpoint danh sách không được tăng theo số dòng trả về."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('hr', password='x'))
+        self.khu_vuc = KhuVuc.objects.create(ten_khu_vuc='Asia')
+        self.phong_ban = None
+        self.nhan_vien = None
+        self.so_dong = 0
+
+    def seed(self, so_dong):
+        for i in range(self.so_dong, so_dong):
+            quoc_gia = QuocGia.objects.create(id_quoc_gia=f"{i:02d}", ten_quoc_gia=f"QG {i}", id_khu_vuc=self.khu_vuc)
+            dia_diem = DiaDiem.objects.create(thanh_pho=f"TP {i}", id_quoc_gia=quoc_gia)
+            cong_viec = CongViec.objects.create(ten_cong_viec=f"CV {i}")
+            phong_ban = PhongBan.objects.create(ten_phong_ban=f"PB {i}", id_dia_diem=dia_diem)
+            self.phong_ban = self.phong_ban or phong_ban
+            nhan_vien = tao_nhan_vien(cong_viec, self.phong_ban, id_quan_ly=self.nhan_vien)
+            self.nhan_vien = self.nhan_vien or nhan_vien
+            for quan_he in ('Con', 'Vo'):
+                NguoiPhuThuoc.objects.create(ho='Le', ten=str(i), quan_he=quan_he, id_nhan_vien=self.nhan_vien)
+            Attendance.objects.create(id_nhan_vien=nhan_vien, check_in=timezone.now())
+            PayrollRecord.objects.create(id_nhan_vien=nhan_vien, thang=date(2024, 3, 1))
+            PayrollJob.objects.create(thang=date(2024, 3, 1))
+        self.so_dong = so_dong
+
+    def list_urls(self):
+        urls = [f'/api/{prefix}/' for prefix, viewset, basename in router.registry]
+        urls += [
+            f'/api/departments/{self.phong_ban.pk}/employees/',
+            f'/api/employees/{self.nhan_vien.pk}/dependents/',
+            f'/api/payroll/by_department/?id_phong_ban={self.phong_ban.pk}&thang=2024-03',
+        ]
+        return urls
+
+    def count_queries(self):
+        # Đo truy vấn thật, không để response cache của dữ liệu danh mục che mất
+        cache.clear()
+        counts = {}
+        for url in self.list_urls():
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            counts[url] = len(ctx.captured_queries)
+        return counts
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        self.seed(2)
+        small = self.count_queries()
+        self.seed(10)
+        large = self.count_queries()
+        self.assertEqual(small, large)
+
+
+class ReferenceDataCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('hr'))
+        self.khu_vuc = KhuVuc.objects.create(ten_khu_vuc='Asia')
+        QuocGia.objects.create(id_quoc_gia='VN', ten_quoc_gia='Viet Nam', id_khu_vuc=self.khu_vuc)
+
+    def test_cached_response_etag_and_invalidation(self):
+        response = self.client.get('/api/countries/')
+        etag = response['ETag']
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get('/api/countries/').data, response.data)
+            self.assertEqual(self.client.get('/api/countries/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        # Đổi tên khu vực làm hết hạn cache của quốc gia (ten_khu_vuc), nhưng chỉ sau khi commit
+        with self.captureOnCommitCallbacks(execute=True):
+            self.khu_vuc.ten_khu_vuc = 'Chau A'
+            self.khu_vuc.save()
+            self.assertEqual(self.client.get('/api/countries/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        response = self.client.get('/api/countries/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['results'][0]['ten_khu_vuc'], 'Chau A')
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': tempfile.mkdtemp(prefix='hr-cache-'),
+}})
+class FileReferenceDataCacheTests(ReferenceDataCacheTests):
+    pass
+
+
+class PayrollExportTests(TestCase):
+    def test_export_excel_streams_workbook(self):
+        from io import BytesIO
+        from openpyxl import load_workbook
+
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('hr', password='x'))
+        cong_viec = CongViec.objects.create(ten_cong_viec='Dev')
+        phong_ban = PhongBan.objects.create(ten_phong_ban='IT')
+        nhan_vien = tao_nhan_vien(cong_viec, phong_ban, ho='Nguyen', ten='An')
+        PayrollRecord.objects.bulk_create([PayrollRecord(
+            id_nhan_vien=nhan_vien, thang=date(2024, 3, 1),
+            tong_ngay_lam=Decimal('20'), luong_thuc_nhan=Decimal('20000000')
+        )])
+
+        response = client.get('/api/payroll/export_excel/', {'thang': '2024-03'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+
+        ws = load_workbook(BytesIO(b''.join(response.streaming_content))).active
+        rows = list(ws.iter_rows(values_only=True))
+        self.assertEqual(rows[0][2], 'Họ và tên')
+        self.assertEqual(rows[1], (1, nhan_vien.pk, 'Nguyen An', 'IT', 20, 20000000))
+
+
+class InlineProcessPool:
+    """Thay ProcessPoolExecutor trong test: chạy ngay trong process hiện tại (cùng database test)"""
+
+    def __init__(self, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def submit(self, func, *args):
+        future = Future()
+        future.set_result(func(*args))
+        return future
+
+
+class AttendanceExportCommandTests(TestCase):
+    def setUp(self):
+        cong_viec = CongViec.objects.create(ten_cong_viec='Dev')
+        for ten in ('An', 'Binh'):
+            nhan_vien = tao_nhan_vien(cong_viec, ten=ten)
+            for day in (4, 5, 12, 20):
+                tao_cham_cong(nhan_vien, date(2024, 3, day))
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def export(self, name, **options):
+        output = f'{self.tmp.name}/{name}'
+        call_command('export_attendance', from_date='01/03/2024', to_date='31/03/2024', output=output,
+                     stdout=io.StringIO(), **options)
+        return output
+
+    def test_single_file_export_is_split_across_workers_and_merged(self):
+        single = self.export('mot.csv', format='csv', workers=1)
+        with patch('main.management.commands.export_attendance.ProcessPoolExecutor', InlineProcessPool):
+            merged = self.export('gop.csv', format='csv', workers=3)
+            self.export('gop.xlsx', workers=3)  # Excel vẫn ghi một lần
+        with open(single, 'rb') as a, open(merged, 'rb') as b:
+            self.assertEqual(a.read(), b.read())
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), ['gop.csv', 'gop.xlsx', 'mot.csv'])
+
+    def test_failure_exits_with_command_error(self):
+        with patch('main.management.commands.export_attendance.export_attendance_part', side_effect=OSError('Hết dung lượng')):
+            with self.assertRaisesMessage(CommandError, 'Hết dung lượng'):
+                self.export('loi.csv', format='csv', workers=1)
+
+
+class FlakyEmailBackend(LocmemEmailBackend):
+    """Backend gửi lần lượt như SMTP, lỗi ở lần gửi đầu tiên của mỗi email"""
+    failed = set()
+    calls = 0
+
+    def send_messages(self, messages):
+        FlakyEmailBackend.calls += 1
+        for message in messages:
+            message.message()
+            if message.to[0] not in self.failed:
+                self.failed.add(message.to[0])
+                raise ConnectionResetError('Mất kết nối SMTP')
+            super().send_messages([message])
+        return len(messages)
+
+
+class RejectingEmailBackend(LocmemEmailBackend):
+    """Backend từ chối vĩnh viễn (5xx) người nhận nv1, lỗi tạm thời (4xx) một lần với nv2"""
+    failed = set()
+
+    def send_messages(self, messages):
+        for message in messages:
+            message.message()
+            if message.to[0] == 'nv1@company.com':
+                raise smtplib.SMTPDataError(550, b'Mailbox unavailable')
+            if message.to[0] == 'nv2@company.com' and message.to[0] not in self.failed:
+                self.failed.add(message.to[0])
+                raise smtplib.SMTPDataError(451, b'Try again later')
+            super().send_messages([message])
+        return len(messages)
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    PAYROLL_EMAIL_BATCH_SIZE=2, PAYROLL_EMAIL_RATE_LIMIT=0, PAYROLL_EMAIL_RETRY_BACKOFF=0
+)
+class PayrollEmailTests(TestCase):
+    def setUp(self):
+        cong_viec = CongViec.objects.create(ten_cong_viec='Dev')
+        phong_ban = PhongBan.objects.create(ten_phong_ban='IT')
+        for i in range(5):
+            tao_nhan_vien(cong_viec, phong_ban, email=f'nv{i}@company.com' if i else None)
+        calculate_monthly_payroll(date(2024, 3, 1))
+        self.payrolls = PayrollRecord.objects.select_related('id_nhan_vien').order_by('id_nhan_vien')
+        cache.clear()
+
+    def test_dispatch_records_status_per_recipient(self):
+        deliveries = dispatch_payroll_emails(self.payrolls)
+
+        self.assertEqual(len(mail.outbox), 4)
+        self.assertEqual(PayrollEmail.objects.filter(trang_thai='sent').count(), 4)
+        failed = PayrollEmail.objects.get(trang_thai='failed')
+        self.assertEqual(failed.id_payroll, deliveries[0].id_payroll)
+        self.assertEqual(failed.loi, 'Nhân viên chưa có email')
+
+    def test_payslips_are_rendered_once_per_version(self):
+        payrolls = list(self.payrolls)
+        template, _ = get_payslip_template()
+        with patch.object(template, 'render', wraps=template.render) as render:
+            htmls = render_payslips(payrolls)
+            self.assertEqual(render.call_count, 5)
+            self.assertIn('Nguyen An', htmls[0])
+
+            self.assertEqual(render_payslips(payrolls), htmls)
+            self.assertEqual(render.call_count, 5)
+
+            payrolls[0].luong_thuc_nhan = Decimal('1500000')
+            self.assertIn('1,500,000 VND', render_payslips(payrolls)[0])
+            self.assertEqual(render.call_count, 6)
+
+    @override_settings(EMAIL_BACKEND='main.tests.FlakyEmailBackend')
+    def test_transient_errors_are_retried(self):
+        FlakyEmailBackend.failed.clear()
+        FlakyEmailBackend.calls = 0
+        with override_settings(PAYROLL_EMAIL_WORKERS=1, PAYROLL_EMAIL_BATCH_SIZE=4):
+            dispatch_payroll_emails(self.payrolls[1:])
+        # Cả lô gửi bằng một lần send_messages(), mỗi email lỗi thêm một lần gửi lại phần còn lại
+        self.assertEqual(FlakyEmailBackend.calls, 5)
+
+        self.assertEqual(len(mail.outbox), 4)
+        self.assertEqual(
+            list(PayrollEmail.objects.order_by().values_list('trang_thai', 'so_lan_thu').distinct()), [('sent', 2)]
+        )
+
+    @override_settings(EMAIL_BACKEND='main.tests.RejectingEmailBackend')
+    def test_permanent_errors_are_not_retried(self):
+        RejectingEmailBackend.failed.clear()
+        dispatch_payroll_emails(self.payrolls[1:])
+
+        self.assertEqual(len(mail.outbox), 3)
+        statuses = dict(PayrollEmail.objects.values_list('email_nhan', 'trang_thai'))
+        attempts = dict(PayrollEmail.objects.values_list('email_nhan', 'so_lan_thu'))
+        self.assertEqual((statuses['nv1@company.com'], attempts['nv1@company.com']), ('failed', 1))
+        self.assertEqual((statuses['nv2@company.com'], attempts['nv2@company.com']), ('sent', 2))
+
+    def test_rerun_of_job_skips_emails_already_sent(self):
+        job = enqueue_payroll_job(date(2024, 3, 1), loai='gui_email')
+        # Lần chạy trước của phần việc dừng giữa chừng sau khi đã gửi cho 3 bảng lương đầu
+        dispatch_payroll_emails(self.payrolls[:3], job=job)
+        self.assertEqual(len(mail.outbox), 2)
+
+        run_chunk(claim_next_chunk())
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), [f'nv{i}@company.com' for i in range(1, 5)])
+        self.assertEqual(PayrollEmail.objects.filter(id_job=job).count(), 5)
+        self.assertEqual(PayrollJob.objects.get(pk=job.pk).trang_thai, 'done')
+
+    def test_send_emails_queues_job(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('hr'))
+        # Địa chỉ nhận không lấy từ request
+        response = client.post('/api/payroll/send_emails/', {'thang': '2024-03', 'test_email': 'x@evil.com'}, format='json')
+        self.assertEqual(response.status_code, 202)
+
+        while (chunk := claim_next_chunk()) is not None:
+            run_chunk(chunk)
+
+        job = PayrollJob.objects.get(pk=response.data['job']['id'])
+        self.assertEqual((job.loai, job.trang_thai, job.so_nhan_vien_xong), ('gui_email', 'done', 5))
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), [f'nv{i}@company.com' for i in range(1, 5)])
+
+
+class SeedDataTests(TestCase):
+    def test_seed_builds_hierarchy_and_consistent_rollups(self):
+        call_command('seed_hr_data', so_nhan_vien=40, so_phong_ban=3, so_cap=3, so_nam=0.1, seed=1, stdout=io.StringIO())
+
+        self.assertEqual(NhanVien.objects.count(), 40)
+        self.assertEqual(PhongBan.objects.count(), 3)
+        self.assertEqual(NhanVien.objects.filter(id_quan_ly__isnull=True).count(), 1)
+        self.assertTrue(NhanVien.objects.filter(id_quan_ly__id_quan_ly__isnull=False).exists())
+        self.assertTrue(Attendance.objects.exists())
+
+        # Bảng tổng hợp khớp với dữ liệu chấm công đã sinh
+        self.assertEqual(
+            AttendanceMonthly.objects.aggregate(Sum('tong_gio_lam'))['tong_gio_lam__sum'],
+            Attendance.objects.aggregate(Sum('gio_lam'))['gio_lam__sum']
+        )
+        self.assertEqual(AttendanceMonthly.objects.aggregate(Sum('so_ngay'))['so_ngay__sum'], Attendance.objects.count())
+
+
+@override_settings(PROFILING_ENABLED=True)
+class RequestProfilingTests(TestCase):
+    def setUp(self):
+        cong_viec = CongViec.objects.create(ten_cong_viec='Dev')
+        for _ in range(3):
+            tao_nhan_vien(cong_viec, PhongBan.objects.create(ten_phong_ban='IT'))
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('hr', is_staff=True))
+
+    def test_server_timing_and_slow_request_dump(self):
+        with tempfile.TemporaryDirectory() as tmp, override_settings(PROFILING_SLOW_REQUEST_MS=0, PROFILING_DIR=tmp):
+            with self.assertLogs('main.profiling', 'WARNING') as logs:
+                response = self.client.get('/api/employees/')
+            self.assertEqual(response.status_code, 200)
+            timing = response['Server-Timing']
+            self.assertRegex(timing, r'db;dur=[\d.]+;desc="\d+ queries, 0 dup"')
+            self.assertIn('serializer;dur=', timing)
+            self.assertIn('GET /api/employees/ status=200', logs.output[0])
+            self.assertEqual(logs.records[0].profile['duplicates'], 0)
+
+            out = io.StringIO()
+            call_command('dump_slow_requests', '--json', '--path', '/api/employees/', stdout=out)
+            entries = json.loads(out.getvalue())
+            self.assertEqual(entries[0]['path'], '/api/employees/')
+            self.assertEqual(entries[0]['bytes'], len(response.content))
+
+    def test_server_timing_only_for_staff_and_streaming_is_logged_after_body(self):
+        self.client.force_authenticate(User.objects.create_user('nv'))
+        with self.assertLogs('main.profiling', 'DEBUG') as logs:
+            response = self.client.get('/api/payroll/preview/', {'thang': '2024-03-01'})
+            self.assertNotIn('Server-Timing', response)
+            self.assertEqual(logs.records, [])
+            body = b''.join(response.streaming_content)
+
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(logs.records[0].profile['bytes'], len(body))
+        self.assertGreater(logs.records[0].profile['queries'], 0)
+
+
+class MetricsTests(TestCase):
+    def scrape(self, **headers):
+        response = self.client.get('/metrics', **headers)
+        self.assertEqual(response.status_code, 200)
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if line and not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+        return samples
+
+    def test_punch_metrics_are_aggregated_across_processes(self):
+        key = 'hr_punches_total{loai="check_in",ket_qua="ok"}'
+        before = self.scrape().get(key, 0)
+
+        nhan_vien = tao_nhan_vien(CongViec.objects.create(ten_cong_viec='Dev'))
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('hr'))
+        self.assertEqual(client.post('/api/attendance/check_in/', {'id_nhan_vien': nhan_vien.pk}).status_code, 201)
+        self.assertEqual(client.post('/api/attendance/check_in/', {'id_nhan_vien': nhan_vien.pk}).status_code, 400)
+
+        samples = self.scrape()
+        self.assertEqual(samples[key], before + 1)
+        self.assertGreaterEqual(samples['hr_punches_total{loai="check_in",ket_qua="loi"}'], 1)
+        self.assertEqual(
+            samples['hr_punch_duration_seconds_bucket{loai="check_in",le="+Inf"}'],
+            samples['hr_punch_duration_seconds_count{loai="check_in"}']
+        )
+
+        # File số liệu của một worker khác trong thư mục chung được cộng vào
+        with tempfile.TemporaryDirectory() as tmp, override_settings(METRICS_DIR=tmp):
+            with open(f'{tmp}/metrics-999999.json', 'w') as f:
+                json.dump({'hr_punches_total': [[['check_in', 'ok'], 5]]}, f)
+            self.assertEqual(self.scrape()[key], before + 6)
+
+    @override_settings(METRICS_TOKEN='bi-mat')
+    def test_token_is_required_when_configured(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.scrape(HTTP_AUTHORIZATION='Bearer bi-mat')
+
+    def test_unreachable_database_is_skipped(self):
+        # pg_stat_activity không có trên SQLite: truy vấn lỗi như khi database Postgres mất kết nối
+        with patch.object(connection, 'vendor', 'postgresql'), self.assertLogs('main.metrics', 'WARNING'):
+            samples = self.scrape()
+        self.assertFalse([name for name in samples if name.startswith('hr_db_connections{')])
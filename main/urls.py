@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views, auth_views
+from . import views, auth_views, async_views
 
 router = DefaultRouter()
 router.register(r'regions', views.KhuVucViewSet)
@@ -12,6 +12,7 @@ router.register(r'employees', views.NhanVienViewSet)
 router.register(r'dependents', views.NguoiPhuThuocViewSet)
 router.register(r'attendance', views.AttendanceViewSet)
 router.register(r'payroll', views.PayrollRecordViewSet)
+router.register(r'payroll-jobs', views.PayrollJobViewSet)
 
 urlpatterns = [
     # Authentication URLs
@@ -21,6 +22,17 @@ urlpatterns = [
     path('auth/profile/', auth_views.profile_view, name='profile'),
     path('auth/change-password/', auth_views.change_password_view, name='change-password'),
     
+    # Bản async (ASGI) của các endpoint chủ yếu chờ I/O, cùng định dạng với bản DRF
+    path('async/attendance/check_in/', async_views.check_in, name='async-attendance-check-in'),
+    path('async/attendance/check_out/', async_views.check_out, name='async-attendance-check-out'),
+    path('async/attendance/summary/', async_views.attendance_summary, name='async-attendance-summary'),
+    path('async/payroll/by_department/', async_views.payroll_by_department, name='async-payroll-by-department'),
+    path('async/regions/', async_views.khu_vuc_list, name='async-khuvuc-list'),
+    path('async/countries/', async_views.quoc_gia_list, name='async-quocgia-list'),
+    path('async/locations/', async_views.dia_diem_list, name='async-diadiem-list'),
+    path('async/jobs/', async_views.cong_viec_list, name='async-congviec-list'),
+    path('async/departments/', async_views.phong_ban_list, name='async-phongban-list'),
+    
     # API URLs
     path('', include(router.urls)),
 ] 
\ No newline at end of file
@@ -0,0 +1,16 @@
+from datetime import date
+
+
+def month_range(thang):
+    """Trả về khoảng nửa mở [ngày đầu tháng, ngày đầu tháng sau) chứa ``thang``."""
+    start_date = date(thang.year, thang.month, 1)
+    if thang.month == 12:
+        end_date = date(thang.year + 1, 1, 1)
+    else:
+        end_date = date(thang.year, thang.month + 1, 1)
+    return start_date, end_date
+
+
+def format_vnd(so_tien):
+    """Định dạng số tiền VND có dấu phân cách hàng nghìn, VD: 1,500,000."""
+    return f"{so_tien:,.0f}"
@@ -1,65 +1,126 @@
 from django.shortcuts import render
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
 from django.utils import timezone
 from datetime import datetime, date
 from decimal import Decimal
+import hmac
+import json
 from .models import (
     KhuVuc, QuocGia, DiaDiem, CongViec, PhongBan, 
-    NhanVien, NguoiPhuThuoc, Attendance, PayrollRecord
+    NhanVien, NguoiPhuThuoc, Attendance, PayrollRecord, PayrollJob
 )
 from .serializers import (
     KhuVucSerializer, QuocGiaSerializer, DiaDiemSerializer,
     CongViecSerializer, PhongBanSerializer, NhanVienSerializer,
     NhanVienDetailSerializer, NguoiPhuThuocSerializer,
     AttendanceSerializer, AttendanceCreateSerializer, PayrollRecordSerializer,
-    PayrollCalculationSerializer
+    PayrollCalculationSerializer, PayrollJobSerializer
 )
+from .exports import EXPORT_CHUNK_SIZE, XLSX_CONTENT_TYPE, xlsx_tempfile
+from .filters import QueryParamFilterBackend
+from .mixins import ProfilingMixin, QueryPlan, QueryPlanMixin, ReplicaReadMixin, ResponseCacheMixin, SparseFieldsMixin
+from .profiling import profile_section
+from .pagination import KeysetPagination, SummaryPagination
+from .utils import month_range
+from .payroll_engine import preview_monthly_payroll, recalculate_dirty_payroll
+from .payroll_jobs import enqueue_payroll_job
+from .org_chart import reports_under
+from . import org_chart
+from . import metrics
+from . import punches
+from . import summaries
 
 
-class KhuVucViewSet(viewsets.ModelViewSet):
+class KhuVucViewSet(ProfilingMixin, ResponseCacheMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = KhuVuc.objects.all()
     serializer_class = KhuVucSerializer
     permission_classes = [IsAuthenticated]
 
 
-class QuocGiaViewSet(viewsets.ModelViewSet):
+class QuocGiaViewSet(ProfilingMixin, ResponseCacheMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = QuocGia.objects.all()
     serializer_class = QuocGiaSerializer
     permission_classes = [IsAuthenticated]
+    cache_models = (QuocGia, KhuVuc)
+    query_plans = {
+        '*': QueryPlan(select_related=('id_khu_vuc',)),
+    }
 
 
-class DiaDiemViewSet(viewsets.ModelViewSet):
+class DiaDiemViewSet(ProfilingMixin, ResponseCacheMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = DiaDiem.objects.all()
     serializer_class = DiaDiemSerializer
     permission_classes = [IsAuthenticated]
+    cache_models = (DiaDiem, QuocGia)
+    query_plans = {
+        '*': QueryPlan(select_related=('id_quoc_gia',)),
+    }
 
 
-class CongViecViewSet(viewsets.ModelViewSet):
+class CongViecViewSet(ProfilingMixin, ResponseCacheMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = CongViec.objects.all()
     serializer_class = CongViecSerializer
     permission_classes = [IsAuthenticated]
 
 
-class PhongBanViewSet(viewsets.ModelViewSet):
+class PhongBanViewSet(ProfilingMixin, ResponseCacheMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = PhongBan.objects.all()
     serializer_class = PhongBanSerializer
     permission_classes = [IsAuthenticated]
+    cache_models = (PhongBan, DiaDiem)
+    query_plans = {
+        '*': QueryPlan(select_related=('id_dia_diem',)),
+        'employees': QueryPlan(select_related=('id_cong_viec', 'id_phong_ban', 'id_quan_ly'), prefetch_related=('nguoiphuthuoc_set',), model=NhanVien),
+    }
 
     @action(detail=True, methods=['get'])
     def employees(self, request, pk=None):
         phong_ban = self.get_object()
-        nhan_viens = NhanVien.objects.filter(id_phong_ban=phong_ban)
+        nhan_viens = self.get_query_plan().apply(NhanVien.objects.filter(id_phong_ban=phong_ban))
         serializer = NhanVienSerializer(nhan_viens, many=True)
         return Response(serializer.data)
 
 
-class NhanVienViewSet(viewsets.ModelViewSet):
+class NhanVienViewSet(ProfilingMixin, ReplicaReadMixin, SparseFieldsMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = NhanVien.objects.all()
     permission_classes = [IsAuthenticated]
+    filter_backends = [QueryParamFilterBackend, OrderingFilter]
+    # VD: ?id_phong_ban=3&luong_tu=10000000&ngay_thue_tu=2024-01-01&ordering=-luong&fields=id_nhan_vien,ho,ten
+    filter_params = {
+        'id_phong_ban': ('id_phong_ban', int),
+        'id_cong_viec': ('id_cong_viec', int),
+        'id_quan_ly': ('id_quan_ly', int),
+        'ngay_thue_tu': ('ngay_thue__gte', date.fromisoformat),
+        'ngay_thue_den': ('ngay_thue__lte', date.fromisoformat),
+        'luong_tu': ('luong__gte', Decimal),
+        'luong_den': ('luong__lte', Decimal),
+        'quan_ly': ('id_nhan_vien__in', reports_under),  # Mọi cấp dưới của quản lý
+    }
+    ordering_fields = ('id_nhan_vien', 'ho', 'ten', 'ngay_thue', 'luong')
+    ordering = ('id_nhan_vien',)
+    sparse_field_sources = {
+        'ten_cong_viec': ('id_cong_viec__ten_cong_viec',),
+        'ten_phong_ban': ('id_phong_ban__ten_phong_ban',),
+        'ten_quan_ly': ('id_quan_ly__ho', 'id_quan_ly__ten'),
+    }
+    sparse_field_prefetch = {
+        'nguoi_phu_thuoc': 'nguoiphuthuoc_set',
+    }
+    query_plans = {
+        '*': QueryPlan(select_related=('id_cong_viec', 'id_phong_ban', 'id_quan_ly'), prefetch_related=('nguoiphuthuoc_set',)),
+        'dependents': QueryPlan(model=NguoiPhuThuoc),
+        'add_dependent': QueryPlan(),
+    }
 
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -69,10 +130,42 @@ class NhanVienViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def dependents(self, request, pk=None):
         nhan_vien = self.get_object()
-        nguoi_phu_thuoc = NguoiPhuThuoc.objects.filter(id_nhan_vien=nhan_vien)
+        nguoi_phu_thuoc = self.get_query_plan().apply(NguoiPhuThuoc.objects.filter(id_nhan_vien=nhan_vien))
         serializer = NguoiPhuThuocSerializer(nguoi_phu_thuoc, many=True)
         return Response(serializer.data)
 
+    @action(detail=True, methods=['get'])
+    def subtree(self, request, pk=None):
+        """Toàn bộ cấp dưới (mọi cấp) của nhân viên, cap = số cấp tính từ nhân viên"""
+        nhan_viens = org_chart.get_subtree(self._org_chart_pk(pk))
+        if not nhan_viens:
+            return Response({'error': 'Nhân viên không tồn tại'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({
+            'id_nhan_vien': nhan_viens[0]['id_nhan_vien'],
+            'so_cap_duoi': len(nhan_viens) - 1,
+            'nhan_viens': nhan_viens[1:]
+        })
+    
+    @action(detail=True, methods=['get'])
+    def ancestors(self, request, pk=None):
+        """Chuỗi quản lý của nhân viên, từ quản lý trực tiếp lên cấp cao nhất"""
+        chuoi = org_chart.get_ancestors(self._org_chart_pk(pk))
+        if not chuoi:
+            return Response({'error': 'Nhân viên không tồn tại'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(chuoi[1:])
+    
+    @action(detail=False, methods=['get'])
+    def headcount(self, request):
+        """Số cấp dưới trực tiếp và tổng số cấp dưới của từng quản lý"""
+        return Response(org_chart.get_headcounts())
+    
+    @staticmethod
+    def _org_chart_pk(pk):
+        try:
+            return int(pk)
+        except ValueError:
+            raise NotFound('Nhân viên không tồn tại')
+
     @action(detail=True, methods=['post'])
     def add_dependent(self, request, pk=None):
         nhan_vien = self.get_object()
@@ -83,139 +176,125 @@ class NhanVienViewSet(viewsets.ModelViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class NguoiPhuThuocViewSet(viewsets.ModelViewSet):
+class NguoiPhuThuocViewSet(ProfilingMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = NguoiPhuThuoc.objects.all()
     serializer_class = NguoiPhuThuocSerializer
     permission_classes = [IsAuthenticated]
 
 
-class AttendanceViewSet(viewsets.ModelViewSet):
+class AttendanceViewSet(ProfilingMixin, ReplicaReadMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = Attendance.objects.all()
     serializer_class = AttendanceSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-ngay_lam', '-id')
+    reporting_actions = ('summary',)
+    filter_backends = [QueryParamFilterBackend]
+    filter_params = {
+        'quan_ly': ('id_nhan_vien__in', reports_under),  # Nhân viên dưới quyền quản lý (mọi cấp)
+    }
+    query_plans = {
+        '*': QueryPlan(select_related=('id_nhan_vien',)),
+    }
     
     def get_serializer_class(self):
         if self.action == 'create':
             return AttendanceCreateSerializer
         return AttendanceSerializer
     
+    def get_punch_employee(self, request):
+        """Đọc id_nhan_vien của request chấm công, trả về (id, response lỗi)"""
+        id_nhan_vien = request.data.get('id_nhan_vien')
+        if not id_nhan_vien:
+            return None, Response({'error': 'ID nhân viên là bắt buộc'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            return int(id_nhan_vien), None
+        except (TypeError, ValueError):
+            return None, Response({'error': 'ID nhân viên không hợp lệ'}, status=status.HTTP_400_BAD_REQUEST)
+    
     @action(detail=False, methods=['post'])
     def check_in(self, request):
         """Nhân viên check-in"""
-        id_nhan_vien = request.data.get('id_nhan_vien')
-        if not id_nhan_vien:
-            return Response({'error': 'ID nhân viên là bắt buộc'}, status=status.HTTP_400_BAD_REQUEST)
+        id_nhan_vien, error = self.get_punch_employee(request)
+        if error:
+            return error
         
-        # Kiểm tra nhân viên có tồn tại không
+        # Một lệnh INSERT, không đọc trước nhân viên/chấm công
         try:
-            nhan_vien = NhanVien.objects.get(id_nhan_vien=id_nhan_vien)
-        except NhanVien.DoesNotExist:
-            return Response({'error': 'Nhân viên không tồn tại'}, status=status.HTTP_404_NOT_FOUND)
-        
-        # Kiểm tra đã check-in hôm nay chưa
-        today = date.today()
-        attendance, created = Attendance.objects.get_or_create(
-            id_nhan_vien=nhan_vien,
-            ngay_lam=today,
-            defaults={'check_in': timezone.now()}
-        )
-        
-        if not created and attendance.check_in:
-            return Response({'error': 'Đã check-in hôm nay rồi'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        if not attendance.check_in:
-            attendance.check_in = timezone.now()
-            attendance.save()
-        
-        serializer = AttendanceSerializer(attendance)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+            with metrics.PUNCH_DURATION.time(loai='check_in'):
+                data = punches.check_in(id_nhan_vien, timezone.now())
+        except punches.PunchError as e:
+            metrics.PUNCHES.inc(loai='check_in', ket_qua='loi')
+            return Response({'error': str(e)}, status=e.status_code)
+        
+        metrics.PUNCHES.inc(loai='check_in', ket_qua='ok')
+        return Response(data, status=status.HTTP_201_CREATED)
     
     @action(detail=False, methods=['post'])
     def check_out(self, request):
         """Nhân viên check-out"""
-        id_nhan_vien = request.data.get('id_nhan_vien')
-        if not id_nhan_vien:
-            return Response({'error': 'ID nhân viên là bắt buộc'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Kiểm tra nhân viên có tồn tại không
-        try:
-            nhan_vien = NhanVien.objects.get(id_nhan_vien=id_nhan_vien)
-        except NhanVien.DoesNotExist:
-            return Response({'error': 'Nhân viên không tồn tại'}, status=status.HTTP_404_NOT_FOUND)
+        id_nhan_vien, error = self.get_punch_employee(request)
+        if error:
+            return error
         
-        # Kiểm tra đã check-in hôm nay chưa
-        today = date.today()
+        # Một lệnh UPDATE, gio_lam và ngay_cong được tính trong SQL (xem punches.check_out)
         try:
-            attendance = Attendance.objects.get(id_nhan_vien=nhan_vien, ngay_lam=today)
-        except Attendance.DoesNotExist:
-            return Response({'error': 'Chưa check-in hôm nay'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        if not attendance.check_in:
-            return Response({'error': 'Chưa check-in hôm nay'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        if attendance.check_out:
-            return Response({'error': 'Đã check-out hôm nay rồi'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        attendance.check_out = timezone.now()
-        attendance.save()  # Sẽ tự động tính gio_lam và ngay_cong
-        
-        serializer = AttendanceSerializer(attendance)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+            with metrics.PUNCH_DURATION.time(loai='check_out'):
+                data = punches.check_out(id_nhan_vien, timezone.now())
+        except punches.PunchError as e:
+            metrics.PUNCHES.inc(loai='check_out', ket_qua='loi')
+            return Response({'error': str(e)}, status=e.status_code)
+        
+        metrics.PUNCHES.inc(loai='check_out', ket_qua='ok')
+        return Response(data, status=status.HTTP_200_OK)
+    
+    @action(detail=False, methods=['post'])
+    def bulk_punch(self, request):
+        """Nhận một lô lượt chấm công từ máy chấm công (id_nhan_vien, thoi_gian, loai)"""
+        events = request.data.get('events') if isinstance(request.data, dict) else request.data
+        if not isinstance(events, list) or not events:
+            return Response({'error': 'events phải là danh sách lượt chấm công'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(events) > settings.BULK_PUNCH_MAX_EVENTS:
+            return Response({'error': f'Tối đa {settings.BULK_PUNCH_MAX_EVENTS} lượt mỗi lần gửi'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        result = punches.ingest_punches(events)
+        metrics.PUNCHES.inc(len(events) - len(result['rejected']), loai='bulk', ket_qua='ok')
+        metrics.PUNCHES.inc(len(result['rejected']), loai='bulk', ket_qua='loi')
+        return Response(result, status=status.HTTP_200_OK)
     
     @action(detail=False, methods=['get'])
     def summary(self, request):
         """Xem tổng hợp chấm công theo tháng"""
-        id_nhan_vien = request.query_params.get('id_nhan_vien')
-        thang = request.query_params.get('thang')  # Format: YYYY-MM
-        
-        if not thang:
-            thang = timezone.now().strftime('%Y-%m')
-        
         try:
-            year, month = map(int, thang.split('-'))
-            start_date = date(year, month, 1)
-            if month == 12:
-                end_date = date(year + 1, 1, 1)
-            else:
-                end_date = date(year, month + 1, 1)
-        except ValueError:
-            return Response({'error': 'Định dạng tháng không đúng (YYYY-MM)'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        queryset = Attendance.objects.filter(ngay_lam__gte=start_date, ngay_lam__lt=end_date)
-        
-        if id_nhan_vien:
-            queryset = queryset.filter(id_nhan_vien_id=id_nhan_vien)
-        
-        # Tính tổng hợp
-        summary_data = {}
-        for attendance in queryset:
-            nhan_vien_id = attendance.id_nhan_vien.id_nhan_vien
-            if nhan_vien_id not in summary_data:
-                summary_data[nhan_vien_id] = {
-                    'id_nhan_vien': nhan_vien_id,
-                    'ho_ten': f"{attendance.id_nhan_vien.ho} {attendance.id_nhan_vien.ten}",
-                    'tong_ngay_lam': 0,
-                    'tong_gio_lam': 0,
-                    'so_ngay_cham_cong': 0
-                }
-            
-            if attendance.ngay_cong:
-                summary_data[nhan_vien_id]['tong_ngay_lam'] += float(attendance.ngay_cong)
-            if attendance.gio_lam:
-                summary_data[nhan_vien_id]['tong_gio_lam'] += float(attendance.gio_lam)
-            summary_data[nhan_vien_id]['so_ngay_cham_cong'] += 1
-        
-        return Response(list(summary_data.values()), status=status.HTTP_200_OK)
+            queryset, renames = summaries.attendance_summary(request.query_params)
+        except summaries.SummaryError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        paginator = SummaryPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        with profile_section('serializer'):
+            summary_data = [summaries.format_summary_row(row, renames) for row in page]
+        return paginator.get_paginated_response(summary_data)
 
 
-class PayrollRecordViewSet(viewsets.ModelViewSet):
+class PayrollRecordViewSet(ProfilingMixin, ReplicaReadMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = PayrollRecord.objects.all()
     serializer_class = PayrollRecordSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-thang', '-id')
+    reporting_actions = ('by_department', 'export_excel')
+    filter_backends = [QueryParamFilterBackend]
+    filter_params = {
+        'quan_ly': ('id_nhan_vien__in', reports_under),  # Nhân viên dưới quyền quản lý (mọi cấp)
+    }
+    query_plans = {
+        '*': QueryPlan(select_related=('id_nhan_vien',)),
+    }
     
     @action(detail=False, methods=['post'])
     def calculate_payroll(self, request):
-        """Tính lương theo tháng"""
+        """Tạo tác vụ tính lương theo tháng (xử lý bởi run_payroll_worker)"""
         serializer = PayrollCalculationSerializer(data=request.data)
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -223,77 +302,66 @@ class PayrollRecordViewSet(viewsets.ModelViewSet):
         thang = serializer.validated_data['thang']
         id_nhan_vien = serializer.validated_data.get('id_nhan_vien')
         
-        # Xác định tháng cần tính
-        start_date = date(thang.year, thang.month, 1)
-        if thang.month == 12:
-            end_date = date(thang.year + 1, 1, 1)
-        else:
-            end_date = date(thang.year, thang.month + 1, 1)
+        # Đưa vào hàng đợi, worker sẽ tính lương theo từng phòng ban
+        job = enqueue_payroll_job(thang, id_nhan_vien)
+        
+        return Response({
+            'message': f'Đã tạo tác vụ tính lương tháng {thang.strftime("%m/%Y")}',
+            'job': PayrollJobSerializer(job).data
+        }, status=status.HTTP_202_ACCEPTED)
+    
+    @action(detail=False, methods=['get'])
+    def preview(self, request):
+        """
+        Tính thử lương tháng, không ghi vào database (?thang=2024-01-01&id_nhan_vien=&chi_thay_doi=true).
+        
+        Mỗi dòng có kết quả mới và giá trị đang lưu; trả về dạng stream JSON.
+        """
+        serializer = PayrollCalculationSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
-        # Lấy danh sách nhân viên cần tính
-        if id_nhan_vien:
-            nhan_viens = NhanVien.objects.filter(id_nhan_vien=id_nhan_vien)
-        else:
-            nhan_viens = NhanVien.objects.all()
+        nhan_viens = NhanVien.objects.all()
+        if serializer.validated_data.get('id_nhan_vien'):
+            nhan_viens = nhan_viens.filter(id_nhan_vien=serializer.validated_data['id_nhan_vien'])
+        chi_thay_doi = request.query_params.get('chi_thay_doi', '').lower() in ('1', 'true')
         
-        results = []
-        for nhan_vien in nhan_viens:
-            # Tính tổng ngày làm trong tháng
-            attendances = Attendance.objects.filter(
-                id_nhan_vien=nhan_vien,
-                ngay_lam__gte=start_date,
-                ngay_lam__lt=end_date
-            )
-            
-            tong_ngay_lam = sum(float(att.ngay_cong) for att in attendances if att.ngay_cong)
-            
-            # Tạo hoặc cập nhật bảng lương
-            payroll_record, created = PayrollRecord.objects.get_or_create(
-                id_nhan_vien=nhan_vien,
-                thang=start_date,
-                defaults={'tong_ngay_lam': tong_ngay_lam}
-            )
-            
-            if not created:
-                payroll_record.tong_ngay_lam = tong_ngay_lam
-                payroll_record.save()
-            
-            results.append({
-                'id_nhan_vien': nhan_vien.id_nhan_vien,
-                'ho_ten': f"{nhan_vien.ho} {nhan_vien.ten}",
-                'luong_co_ban': float(nhan_vien.luong),
-                'tong_ngay_lam': float(tong_ngay_lam),
-                'luong_thuc_nhan': float(payroll_record.luong_thuc_nhan),
-                'created': created
-            })
+        rows = preview_monthly_payroll(serializer.validated_data['thang'], nhan_viens)
+        if chi_thay_doi:
+            rows = (row for row in rows if row['trang_thai'] != 'khong_doi')
+        
+        def stream():
+            yield '['
+            for i, row in enumerate(rows):
+                yield (',' if i else '') + json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False)
+            yield ']'
         
+        return StreamingHttpResponse(stream(), content_type='application/json')
+    
+    @action(detail=False, methods=['post'])
+    def recalculate_dirty(self, request):
+        """Tính lại lương cho các nhân viên có chấm công bị sửa sau lần tính lương gần nhất"""
+        try:
+            limit = int(request.data.get('limit') or 0)
+        except (TypeError, ValueError):
+            return Response({'error': 'limit phải là số nguyên'}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 0:
+            return Response({'error': 'limit không được âm'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        results = recalculate_dirty_payroll(limit or None)
         return Response({
-            'message': f'Đã tính lương tháng {thang.strftime("%m/%Y")}',
+            'message': f'Đã tính lại lương cho {len(results)} nhân viên',
+            'so_thay_doi': sum(1 for r in results if r['changed']),
             'results': results
-        }, status=status.HTTP_200_OK)
+        })
     
     @action(detail=False, methods=['get'])
     def by_department(self, request):
         """Xem lương theo phòng ban"""
-        id_phong_ban = request.query_params.get('id_phong_ban')
-        thang = request.query_params.get('thang')  # Format: YYYY-MM
-        
-        if not id_phong_ban:
-            return Response({'error': 'ID phòng ban là bắt buộc'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        if not thang:
-            thang = timezone.now().strftime('%Y-%m')
-        
         try:
-            year, month = map(int, thang.split('-'))
-            start_date = date(year, month, 1)
-        except ValueError:
-            return Response({'error': 'Định dạng tháng không đúng (YYYY-MM)'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        queryset = PayrollRecord.objects.filter(
-            id_nhan_vien__id_phong_ban_id=id_phong_ban,
-            thang=start_date
-        )
+            queryset = summaries.payroll_by_department(request.query_params, self.get_queryset())
+        except summaries.SummaryError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
         serializer = PayrollRecordSerializer(queryset, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
@@ -301,11 +369,6 @@ class PayrollRecordViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def export_excel(self, request):
         """Xuất báo cáo bảng lương ra file Excel"""
-        from django.http import HttpResponse
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, Alignment, PatternFill
-        from datetime import datetime
-        
         # Lấy tháng từ query params, mặc định là tháng hiện tại
         thang = request.query_params.get('thang')
         if not thang:
@@ -313,76 +376,47 @@ class PayrollRecordViewSet(viewsets.ModelViewSet):
         
         try:
             year, month = map(int, thang.split('-'))
-            start_date = date(year, month, 1)
+            start_date, end_date = month_range(date(year, month, 1))
         except ValueError:
             return Response({'error': 'Định dạng tháng không đúng (YYYY-MM)'}, 
                           status=status.HTTP_400_BAD_REQUEST)
         
-        # Lấy dữ liệu bảng lương
-        payrolls = PayrollRecord.objects.filter(thang=start_date)
-        
-        # Tạo workbook và worksheet
-        wb = Workbook()
-        ws = wb.active
-        ws.title = f"Bang luong thang {month}-{year}"
-        
-        # Định dạng header
-        headers = ['STT', 'ID NV', 'Họ và tên', 'Phòng ban', 'Số ngày làm', 'Lương thực nhận']
-        header_fill = PatternFill(start_color='CCCCCC', end_color='CCCCCC', fill_type='solid')
-        
-        # Ghi header
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.font = Font(bold=True)
-            cell.fill = header_fill
-            cell.alignment = Alignment(horizontal='center')
-        
-        # Ghi dữ liệu
-        for idx, payroll in enumerate(payrolls, 1):
-            nv = payroll.id_nhan_vien
-            row = [
-                idx,
-                nv.id_nhan_vien,
-                f"{nv.ho} {nv.ten}",
-                nv.id_phong_ban.ten_phong_ban if nv.id_phong_ban else '',
-                float(payroll.tong_ngay_lam),
-                float(payroll.luong_thuc_nhan)
-            ]
-            
-            for col, value in enumerate(row, 1):
-                cell = ws.cell(row=idx+1, column=col, value=value)
-                cell.alignment = Alignment(horizontal='center')
-                
-                # Format số tiền
-                if col == 6:  # Cột lương thực nhận
-                    cell.number_format = '#,##0'
-        
-        # Điều chỉnh độ rộng cột
-        for col in ws.columns:
-            max_length = 0
-            for cell in col:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            ws.column_dimensions[col[0].column_letter].width = max_length + 2
-        
-        # Tạo response với file Excel
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        # Đọc bảng lương bằng một truy vấn JOIN, lấy dần từng khối dòng
+        payrolls = self.get_queryset().filter(
+            thang__gte=start_date, thang__lt=end_date
+        ).order_by('thang', 'id_nhan_vien').values_list(
+            'id_nhan_vien', 'id_nhan_vien__ho', 'id_nhan_vien__ten',
+            'id_nhan_vien__id_phong_ban__ten_phong_ban', 'tong_ngay_lam', 'luong_thuc_nhan'
+        ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        
+        rows = (
+            (idx, id_nv, f"{ho} {ten}", ten_phong_ban or '', float(tong_ngay_lam), float(luong_thuc_nhan))
+            for idx, (id_nv, ho, ten, ten_phong_ban, tong_ngay_lam, luong_thuc_nhan) in enumerate(payrolls, 1)
         )
-        response['Content-Disposition'] = f'attachment; filename=bang_luong_{month}_{year}.xlsx'
         
-        wb.save(response)
-        return response
+        # Độ rộng dữ liệu tối đa suy ra từ định nghĩa các cột trong model
+        ho_field, ten_field = NhanVien._meta.get_field('ho'), NhanVien._meta.get_field('ten')
+        columns = [
+            ('STT', 7),
+            ('ID NV', 10),
+            ('Họ và tên', ho_field.max_length + ten_field.max_length + 1),
+            ('Phòng ban', PhongBan._meta.get_field('ten_phong_ban').max_length),
+            ('Số ngày làm', 7),
+            ('Lương thực nhận', 15),
+        ]
+        
+        with profile_section('xlsx'):
+            xlsx = xlsx_tempfile(f"Bang luong thang {month}-{year}", columns, rows, number_formats={5: '#,##0'})
+        return FileResponse(
+            xlsx,
+            as_attachment=True,
+            filename=f'bang_luong_{month}_{year}.xlsx',
+            content_type=XLSX_CONTENT_TYPE
+        )
     
     @action(detail=False, methods=['post'])
     def send_emails(self, request):
-        """Gửi email bảng lương cho nhân viên"""
-        from django.core.mail import EmailMessage
-        from django.template.loader import render_to_string
-        
+        """Tạo tác vụ gửi email bảng lương cho nhân viên"""
         # Lấy tháng từ request data
         thang = request.data.get('thang')
         if not thang:
@@ -395,48 +429,43 @@ class PayrollRecordViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Định dạng tháng không đúng (YYYY-MM)'}, 
                           status=status.HTTP_400_BAD_REQUEST)
         
-        # Lấy dữ liệu bảng lương
-        payrolls = PayrollRecord.objects.filter(thang=start_date)
-        
-        # Lưu nội dung email để trả về
-        email_contents = []
+        # Demo: gửi tất cả về 1 email cấu hình sẵn, chỉ khi DEBUG (không nhận địa chỉ từ request)
+        email_nhan = settings.PAYROLL_EMAIL_DEMO_RECIPIENT if settings.DEBUG else None
         
-        for payroll in payrolls:
-            nv = payroll.id_nhan_vien
-            
-            # Chuẩn bị context cho template
-            context = {
-                'ho_ten': f"{nv.ho} {nv.ten}",
-                'thang': f"{month:02d}/{year}",
-                'tong_ngay_lam': float(payroll.tong_ngay_lam),
-                'luong_thuc_nhan': "{:,.0f}".format(float(payroll.luong_thuc_nhan))
-            }
-            
-            # Render template HTML
-            html_content = render_to_string('email/payroll.html', context)
-            
-            # Tạo email
-            subject = f'Bảng lương tháng {month:02d}-{year}'
-            email = EmailMessage(
-                subject=subject,
-                body=html_content,
-                from_email='hr@company.com',
-                to=['hokhanhduong9204@gmail.com'],  # Demo: gửi tất cả về 1 email
-            )
-            email.content_subtype = 'html'
-            
-            # Gửi email
-            email.send()
-            
-            # Lưu nội dung để trả về
-            email_contents.append({
-                'to': 'hokhanhduong9204@gmail.com',
-                'subject': subject,
-                'employee': context['ho_ten'],
-                'content': html_content
-            })
+        # Email được worker gửi song song theo từng phòng ban, trạng thái lưu ở PayrollEmail
+        job = enqueue_payroll_job(start_date, loai='gui_email', email_nhan=email_nhan or None)
             
         return Response({
-            'message': f'Đã gửi {len(email_contents)} email bảng lương tháng {month:02d}/{year}',
-            'emails': email_contents
+            'message': f'Đã tạo tác vụ gửi email bảng lương tháng {month:02d}/{year}',
+            'job': PayrollJobSerializer(job).data
+        }, status=status.HTTP_202_ACCEPTED)
+
+
+class PayrollJobViewSet(ProfilingMixin, QueryPlanMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = PayrollJob.objects.all()
+    serializer_class = PayrollJobSerializer
+    permission_classes = [IsAuthenticated]
+
+    @action(detail=True, methods=['get'])
+    def progress(self, request, pk=None):
+        """Xem tiến độ tác vụ tính lương"""
+        job = self.get_object()
+        phan_tram = 100.0
+        if job.tong_so_nhan_vien:
+            phan_tram = round(job.so_nhan_vien_xong * 100 / job.tong_so_nhan_vien, 2)
+        return Response({
+            'id': job.id,
+            'trang_thai': job.trang_thai,
+            'so_nhan_vien_xong': job.so_nhan_vien_xong,
+            'tong_so_nhan_vien': job.tong_so_nhan_vien,
+            'phan_tram': phan_tram
         }, status=status.HTTP_200_OK)
+
+
+@require_GET
+def metrics_view(request):
+    """Số liệu vận hành cho Prometheus; đặt METRICS_TOKEN thì phải gửi kèm Authorization: Bearer <token>"""
+    token = settings.METRICS_TOKEN
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=401)
+    return HttpResponse(metrics.render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')